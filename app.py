@@ -5,13 +5,25 @@
 """
 
 import os
+import tempfile
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, get_flashed_messages
+from flask import (Flask, render_template, request, jsonify, redirect, url_for, flash, get_flashed_messages,
+                   Response, stream_with_context, send_file)
 from db_manager import DBManager
 from config import Config
-from email_service import send_birthday_email
+from email_service import get_retry_queue
+from transports import get_transport
 from auth import AuthManager, login_required, admin_required, ensure_default_admin
 from rate_limiter import get_rate_limiter
+from sender_pool import get_sender_pool
+from birthday_calendar import get_birthday_calendar, parse_dob, age_on, days_until_birthday
+from user_snapshot import get_user_snapshot
+from cache import cached, get_query_cache
+from http_cache import conditional_json, get_response_cache
+from export_data import stream_export, export_filename
+from user_import import start_import_job, get_import_job
+from job_queue import submit_job, get_job
+from log_archive import list_archives, read_archive, archive_path
 from email_template import EmailTemplate, init_default_templates
 from config_validator import check_config_on_startup
 from logger import init_logger, log_request_middleware
@@ -33,6 +45,13 @@ log_request_middleware(app)
 # 确保存在默认管理员账户
 ensure_default_admin()
 
+# 补齐新增的表结构
+try:
+    with DBManager() as _db:
+        _db.ensure_schema()
+except Exception as e:
+    print(f"⚠️ 表结构检查警告: {e}")
+
 # 初始化默认邮件模板
 try:
     init_default_templates()
@@ -112,29 +131,41 @@ def format_date(date_str):
 
 def calculate_age(dob):
     """计算年龄"""
-    today = datetime.now()
-    dob = parse_date(dob) if isinstance(dob, str) else dob
-    age = today.year - dob.year
-    if today.month < dob.month or (today.month == dob.month and today.day < dob.day):
-        age -= 1
-    return age
+    return age_on(parse_date(dob) if isinstance(dob, str) else dob)
 
 
 def calculate_next_birthday(dob):
-    """计算距离下一个生日的天数（按日历日计算）"""
-    today = datetime.now().date()  # 只取日期，忽略时分秒
-    dob = parse_date(dob) if isinstance(dob, str) else dob
-    if isinstance(dob, datetime):
-        dob = dob.date()
+    """计算距离下一个生日的天数（按日历日计算，2月29日在非闰年按2月28日）"""
+    return days_until_birthday(parse_date(dob) if isinstance(dob, str) else dob)
+
+
+def get_upcoming_users(db, limit=10, within_days=30):
+    """
+    即将过生日的用户（按下一个生日先后）
+
+    优先使用内存生日索引；用户数超过索引上限时退回数据库索引查询。
+    结果按日期缓存，用户变更后失效
+    """
+    key = ('upcoming', datetime.now().date(), limit, within_days)
+    return cached(db, key, ('users',), lambda: _compute_upcoming_users(db, limit, within_days))
 
-    # 今年的生日
-    next_birthday = dob.replace(year=today.year)
-    if next_birthday < today:
-        # 已经过了，用明年
-        next_birthday = dob.replace(year=today.year + 1)
 
-    days_left = (next_birthday - today).days
-    return days_left
+def _compute_upcoming_users(db, limit, within_days):
+    calendar = get_birthday_calendar(db)
+    if not calendar.enabled:
+        return db.get_upcoming_birthdays(limit=limit, within_days=within_days)
+
+    entries = calendar.upcoming(limit=limit, within_days=within_days)
+    users = db.get_users_by_ids([user_id for user_id, _, _ in entries])
+    by_id = {user['id']: user for user in users}
+    result = []
+    for user_id, when, days in entries:
+        user = by_id.get(user_id)
+        if user:
+            user['next_birthday'] = when
+            user['days_until_birthday'] = days
+            result.append(user)
+    return result
 
 
 # ========== 路由 ==========
@@ -225,46 +256,30 @@ def index():
         stats = db.get_user_stats()
 
         # 获取即将过生日的用户（未来30天内）
-        users = db.get_all_users()
-        upcoming_birthdays = []
-        today = datetime.now().date()  # 只取日期，忽略时分秒
-
-        for user in users:
-            try:
-                dob = parse_date(user['dob']) if isinstance(user['dob'], str) else user['dob']
-                if isinstance(dob, datetime):
-                    dob = dob.date()
-
-                # 今年的生日
-                next_birthday = dob.replace(year=today.year)
-                if next_birthday < today:
-                    next_birthday = dob.replace(year=today.year + 1)
-
-                days_left = (next_birthday - today).days
-                if days_left <= 30:
-                    user['days_until_birthday'] = days_left
-                    user['age'] = calculate_age(user['dob'])
-                    user['next_birthday_date'] = next_birthday.strftime('%m-%d')
-                    user['dob_short'] = f"{dob.month:02d}-{dob.day:02d}"
-                    upcoming_birthdays.append(user)
-            except Exception:
-                # 跳过日期解析失败的记录
-                continue
-
-        # 按天数排序
-        upcoming_birthdays.sort(key=lambda x: x['days_until_birthday'])
+        upcoming_birthdays = get_upcoming_users(db, limit=10, within_days=30)
+        for user in upcoming_birthdays:
+            dob = parse_dob(user['dob'])
+            user['age'] = age_on(dob)
+            user['next_birthday_date'] = user['next_birthday'].strftime('%m-%d')
+            user['dob_short'] = f"{dob.month:02d}-{dob.day:02d}"
 
         # 获取最近的发送日志
         recent_logs = db.get_send_logs(limit=10)
 
+        # 近 30 天每日发送量（汇总表）
+        send_stats = db.get_send_stats_daily(datetime.now().date() - timedelta(days=29))
+        send_stats_max = max([day['success'] + day['failed'] for day in send_stats] or [0])
+
         # 祝福语统计
         wishes = db.get_all_wishes()
         active_wishes = [w for w in wishes if w.get('is_active', 1)]
 
         return render_template('index.html',
                              stats=stats,
-                             upcoming_birthdays=upcoming_birthdays[:10],
+                             upcoming_birthdays=upcoming_birthdays,
                              recent_logs=recent_logs,
+                             send_stats=send_stats,
+                             send_stats_max=send_stats_max,
                              wish_count=len(wishes),
                              active_wish_count=len(active_wishes))
     finally:
@@ -279,48 +294,58 @@ def users_list():
     """用户列表"""
     db = get_db()
     try:
-        users = db.get_all_users()
-
-        # 为每个用户计算额外信息
-        for user in users:
-            user['age'] = calculate_age(user['dob'])
-            user['days_until_birthday'] = calculate_next_birthday(user['dob'])
-            user['dob_formatted'] = format_date(user['dob'])
-            # 添加短日期格式 (月-日)
-            try:
-                dt = parse_date(user['dob'])
-                user['dob_short'] = f"{dt.month:02d}-{dt.day:02d}"
-            except:
-                user['dob_short'] = user['dob']
-
         # 获取搜索和筛选参数
         search = request.args.get('search', '')
         sort_by = request.args.get('sort', 'name')
 
-        # 搜索过滤
+        after = request.args.get('after', 0, type=int)
+
+        # 搜索走数据库全文索引（按 ID 分页），年龄、剩余天数和排序由列式快照向量化计算
+        ids = None
+        next_after = None
         if search:
-            users = [u for u in users if search.lower() in u['name'].lower() or search.lower() in u['email'].lower()]
-
-        # 排序
-        if sort_by == 'name':
-            users.sort(key=lambda x: x['name'])
-        elif sort_by == 'birthday':
-            # 按月日排序
-            def get_month_day(user):
-                try:
-                    dt = parse_date(user['dob'])
-                    return (dt.month, dt.day)
-                except:
-                    return (12, 31)  # 无法解析的排到最后
-            users.sort(key=lambda x: (get_month_day(x), x['name']))
-        elif sort_by == 'days':
-            users.sort(key=lambda x: x['days_until_birthday'])
+            matches = db.search_users(search, limit=Config.SEARCH_PAGE_SIZE, after=after)
+            ids = [row['id'] for row in matches]
+            if len(matches) == Config.SEARCH_PAGE_SIZE:
+                next_after = ids[-1]
 
-        return render_template('users.html', users=users, search=search, sort_by=sort_by)
+        snapshot = get_user_snapshot(db)
+        indices, computed = snapshot.select(sort_by=sort_by, ids=ids)
+        users = snapshot.rows(indices, computed)
+
+        return render_template('users.html', users=users, search=search, sort_by=sort_by,
+                               after=after, next_after=next_after)
     finally:
         db.close()
 
 
+def _export_response(kind, redirect_endpoint):
+    """按查询参数（format / gzip / from / to / status）流式返回导出文件"""
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') in ('1', 'true', 'on')
+    try:
+        start = parse_date(request.args['from']).date() if request.args.get('from') else None
+        end = parse_date(request.args['to']).date() if request.args.get('to') else None
+        chunks = stream_export(kind, fmt, compress, start, end, request.args.get('status') or None)
+    except ValueError as e:
+        flash(f'导出失败: {e}', 'error')
+        return redirect(url_for(redirect_endpoint))
+
+    mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    filename = export_filename(kind, fmt, compress)
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@app.route('/users/export')
+@login_required
+def users_export():
+    """流式导出用户（CSV / JSON Lines，可选 gzip）"""
+    return _export_response('users', 'users_list')
+
+
 @app.route('/users/add', methods=['GET', 'POST'])
 @login_required
 def users_add():
@@ -376,36 +401,21 @@ def users_edit(user_id):
                 except ValueError as e:
                     flash(f'日期格式错误：{str(e)}', 'error')
                     # 重新获取用户信息
-                    if db.db_type == 'sqlite':
-                        users = db._execute("SELECT * FROM users WHERE id=?", (user_id,), fetch=True)
-                    else:
-                        users = db._execute("SELECT * FROM users WHERE id=%s", (user_id,), fetch=True)
-                    user = users[0] if users else None
+                    user = db.get_user(user_id)
                     return render_template('users_form.html', user=user)
 
                 try:
-                    if db.db_type == 'sqlite':
-                        sql = """UPDATE users SET name=?, email=?, dob=?, last_sent_year=?, updated_at=datetime('now')
-                                WHERE id=?"""
-                        db._execute(sql, (name, email, dob, int(last_sent_year) if last_sent_year else None, user_id))
-                    else:
-                        sql = """UPDATE users SET name=%s, email=%s, dob=%s, last_sent_year=%s, updated_at=NOW()
-                                WHERE id=%s"""
-                        db._execute(sql, (name, email, dob, int(last_sent_year) if last_sent_year else None, user_id))
-                    db.conn.commit()
+                    db.update_user(user_id, name, email, dob,
+                                   int(last_sent_year) if last_sent_year else None)
                     flash(f'用户 {name} 更新成功！', 'success')
                     return redirect(url_for('users_list'))
                 except Exception as e:
                     flash(f'更新失败：{str(e)}', 'error')
         else:
             # 获取用户信息
-            if db.db_type == 'sqlite':
-                users = db._execute("SELECT * FROM users WHERE id=?", (user_id,), fetch=True)
-            else:
-                users = db._execute("SELECT * FROM users WHERE id=%s", (user_id,), fetch=True)
+            user = db.get_user(user_id)
 
-            if users:
-                user = users[0]
+            if user:
                 # 添加表单友好的日期格式
                 try:
                     user['dob_for_form'] = normalize_date(user['dob'])
@@ -430,19 +440,12 @@ def users_delete(user_id):
     db = get_db()
     try:
         # 先获取用户名用于提示
-        if db.db_type == 'sqlite':
-            users = db._execute("SELECT name FROM users WHERE id=?", (user_id,), fetch=True)
-        else:
-            users = db._execute("SELECT name FROM users WHERE id=%s", (user_id,), fetch=True)
+        user = db.get_user(user_id)
 
-        if users:
-            name = users[0]['name']
+        if user:
+            name = user['name']
             # 删除用户（级联删除相关日志）
-            if db.db_type == 'sqlite':
-                db._execute("DELETE FROM users WHERE id=?", (user_id,))
-            else:
-                db._execute("DELETE FROM users WHERE id=%s", (user_id,))
-            db.conn.commit()
+            db.delete_user(user_id)
             flash(f'用户 {name} 已删除', 'success')
         else:
             flash('用户不存在', 'error')
@@ -469,61 +472,29 @@ def users_batch_import():
             flash('请选择文件', 'error')
             return redirect(url_for('users_batch_import'))
 
-        # 处理CSV文件
-        if file and file.filename.endswith('.csv'):
-            try:
-                import csv
-                from io import StringIO
-
-                content = StringIO(file.read().decode('utf-8'))
-                reader = csv.DictReader(content)
+        if not file.filename.lower().endswith('.csv'):
+            flash('请上传CSV文件', 'error')
+            return redirect(url_for('users_batch_import'))
 
-                db = get_db()
-                success_count = 0
-                duplicate_count = 0
-                error_count = 0
+        # 上传内容落到临时文件，由后台任务分批导入，请求立即返回
+        fd, path = tempfile.mkstemp(prefix='import-', suffix='.csv')
+        os.close(fd)
+        file.save(path)
+        job = start_import_job(path, file.filename, update_existing=bool(request.form.get('update_existing')))
+        return redirect(url_for('users_batch_import', job=job.id))
 
-                try:
-                    for row in reader:
-                        name = row.get('name', '').strip()
-                        email = row.get('email', '').strip()
-                        dob = row.get('dob', '').strip()
-
-                        if name and email and dob:
-                            try:
-                                # 规范化日期格式
-                                dob = normalize_date(dob)
-                            except ValueError:
-                                error_count += 1
-                                continue
-
-                            # 检查是否已存在
-                            if db.db_type == 'sqlite':
-                                existing = db._execute("SELECT id FROM users WHERE email=?", (email,), fetch=True)
-                            else:
-                                existing = db._execute("SELECT id FROM users WHERE email=%s", (email,), fetch=True)
-
-                            if not existing:
-                                db.add_user(name, email, dob)
-                                success_count += 1
-                            else:
-                                duplicate_count += 1
-
-                    msg = f'导入完成！成功：{success_count}条'
-                    if duplicate_count:
-                        msg += f'，重复：{duplicate_count}条'
-                    if error_count:
-                        msg += f'，格式错误：{error_count}条'
-                    flash(msg, 'success')
-                finally:
-                    db.close()
+    job = get_import_job(request.args.get('job', ''))
+    return render_template('users_import.html', job=job)
 
-            except Exception as e:
-                flash(f'导入失败：{str(e)}', 'error')
-        else:
-            flash('请上传CSV文件', 'error')
 
-    return render_template('users_import.html')
+@app.route('/api/import-jobs/<job_id>')
+@login_required
+def api_import_job(job_id):
+    """导入任务进度API"""
+    job = get_import_job(job_id)
+    if not job:
+        return jsonify({'error': '导入任务不存在'}), 404
+    return jsonify(job)
 
 
 # ========== 祝福语管理 ==========
@@ -762,29 +733,86 @@ def templates_duplicate(template_id):
 
 # ========== 发送日志 ==========
 
+# 日志页每页条数（数据库中的最近日志 / 归档文件）
+LOGS_PAGE_SIZE = 200
+
+
 @app.route('/logs')
 @login_required
 def logs_list():
-    """发送日志"""
-    db = get_db()
-    try:
-        logs = db.get_send_logs(limit=200)
+    """发送日志（archive 参数指定时分页浏览归档文件）"""
+    archive = request.args.get('archive', '')
+    page = max(request.args.get('page', 1, type=int), 1)
 
-        # 统计
+    if archive:
+        try:
+            logs = read_archive(archive, (page - 1) * LOGS_PAGE_SIZE, LOGS_PAGE_SIZE)
+        except (ValueError, OSError):
+            flash('归档文件不存在', 'error')
+            return redirect(url_for('logs_list'))
+        # 统计：本页
         success_count = sum(1 for log in logs if log.get('status') == 'success')
         failed_count = len(logs) - success_count
+    else:
+        db = get_db()
+        try:
+            logs = db.get_send_logs(limit=LOGS_PAGE_SIZE)
+            # 统计：全部历史（汇总表，含已归档的日志）
+            totals = db.get_send_totals()
+        finally:
+            db.close()
+        success_count, failed_count = totals['success'], totals['failed']
+
+    return render_template('logs.html', logs=logs, success_count=success_count, failed_count=failed_count,
+                           archives=list_archives(), archive=archive, page=page,
+                           has_next=bool(archive) and len(logs) == LOGS_PAGE_SIZE)
 
-        return render_template('logs.html', logs=logs, success_count=success_count, failed_count=failed_count)
-    finally:
-        db.close()
+
+@app.route('/logs/archives/<name>')
+@login_required
+def logs_archive_download(name):
+    """下载归档文件（gzip JSON Lines）"""
+    try:
+        path = archive_path(name)
+    except ValueError:
+        return jsonify({'error': '归档文件不存在'}), 404
+    if not os.path.exists(path):
+        return jsonify({'error': '归档文件不存在'}), 404
+    return send_file(path, mimetype='application/gzip', as_attachment=True, download_name=name)
+
+
+@app.route('/logs/export')
+@login_required
+def logs_export():
+    """流式导出发送日志（CSV / JSON Lines，可选 gzip）"""
+    return _export_response('logs', 'logs_list')
 
 
 # ========== 手动发送 ==========
 
+def _send_message(job, email, name, wish):
+    """后台任务：发送一封手动祝福（连接、TLS 握手和 SMTP 往返都在工作线程中）"""
+    # 如果没有指定祝福语，随机获取
+    if not wish:
+        with DBManager() as db:
+            wish = db.get_random_wish()
+
+    job.report(message=f"正在发送给 {email}")
+    transport = get_transport()
+    try:
+        is_sent, error_msg, message_id = transport.send_many([{'email': email, 'name': name, 'wish': wish}])[0]
+    finally:
+        # 手动发送是单封邮件，不保留空闲连接
+        transport.close()
+    if not is_sent:
+        raise RuntimeError(error_msg)
+    return {'email': email, 'message_id': message_id}
+
+
 @app.route('/send', methods=['GET', 'POST'])
 @login_required
 def send_test():
-    """手动发送测试邮件"""
+    """手动发送测试邮件（提交到后台任务，页面轮询发送结果）"""
     if request.method == 'POST':
         email = request.form.get('email', '').strip()
         name = request.form.get('name', '').strip()
@@ -793,27 +821,28 @@ def send_test():
         if not email or not name:
             flash('请输入收件人姓名和邮箱', 'error')
         else:
-            # 如果没有指定祝福语，随机获取
-            if not wish:
-                db = get_db()
-                wish = db.get_random_wish()
-                db.close()
+            job = submit_job('send', _send_message, email, name, wish)
+            return redirect(url_for('send_test', job=job.id))
 
-            # 发送邮件
-            is_sent, error_msg = send_birthday_email(email, name, wish)
+    job = get_job(request.args.get('job', ''))
+    return render_template('send.html', job=job)
 
-            if is_sent:
-                flash('邮件发送成功！', 'success')
-            else:
-                flash(f'发送失败：{error_msg}', 'error')
 
-    return render_template('send.html')
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job(job_id):
+    """后台任务状态API（进度、结果和排队 / 执行耗时）"""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
 
 
 # ========== API接口 ==========
 
 @app.route('/api/stats')
 @login_required
+@conditional_json(tables=('users',), daily=True)
 def api_stats():
     """获取统计信息API"""
     db = get_db()
@@ -824,43 +853,75 @@ def api_stats():
         db.close()
 
 
+@app.route('/api/send-stats')
+@login_required
+def api_send_stats():
+    """每日发送统计API（days: 最近多少天，默认 90，最多 3660）"""
+    days = min(max(request.args.get('days', 90, type=int), 1), 3660)
+    start = datetime.now().date() - timedelta(days=days - 1)
+    db = get_db()
+    try:
+        return jsonify({
+            'daily': db.get_send_stats_daily(start),
+            'errors': db.get_send_error_summary(start),
+            'totals': db.get_send_totals(),
+        })
+    finally:
+        db.close()
+
+
+@app.route('/api/cache-stats')
+@login_required
+def api_cache_stats():
+    """本进程查询缓存和接口响应缓存的命中率、失效和淘汰次数API"""
+    return jsonify({
+        'queries': get_query_cache().stats(),
+        'responses': get_response_cache().stats(),
+    })
+
+
 @app.route('/api/upcoming-birthdays')
+@conditional_json(tables=('users',), daily=True)
 def api_upcoming_birthdays():
     """获取即将过生日的用户API"""
     db = get_db()
     try:
-        users = db.get_all_users()
-        today = datetime.now().date()  # 只取日期
-        upcoming = []
-
-        for user in users:
-            dob = parse_date(user['dob']) if isinstance(user['dob'], str) else user['dob']
-            if isinstance(dob, datetime):
-                dob = dob.date()
-
-            # 今年的生日
-            next_birthday = dob.replace(year=today.year)
-            if next_birthday < today:
-                next_birthday = dob.replace(year=today.year + 1)
-
-            days_left = (next_birthday - today).days
-            if days_left <= 30:
-                user['days_until_birthday'] = days_left
-                user['age'] = calculate_age(user['dob'])
-                upcoming.append(user)
-
-        upcoming.sort(key=lambda x: x['days_until_birthday'])
-        return jsonify(upcoming[:10])
+        upcoming = get_upcoming_users(db, limit=10, within_days=30)
+        for user in upcoming:
+            user['age'] = calculate_age(user['dob'])
+            user['next_birthday'] = user['next_birthday'].isoformat()
+        return jsonify(upcoming)
+    finally:
+        db.close()
+
+
+@app.route('/api/users/search')
+@login_required
+def api_users_search():
+    """用户搜索API（?q=关键词&limit=数量&after=上一页最后一个ID）"""
+    db = get_db()
+    try:
+        limit = min(request.args.get('limit', Config.SEARCH_PAGE_SIZE, type=int), Config.SEARCH_PAGE_SIZE)
+        after = request.args.get('after', 0, type=int)
+        users = db.search_users(request.args.get('q', ''), limit=limit, after=after)
+        return jsonify({
+            'users': [{'id': u['id'], 'name': u['name'], 'email': u['email'], 'dob': str(u['dob'])} for u in users],
+            'next_after': users[-1]['id'] if len(users) == limit else None,
+        })
     finally:
         db.close()
 
 
 @app.route('/api/rate-limit')
 @login_required
+@conditional_json(max_age=0)
 def api_rate_limit():
-    """获取速率限制统计API"""
+    """获取速率限制统计API（含发件账号和熔断器状态）"""
     limiter = get_rate_limiter()
-    return jsonify(limiter.get_stats())
+    stats = limiter.get_stats()
+    stats['senders'] = get_sender_pool().get_stats()
+    stats['retry_queue'] = len(get_retry_queue())
+    return jsonify(stats)
 
 
 @app.route('/rate-limit/reset', methods=['POST'])
@@ -869,6 +930,8 @@ def rate_limit_reset():
     """重置速率限制（仅管理员）"""
     limiter = get_rate_limiter()
     limiter.reset()
+    get_sender_pool().reset()
+    get_response_cache().clear()
     flash('速率限制已重置', 'success')
     return redirect(url_for('index'))
 
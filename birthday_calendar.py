@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+生日日历索引
+所有"下一个生日 / 年龄 / 即将过生日"的计算集中在这里：
+
+- 生日统一换算为闰年日历序号（1-366，2月29日固定为60）
+- 非闰年中 2 月 29 日出生的用户按 2 月 28 日过生日、长一岁
+- BirthdayCalendar 在内存中保存按 (序号, 用户ID) 排序的紧凑数组，
+  用二分查找回答"接下来 k 个生日""某个时间窗口内的生日"，用户增删改时增量更新
+"""
+
+import re
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from threading import Lock
+from config import Config
+
+
+# 用户 ID 占低 32 位，序号占高位：按 key 排序即按 (序号, 用户ID) 排序
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+LEAP_DAY_DOY = 60
+
+
+# ========== 日期换算 ==========
+
+def is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def parse_dob(dob):
+    """解析生日（date / datetime / 'YYYY-MM-DD'、'YYYY/M/D'、'YYYY.MM.DD' 字符串），返回 date，失败返回 None"""
+    if isinstance(dob, datetime):
+        return dob.date()
+    if isinstance(dob, date):
+        return dob
+    if isinstance(dob, str):
+        parts = re.split(r'[-/.]', dob.strip()[:10])
+        try:
+            year, month, day = int(parts[0]), int(parts[1]), int(parts[2])
+            return date(year, month, day)
+        except (IndexError, ValueError):
+            return None
+    return None
+
+
+def day_of_year(month, day):
+    """(月, 日) -> 闰年日历序号"""
+    return date(2000, month, day).timetuple().tm_yday
+
+
+def birthday_day_of_year(dob):
+    """生日的闰年日历序号，无法解析返回 None（不随年份变化，可以建索引）"""
+    dob = parse_dob(dob)
+    return day_of_year(dob.month, dob.day) if dob else None
+
+
+def doy_to_month_day(doy):
+    """闰年日历序号 -> (月, 日)"""
+    d = date(2000, 1, 1) + timedelta(days=doy - 1)
+    return d.month, d.day
+
+
+def birthday_in_year(month, day, year):
+    """某一年中实际过生日的日期（非闰年的 2 月 29 日按 2 月 28 日）"""
+    if (month, day) == (2, 29) and not is_leap(year):
+        return date(year, 2, 28)
+    return date(year, month, day)
+
+
+def next_birthday(dob, today=None):
+    """today 当天或之后的下一个生日日期"""
+    dob = parse_dob(dob)
+    today = today or date.today()
+    candidate = birthday_in_year(dob.month, dob.day, today.year)
+    if candidate < today:
+        candidate = birthday_in_year(dob.month, dob.day, today.year + 1)
+    return candidate
+
+
+def days_until_birthday(dob, today=None):
+    """距离下一个生日的天数（今天过生日为 0）"""
+    today = today or date.today()
+    return (next_birthday(dob, today) - today).days
+
+
+def age_on(dob, today=None):
+    """today 时的周岁年龄"""
+    dob = parse_dob(dob)
+    today = today or date.today()
+    age = today.year - dob.year
+    if today < birthday_in_year(dob.month, dob.day, today.year):
+        age -= 1
+    return age
+
+
+def observed_doys(day):
+    """某一天过生日的序号：通常只有当天，非闰年的 2 月 28 日还包括 2 月 29 日"""
+    doy = day_of_year(day.month, day.day)
+    if (day.month, day.day) == (2, 28) and not is_leap(day.year):
+        return [doy, LEAP_DAY_DOY]
+    return [doy]
+
+
+# ========== 内存索引 ==========
+
+class BirthdayCalendar:
+    """
+    内存生日索引
+
+    keys 为按 (序号, 用户ID) 排序的 array('q')，每个用户 8 字节；
+    超过 CALENDAR_MAX_USERS 时不建立索引（enabled=False），调用方改用数据库查询。
+
+    version 为索引对应的 users 表版本号（table_versions）：本进程的增量更新各加一，
+    与数据库中的版本不一致说明有其他进程写过 users，需要重建
+    """
+
+    def __init__(self, max_users=None):
+        self.max_users = max_users or Config.CALENDAR_MAX_USERS
+        self.keys = array('q')
+        self.enabled = False
+        self.stale = True
+        self.loaded_at = 0
+        self.version = None
+        self._table_cache = None
+        self.lock = Lock()
+
+    # ---------- 构建与增量更新 ----------
+
+    def build(self, rows):
+        """用 [(user_id, dob), ...] 重建索引"""
+        keys = []
+        for user_id, dob in rows:
+            doy = birthday_day_of_year(dob)
+            if doy is not None:
+                keys.append((doy << _ID_BITS) | user_id)
+                if len(keys) > self.max_users:
+                    break
+        keys.sort()
+        with self.lock:
+            self.enabled = len(keys) <= self.max_users
+            self.keys = array('q', keys if self.enabled else [])
+            self.stale = False
+            self.loaded_at = time.time()
+
+    def load(self, db):
+        """从数据库重建索引（先读版本号：加载期间有写入时，下次取用会再重建）"""
+        versions = db.get_table_versions(('users',))
+        rows = db._execute("SELECT id, dob FROM users", fetch=True)
+        self.build((row['id'], row['dob']) for row in rows)
+        self.version = versions[0] if versions else None
+
+    def _remove_locked(self, user_id, doy=None):
+        if doy is not None:
+            i = bisect_left(self.keys, (doy << _ID_BITS) | user_id)
+            if i < len(self.keys) and self.keys[i] == (doy << _ID_BITS) | user_id:
+                del self.keys[i]
+                return True
+            return False
+        # 不知道旧序号时线性查找（只有不带生日的 remove 会走到这里）
+        for i, key in enumerate(self.keys):
+            if key & _ID_MASK == user_id:
+                del self.keys[i]
+                return True
+        return False
+
+    def upsert(self, user_id, dob, old_dob=None):
+        """
+        新增或修改用户生日（O(log n) 定位 + 数组内移动）
+
+        old_dob 为 None 表示新用户，不在索引中，不必删除旧位置；
+        旧生日无效的用户建索引时本来就被跳过，同样不必删除
+        """
+        doy = birthday_day_of_year(dob)
+        old_doy = birthday_day_of_year(old_dob) if old_dob is not None else None
+        with self.lock:
+            self._bump_version_locked()
+            if not self.enabled:
+                return
+            if old_doy is not None:
+                self._remove_locked(user_id, old_doy)
+            if doy is not None:
+                key = (doy << _ID_BITS) | user_id
+                i = bisect_left(self.keys, key)
+                if i < len(self.keys) and self.keys[i] == key:
+                    # 重建时已包含这次写入
+                    return
+                if len(self.keys) >= self.max_users:
+                    self.enabled = False
+                    self.keys = array('q')
+                    return
+                self.keys.insert(i, key)
+
+    def remove(self, user_id, dob=None):
+        """删除用户"""
+        with self.lock:
+            self._bump_version_locked()
+            if self.enabled:
+                self._remove_locked(user_id, birthday_day_of_year(dob) if dob is not None else None)
+
+    def _bump_version_locked(self):
+        # 本进程的一次写入在数据库中让 users 版本号加一，增量更新后索引与之对应
+        if self.version is not None:
+            self.version += 1
+
+    def invalidate(self):
+        """标记需要重建（批量导入等无法逐条更新时）"""
+        self.stale = True
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ---------- 查询 ----------
+
+    def _days_table(self, today):
+        """每个序号对应的 (下一个生日日期, 剩余天数)，下标为序号（按日期缓存）"""
+        cached = self._table_cache
+        if cached and cached[0] == today:
+            return cached[1]
+        table = [None]
+        for doy in range(1, 367):
+            month, day = doy_to_month_day(doy)
+            when = birthday_in_year(month, day, today.year)
+            if when < today:
+                when = birthday_in_year(month, day, today.year + 1)
+            table.append((when, (when - today).days))
+        self._table_cache = (today, table)
+        return table
+
+    def upcoming(self, limit=None, within_days=None, today=None):
+        """
+        按下一个生日先后返回用户
+
+        从今天的序号二分定位，向后遍历并在年末绕回；剩余天数随遍历单调不减，
+        超出 within_days 或取满 limit 即停止
+
+        Args:
+            limit: 最多返回多少位
+            within_days: 只返回未来多少天内（含今天）
+            today: 基准日期（默认今天）
+
+        Returns:
+            list: [(user_id, 下一个生日日期, 剩余天数), ...]
+        """
+        today = today or date.today()
+        table = self._days_table(today)
+        result = []
+        with self.lock:
+            n = len(self.keys)
+            start = bisect_left(self.keys, day_of_year(today.month, today.day) << _ID_BITS)
+            for offset in range(n if limit is None else min(n, limit)):
+                key = self.keys[(start + offset) % n]
+                when, days = table[key >> _ID_BITS]
+                if within_days is not None and days > within_days:
+                    break
+                result.append((key & _ID_MASK, when, days))
+        return result
+
+    def order_by_next_birthday(self, today=None):
+        """全部用户 ID 按下一个生日先后排序，返回 {user_id: 名次}"""
+        return {user_id: i for i, (user_id, _, _) in enumerate(self.upcoming(today=today))}
+
+    def get_stats(self):
+        return {
+            'enabled': self.enabled,
+            'users': len(self.keys),
+            'max_users': self.max_users,
+            'memory_bytes': self.keys.buffer_info()[1] * self.keys.itemsize,
+            'loaded_at': self.loaded_at,
+        }
+
+
+# 全局单例（Web 进程内共享）
+_calendar_instance = None
+_calendar_lock = Lock()
+
+
+def get_birthday_calendar(db=None):
+    """
+    获取全局生日索引；首次使用、被标记失效、users 版本号与索引不一致（其他进程写过）
+    或超过 CALENDAR_REFRESH_SECONDS 时从数据库重建
+    """
+    global _calendar_instance
+    if db is None:
+        from db_manager import DBManager
+        with DBManager() as own_db:
+            return get_birthday_calendar(own_db)
+    with _calendar_lock:
+        if _calendar_instance is None:
+            _calendar_instance = BirthdayCalendar()
+        calendar = _calendar_instance
+        versions = db.get_table_versions(('users',))
+        if (calendar.stale or time.time() - calendar.loaded_at > Config.CALENDAR_REFRESH_SECONDS
+                or (versions is not None and versions != (calendar.version,))):
+            calendar.load(db)
+        return calendar
+
+
+def notify_user_changed(user_id, dob, old_dob=None):
+    """用户新增（old_dob 为 None）或生日变更后增量更新索引（索引尚未加载时忽略）"""
+    if _calendar_instance is not None and not _calendar_instance.stale:
+        if user_id:
+            _calendar_instance.upsert(user_id, dob, old_dob)
+        else:
+            _calendar_instance.invalidate()
+
+
+def notify_user_deleted(user_id, dob=None):
+    """用户删除后更新索引"""
+    if _calendar_instance is not None and not _calendar_instance.stale:
+        _calendar_instance.remove(user_id, dob)
+
+
+def invalidate_calendar():
+    """批量写入后标记索引需要重建"""
+    if _calendar_instance is not None:
+        _calendar_instance.invalidate()
+
+
+# 测试代码
+if __name__ == "__main__":
+    calendar = BirthdayCalendar()
+    calendar.build([(1, '2000-02-29'), (2, '1995-03-01'), (3, '1990-12-31'), (4, '1988-01-02')])
+    for user_id, when, days in calendar.upcoming(today=date(2027, 2, 27)):
+        print(f"用户 {user_id}: {when}（{days} 天后）")
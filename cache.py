@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+进程内查询缓存
+仪表盘统计、祝福语列表、邮件模板和即将过生日列表等结果按键缓存在本进程内（TTL + LRU），
+每个条目标记所依赖的表，并记下计算时这些表在 table_versions 中的版本号。
+
+DBManager 每次写这些表时在同一事务内把版本号加一，取用缓存前先用一次主键查询读出当前版本：
+版本变了说明有进程（任意 gunicorn worker 或守护进程）写过，条目作废重算。
+不需要 Redis 之类的外部服务，各 worker 的缓存也能一致失效
+"""
+
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+from config import Config
+
+
+class QueryCache:
+    """带表版本校验的 TTL / LRU 缓存"""
+
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or Config.CACHE_MAX_ENTRIES
+        self.ttl = Config.CACHE_TTL_SECONDS if ttl is None else ttl
+        self._entries = OrderedDict()   # 键 -> (过期时间, 表版本, 值)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0          # 表版本已变化而作废
+        self.expired = 0        # 超过 TTL 而作废
+        self.evictions = 0      # 超出容量被淘汰
+
+    def get_or_compute(self, db, key, tables, compute, ttl=None, versions=None):
+        """
+        取缓存，没有或已失效时调用 compute() 计算并缓存
+
+        Args:
+            db: DBManager（读表版本用）
+            key: 缓存键（可哈希）
+            tables: 结果依赖的表，如 ('users',)
+            compute: 无参函数，返回要缓存的值
+            ttl: 秒数（默认 CACHE_TTL_SECONDS），0 表示不缓存
+            versions: 调用方已读出的表版本（省去一次查询；tables 为空时只按 TTL 失效）
+
+        Returns:
+            值的副本（调用方可以随意修改）
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return compute()
+
+        # 先读版本再计算：计算期间有写入时，存下的旧版本号会让下次取用重算
+        if versions is None:
+            versions = db.get_table_versions(tables) if tables else ()
+        if versions is None:
+            return compute()
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, cached_versions, value = entry
+                if expires_at <= now:
+                    self.expired += 1
+                    del self._entries[key]
+                elif cached_versions != versions:
+                    self.stale += 1
+                    del self._entries[key]
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return copy.deepcopy(value)
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + ttl, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return copy.deepcopy(value)
+
+    def clear(self):
+        """清空本进程内的全部条目"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """命中率等统计（JSON）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'stale': self.stale,
+                'expired': self.expired,
+                'evictions': self.evictions,
+            }
+
+
+# 全局单例（本进程内共享）
+_cache_instance = None
+_cache_lock = Lock()
+
+
+def get_query_cache():
+    """获取本进程的查询缓存"""
+    global _cache_instance
+    with _cache_lock:
+        if _cache_instance is None:
+            _cache_instance = QueryCache()
+        return _cache_instance
+
+
+def cached(db, key, tables, compute, ttl=None):
+    """get_query_cache().get_or_compute 的简写"""
+    return get_query_cache().get_or_compute(db, key, tables, compute, ttl)
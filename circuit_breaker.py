@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+SMTP 中继熔断器
+中继不可用时快速失败，避免每个收件人都等待一次完整的连接超时
+"""
+
+import re
+import smtplib
+import time
+from threading import Lock
+from config import Config
+from logger import get_logger
+
+
+logger = get_logger('circuit_breaker')
+
+
+# 熔断器状态
+STATE_CLOSED = 'closed'        # 正常放行
+STATE_OPEN = 'open'            # 熔断中，直接拒绝
+STATE_HALF_OPEN = 'half_open'  # 试探中，放行少量请求
+
+# 错误分类
+ERROR_AUTH = 'auth'            # 认证失败（立即熔断）
+ERROR_SENDER = 'sender'        # 发件人被拒（账号被封禁或超出配额，立即熔断）
+ERROR_NETWORK = 'network'      # 连接失败、超时、连接被断开
+ERROR_TEMPORARY = 'temporary'  # 4xx 临时错误（限流、服务繁忙）
+ERROR_RECIPIENT = 'recipient'  # 收件人被拒（中继本身正常）
+ERROR_PERMANENT = 'permanent'  # 其他 5xx 永久错误
+ERROR_RATE_LIMIT = 'rate_limit'  # 本地速率限制或账号限额（没有真正发出）
+ERROR_OTHER = 'other'
+
+# 计入熔断的错误类别
+TRIPPING_ERRORS = (ERROR_AUTH, ERROR_SENDER, ERROR_NETWORK, ERROR_TEMPORARY)
+
+# 立即熔断的错误类别
+IMMEDIATE_TRIP_ERRORS = (ERROR_AUTH, ERROR_SENDER)
+
+
+def classify_error(error):
+    """将发送异常归类为错误类别"""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return ERROR_AUTH
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return ERROR_RECIPIENT
+    if isinstance(error, smtplib.SMTPSenderRefused) and error.smtp_code >= 500:
+        return ERROR_SENDER
+    if isinstance(error, (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected)):
+        return ERROR_NETWORK
+    if isinstance(error, smtplib.SMTPResponseException):
+        return ERROR_TEMPORARY if 400 <= error.smtp_code < 500 else ERROR_PERMANENT
+    if isinstance(error, OSError):
+        # socket.timeout、ConnectionRefusedError、ssl.SSLError 等
+        return ERROR_NETWORK
+    return ERROR_OTHER
+
+
+_SMTP_CODE_RE = re.compile(r'\(([45]\d\d)[,)]')
+_HTTP_CODE_RE = re.compile(r'^HTTP 错误: (\d{3})')
+_NETWORK_HINTS = ('timed out', 'Errno', 'Connection', 'SSL', 'disconnected')
+
+
+def classify_error_message(error_msg):
+    """
+    按发送日志中的错误信息归类（与 classify_error 使用相同的类别），用于统计汇总
+
+    成功（没有错误信息）返回空字符串
+    """
+    if not error_msg:
+        return ''
+    if error_msg.startswith('认证失败'):
+        return ERROR_AUTH
+    if error_msg.startswith('速率限制') or error_msg == "所有发件账号已达到发送限额":
+        return ERROR_RATE_LIMIT
+    if error_msg == "没有可用的发件账号":
+        return ERROR_SENDER
+    if error_msg.startswith('SMTP 错误'):
+        if error_msg.startswith("SMTP 错误: {"):
+            # SMTPRecipientsRefused: {'收件人': (550, b'...')}
+            return ERROR_RECIPIENT
+        m = _SMTP_CODE_RE.search(error_msg)
+        if m:
+            return ERROR_TEMPORARY if m.group(1).startswith('4') else ERROR_PERMANENT
+    m = _HTTP_CODE_RE.match(error_msg)
+    if m:
+        code = int(m.group(1))
+        return ERROR_TEMPORARY if code == 429 or code >= 500 else ERROR_PERMANENT
+    if error_msg.startswith('HTTP 请求失败') or any(hint in error_msg for hint in _NETWORK_HINTS):
+        return ERROR_NETWORK
+    return ERROR_OTHER
+
+
+class CircuitBreaker:
+    """
+    三态熔断器
+
+    - closed: 连续 failure_threshold 次可熔断错误后打开（认证失败、发件人被拒立即打开）
+    - open: 拒绝所有请求，recovery_timeout 秒后进入 half_open
+    - half_open: 放行 half_open_max_calls 个试探请求，成功则关闭，失败则重新打开
+      并把恢复等待时间翻倍（不超过 max_recovery_timeout）
+    """
+
+    def __init__(self, name='smtp', failure_threshold=None, recovery_timeout=None,
+                 max_recovery_timeout=None, half_open_max_calls=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.base_recovery_timeout = recovery_timeout or Config.CIRCUIT_RECOVERY_SECONDS
+        self.max_recovery_timeout = max_recovery_timeout or Config.CIRCUIT_MAX_RECOVERY_SECONDS
+        self.half_open_max_calls = half_open_max_calls or Config.CIRCUIT_HALF_OPEN_MAX_CALLS
+
+        self.state = STATE_CLOSED
+        self.recovery_timeout = self.base_recovery_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.half_open_calls = 0
+        self.last_error = None
+        self.last_error_class = None
+        self.last_state_change = time.time()
+
+        # 统计信息
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.times_opened = 0
+        self.failures_by_class = {}
+
+        self.lock = Lock()
+
+    def _transition(self, new_state, reason):
+        """切换状态并记录日志"""
+        old_state = self.state
+        self.state = new_state
+        self.last_state_change = time.time()
+        if new_state == STATE_OPEN:
+            self.opened_at = time.time()
+            self.times_opened += 1
+            logger.warning(f"熔断器 {self.name}: {old_state} -> {new_state}（{reason}），"
+                           f"{self.recovery_timeout}秒后试探恢复")
+        else:
+            logger.info(f"熔断器 {self.name}: {old_state} -> {new_state}（{reason}）")
+        if new_state == STATE_HALF_OPEN:
+            self.half_open_calls = 0
+
+    def _retry_in(self):
+        return max(0.0, self.opened_at + self.recovery_timeout - time.time())
+
+    def allow_request(self):
+        """
+        是否放行本次请求
+
+        Returns:
+            (allowed: bool, retry_in: float) 拒绝时给出距离下次试探的秒数
+        """
+        with self.lock:
+            if self.state == STATE_OPEN:
+                if self._retry_in() > 0:
+                    self.total_rejected += 1
+                    return False, self._retry_in()
+                self._transition(STATE_HALF_OPEN, "恢复等待结束")
+
+            if self.state == STATE_HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.total_rejected += 1
+                    return False, 0.0
+                self.half_open_calls += 1
+
+            return True, 0.0
+
+    def record_success(self):
+        """记录一次成功（中继有应答即视为健康）"""
+        with self.lock:
+            self.consecutive_failures = 0
+            if self.state != STATE_CLOSED:
+                self.recovery_timeout = self.base_recovery_timeout
+                self._transition(STATE_CLOSED, "试探请求成功")
+
+    def record_failure(self, error):
+        """
+        记录一次失败
+
+        Returns:
+            str: 错误类别
+        """
+        error_class = classify_error(error)
+        with self.lock:
+            self.failures_by_class[error_class] = self.failures_by_class.get(error_class, 0) + 1
+            if error_class not in TRIPPING_ERRORS:
+                # 收件人级错误说明中继仍可用
+                self.consecutive_failures = 0
+                if self.state == STATE_HALF_OPEN:
+                    self.recovery_timeout = self.base_recovery_timeout
+                    self._transition(STATE_CLOSED, f"中继有应答（{error_class}）")
+                return error_class
+
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            self.last_error_class = error_class
+
+            if self.state == STATE_HALF_OPEN:
+                self.recovery_timeout = min(self.recovery_timeout * 2, self.max_recovery_timeout)
+                self._transition(STATE_OPEN, f"试探失败: {error_class}")
+            elif self.state == STATE_CLOSED and (
+                error_class in IMMEDIATE_TRIP_ERRORS or self.consecutive_failures >= self.failure_threshold
+            ):
+                self._transition(STATE_OPEN, f"连续失败 {self.consecutive_failures} 次: {error_class}")
+            return error_class
+
+    def is_open(self):
+        """是否处于熔断状态（不改变状态）"""
+        with self.lock:
+            return self.state == STATE_OPEN and self._retry_in() > 0
+
+    def get_stats(self):
+        """获取熔断器状态"""
+        with self.lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'retry_in': round(self._retry_in(), 1) if self.state == STATE_OPEN else 0,
+                'times_opened': self.times_opened,
+                'total_failures': self.total_failures,
+                'total_rejected': self.total_rejected,
+                'failures_by_class': dict(self.failures_by_class),
+                'last_error': self.last_error,
+                'last_error_class': self.last_error_class,
+            }
+
+    def reset(self):
+        """手动关闭熔断器（管理员功能）"""
+        with self.lock:
+            self.consecutive_failures = 0
+            self.recovery_timeout = self.base_recovery_timeout
+            if self.state != STATE_CLOSED:
+                self._transition(STATE_CLOSED, "手动重置")
+
+
+# 测试代码
+if __name__ == "__main__":
+    breaker = CircuitBreaker('test', failure_threshold=3, recovery_timeout=1)
+    for _ in range(3):
+        breaker.record_failure(ConnectionRefusedError("connection refused"))
+    print("熔断后:", breaker.allow_request(), breaker.get_stats()['state'])
+    time.sleep(1.1)
+    print("恢复等待后:", breaker.allow_request(), breaker.get_stats()['state'])
+    breaker.record_success()
+    print("试探成功后:", breaker.get_stats()['state'])
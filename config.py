@@ -20,6 +20,36 @@ class Config:
     MAIL_USER = os.getenv("MAIL_USER")
     MAIL_AUTH_CODE = os.getenv("MAIL_AUTH_CODE")
     MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME", "生日祝福助手")
+    # 465 端口使用 SSL 直连；设为 false 时使用明文连接（服务器支持时自动 STARTTLS）
+    MAIL_USE_SSL = os.getenv("MAIL_USE_SSL", "true").lower() in ("1", "true", "yes")
+    SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
+    # 服务器声明 PIPELINING 时合并命令往返
+    SMTP_PIPELINING = os.getenv("SMTP_PIPELINING", "true").lower() in ("1", "true", "yes")
+    # 单个 SMTP 连接最多发送的邮件数，超过后重连
+    SMTP_MAX_MESSAGES_PER_SESSION = int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", "50"))
+    # 每个发件账号保持的空闲 SMTP 连接数
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+
+    # 多发件账号轮换（可选）：用分号分隔多个账号，每个账号格式为
+    # 邮箱|授权码|SMTP服务器|端口|每日限额，后三项可省略（默认 MAIL_SERVER / MAIL_PORT / MAX_EMAILS_PER_DAY）
+    # 例如: a@163.com|code1;b@qq.com|code2|smtp.qq.com|465|300
+    MAIL_ACCOUNTS = os.getenv("MAIL_ACCOUNTS", "")
+
+    # ========== 投递传输配置 ==========
+    # smtp（默认）, http（HTTP 批量 API）, maildir / pickup / mbox（写入本地目录，由 MTA 接手）
+    MAIL_TRANSPORT = os.getenv("MAIL_TRANSPORT", "smtp")
+    HTTP_API_URL = os.getenv("HTTP_API_URL", "")
+    HTTP_API_KEY = os.getenv("HTTP_API_KEY", "")
+    # 单个请求携带的邮件数和同时进行的请求数
+    HTTP_BATCH_SIZE = int(os.getenv("HTTP_BATCH_SIZE", "500"))
+    HTTP_CONCURRENCY = int(os.getenv("HTTP_CONCURRENCY", "4"))
+    HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "30"))
+    SPOOL_PATH = os.getenv(
+        "SPOOL_PATH",
+        os.path.join(os.path.dirname(__file__), "spool")
+    )
+    # 落盘时每批写入的邮件数（每批 fsync 一次）
+    SPOOL_BATCH_SIZE = int(os.getenv("SPOOL_BATCH_SIZE", "1000"))
 
     # ========== 数据库配置 ==========
     DB_TYPE = os.getenv("DB_TYPE", "sqlite")  # sqlite, mysql, postgresql
@@ -43,6 +73,41 @@ class Config:
 
     # ========== 定时任务配置 ==========
     SEND_TIME = os.getenv("SEND_TIME", "09:00")
+    # 可选：cron 表达式（分 时 日 月 周），设置后覆盖 SEND_TIME
+    SEND_CRON = os.getenv("SEND_CRON", "")
+    # 随机抖动上限（秒），避免多实例同一时刻触发
+    SCHEDULER_JITTER_SECONDS = int(os.getenv("SCHEDULER_JITTER_SECONDS", "0"))
+    # 错过运行策略: catch_up（逐次补跑）, skip（跳过）, coalesce（合并为一次）
+    SCHEDULER_MISSED_POLICY = os.getenv("SCHEDULER_MISSED_POLICY", "coalesce")
+    # 迟到多少秒以内仍视为正常运行
+    SCHEDULER_GRACE_SECONDS = int(os.getenv("SCHEDULER_GRACE_SECONDS", "300"))
+
+    # ========== 补发配置 ==========
+    # 守护进程停机后启动时，最多回溯补发多少天内错过的生日（不超过 365 天，补发区间最多跨一次年）
+    CATCHUP_MAX_DAYS = min(int(os.getenv("CATCHUP_MAX_DAYS", "30")), 365)
+    # 补发速率（封/分钟）
+    CATCHUP_RATE_PER_MINUTE = int(os.getenv("CATCHUP_RATE_PER_MINUTE", "10"))
+
+    # ========== 备份配置 ==========
+    # 备份任务 cron 表达式，留空则禁用（默认每周日 02:00）
+    BACKUP_CRON = os.getenv("BACKUP_CRON", "0 2 * * 0")
+    BACKUP_DIR = os.getenv(
+        "BACKUP_DIR",
+        os.path.join(os.path.dirname(__file__), "backups")
+    )
+    BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "8"))
+
+    # ========== 发送日志归档配置 ==========
+    # 发送日志在数据库中保留的天数，更早的按批移入 gzip JSON Lines 归档文件；0 表示不归档
+    LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "365"))
+    # 归档任务 cron 表达式，留空则禁用（默认每天 03:30）
+    LOG_ARCHIVE_CRON = os.getenv("LOG_ARCHIVE_CRON", "30 3 * * *")
+    LOG_ARCHIVE_DIR = os.getenv(
+        "LOG_ARCHIVE_DIR",
+        os.path.join(os.path.dirname(__file__), "archives")
+    )
+    # 每个归档文件（每批）的日志条数
+    LOG_ARCHIVE_BATCH_SIZE = int(os.getenv("LOG_ARCHIVE_BATCH_SIZE", "10000"))
 
     # ========== 速率限制配置 ==========
     MAX_EMAILS_PER_HOUR = int(os.getenv("MAX_EMAILS_PER_HOUR", "50"))
@@ -50,6 +115,40 @@ class Config:
     EMAIL_COOLDOWN_SECONDS = int(os.getenv("EMAIL_COOLDOWN_SECONDS", "300"))  # 5分钟
     MIN_EMAIL_INTERVAL = int(os.getenv("MIN_EMAIL_INTERVAL", "2"))  # 2秒
 
+    # ========== 熔断配置 ==========
+    # 连续多少次连接/超时/4xx 错误后熔断（认证失败立即熔断）
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+    # 熔断后多少秒试探恢复，试探失败时翻倍，最长 CIRCUIT_MAX_RECOVERY_SECONDS
+    CIRCUIT_RECOVERY_SECONDS = int(os.getenv("CIRCUIT_RECOVERY_SECONDS", "60"))
+    CIRCUIT_MAX_RECOVERY_SECONDS = int(os.getenv("CIRCUIT_MAX_RECOVERY_SECONDS", "900"))
+    CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_MAX_CALLS", "1"))
+    # 熔断期间推迟发送的重试队列上限
+    RETRY_QUEUE_MAX = int(os.getenv("RETRY_QUEUE_MAX", "10000"))
+
+    # ========== 缓存配置 ==========
+    # 进程内查询缓存（仪表盘统计、祝福语、邮件模板、即将过生日）：条目最长保留秒数和最多条目数；
+    # 依赖的表被任意进程写入后立即失效（table_versions 版本号），0 表示不缓存
+    CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+    # 被轮询的 JSON 接口（/api/stats 等）的响应缓存秒数，同时作为 Cache-Control 的 max-age
+    API_CACHE_SECONDS = int(os.getenv("API_CACHE_SECONDS", "10"))
+    # 内存生日索引：最多索引的用户数（每人约 8 字节，超过后改用数据库查询）和定期重建间隔
+    CALENDAR_MAX_USERS = int(os.getenv("CALENDAR_MAX_USERS", "2000000"))
+    CALENDAR_REFRESH_SECONDS = int(os.getenv("CALENDAR_REFRESH_SECONDS", "300"))
+    # 用户列式快照的增量刷新间隔（本进程写入后立即刷新）
+    SNAPSHOT_REFRESH_SECONDS = int(os.getenv("SNAPSHOT_REFRESH_SECONDS", "30"))
+    # 用户搜索每页结果数（按 ID 键集分页）
+    SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "200"))
+    # 批量导入：每批写入的行数（一条多行 INSERT、一次提交）
+    IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+    # 状态为 running 的导入超过这么多分钟没有新检查点，视为已中断，可以被重新上传的同一文件接管
+    IMPORT_STALE_MINUTES = int(os.getenv("IMPORT_STALE_MINUTES", "10"))
+    # Web 后台任务（手动发送、批量导入）的工作线程数和本进程内保留的已结束任务数
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+    # 排队中 / 执行中的任务超过这么多秒没有心跳，视为所在进程已退出，标记为失败
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+
     # ========== 系统配置 ==========
     # 时区设置
     TIMEZONE = os.getenv("TIMEZONE", "Asia/Shanghai")
@@ -60,16 +159,60 @@ class Config:
     # NFT配置（可选，用于NFT功能集成）
     CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS", "")
 
+    @classmethod
+    def get_mail_accounts(cls):
+        """
+        解析发件账号池
+
+        Returns:
+            list: [{user, auth_code, server, port, daily_limit, hourly_limit}, ...]；
+                  未配置 MAIL_ACCOUNTS 时只包含 MAIL_USER 一个账号
+        """
+        accounts = []
+        for entry in cls.MAIL_ACCOUNTS.replace('\n', ';').split(';'):
+            parts = [p.strip() for p in entry.split('|')]
+            if not parts[0]:
+                continue
+            accounts.append({
+                'user': parts[0],
+                'auth_code': parts[1] if len(parts) > 1 else '',
+                'server': parts[2] if len(parts) > 2 and parts[2] else cls.MAIL_SERVER,
+                'port': int(parts[3]) if len(parts) > 3 and parts[3] else cls.MAIL_PORT,
+                'daily_limit': int(parts[4]) if len(parts) > 4 and parts[4] else cls.MAX_EMAILS_PER_DAY,
+                'hourly_limit': cls.MAX_EMAILS_PER_HOUR,
+            })
+
+        if not accounts and cls.MAIL_USER:
+            accounts.append({
+                'user': cls.MAIL_USER,
+                'auth_code': cls.MAIL_AUTH_CODE,
+                'server': cls.MAIL_SERVER,
+                'port': cls.MAIL_PORT,
+                'daily_limit': cls.MAX_EMAILS_PER_DAY,
+                'hourly_limit': cls.MAX_EMAILS_PER_HOUR,
+            })
+        return accounts
+
     @classmethod
     def validate(cls):
         """验证必要配置是否完整"""
         errors = []
 
-        # 邮件配置必须
-        if not cls.MAIL_USER:
-            errors.append("缺少 MAIL_USER 配置")
-        if not cls.MAIL_AUTH_CODE:
-            errors.append("缺少 MAIL_AUTH_CODE 配置")
+        # 邮件配置必须（配置了 MAIL_ACCOUNTS 时以账号池为准）
+        if cls.MAIL_TRANSPORT != "smtp":
+            if not cls.MAIL_USER:
+                errors.append("缺少 MAIL_USER 配置")
+            if cls.MAIL_TRANSPORT == "http" and not cls.HTTP_API_URL:
+                errors.append("MAIL_TRANSPORT=http 时需要配置 HTTP_API_URL")
+        elif cls.MAIL_ACCOUNTS:
+            for account in cls.get_mail_accounts():
+                if not account['auth_code']:
+                    errors.append(f"MAIL_ACCOUNTS 中账号 {account['user']} 缺少授权码")
+        else:
+            if not cls.MAIL_USER:
+                errors.append("缺少 MAIL_USER 配置")
+            if not cls.MAIL_AUTH_CODE:
+                errors.append("缺少 MAIL_AUTH_CODE 配置")
 
         # MySQL 配置（仅当使用 MySQL 时验证）
         if cls.DB_TYPE == "mysql":
@@ -5,12 +5,43 @@
 """
 
 import os
+import re
+import sys
+import io
+import csv
+import time
+import tempfile
 import sqlite3
 import pymysql
 import psycopg2
 import psycopg2.extras
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from config import Config
+from birthday_calendar import (parse_dob, day_of_year, birthday_day_of_year, doy_to_month_day, next_birthday, is_leap,
+                               observed_doys, notify_user_changed, notify_user_deleted,
+                               invalidate_calendar, LEAP_DAY_DOY)
+from circuit_breaker import classify_error_message
+from sent_bitmap import SentBitmap, get_sent_bitmap, notify_sent, forget_sent_bitmaps
+from cache import cached
+
+
+# 带版本号的表：写入时在同一事务内递增 table_versions 中的版本，查询缓存据此失效（见 cache.py）
+VERSIONED_TABLES = ('users', 'wishes', 'email_templates')
+
+# _execute 执行的写语句及其目标表
+_WRITE_RE = re.compile(r'^\s*(?:INSERT\s+(?:OR\s+\w+\s+|IGNORE\s+)?INTO|UPDATE|DELETE\s+FROM)\s+(\w+)', re.I)
+
+
+def invalidate_user_cache():
+    """
+    用户数据变更后让用户快照在下次使用时刷新
+
+    快照模块（依赖 NumPy）只在 Web 进程中加载；没加载说明本进程没有快照，
+    守护进程和命令行导入不必为此导入 NumPy
+    """
+    user_snapshot = sys.modules.get('user_snapshot')
+    if user_snapshot is not None:
+        user_snapshot.mark_snapshot_dirty()
 
 
 class DBManager:
@@ -56,7 +87,9 @@ class DBManager:
             password=Config.DB_PASS,
             database=Config.DB_NAME,
             charset=Config.DB_CHARSET,
-            cursorclass=pymysql.cursors.DictCursor
+            cursorclass=pymysql.cursors.DictCursor,
+            # 批量导入使用 LOAD DATA LOCAL INFILE
+            local_infile=True
         )
 
     def _init_postgresql(self):
@@ -77,6 +110,11 @@ class DBManager:
         else:
             cursor.execute(sql)
 
+        if not fetch:
+            match = _WRITE_RE.match(sql)
+            if match and match.group(1).lower() in VERSIONED_TABLES:
+                self.bump_table_versions(match.group(1).lower())
+
         if fetch:
             if self.db_type == "sqlite":
                 rows = cursor.fetchall()
@@ -87,83 +125,712 @@ class DBManager:
                 return cursor.fetchall()
         return None
 
-    # ========== 生日相关 ==========
+    def iter_query(self, sql, params=None, batch_size=1000):
+        """
+        用服务端游标逐批读取大结果集，逐行生成字典（导出等场景，内存占用与总行数无关）
 
-    def get_todays_birthdays(self):
-        """获取今天过生日且今年未发送的用户"""
-        today = datetime.now()
+        - SQLite: 游标本身按需读取
+        - PostgreSQL: 命名游标（DECLARE CURSOR），每次取 batch_size 行
+        - MySQL: SSDictCursor（不缓存结果集）
+
+        PostgreSQL 上只有调用前连接空闲（由本方法开启事务）时才在结束后回滚，不会丢弃调用方未提交的写入
+        """
+        own_transaction = False
+        if self.db_type == "postgresql":
+            own_transaction = self.conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            cursor = self.conn.cursor(name=f"stream_{id(self)}_{time.monotonic_ns()}",
+                                      cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.itersize = batch_size
+        elif self.db_type == "mysql":
+            cursor = self.conn.cursor(pymysql.cursors.SSDictCursor)
+        else:
+            cursor = self.conn.cursor()
+
+        try:
+            cursor.execute(sql, params or ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+            if own_transaction:
+                # 结束命名游标所在的只读事务
+                self.conn.rollback()
+
+    # ========== 表结构维护 ==========
+
+    def ensure_schema(self):
+        """创建 init_db.py 之后新增的表（幂等，可在启动时反复调用）"""
+        if self.db_type == "sqlite":
+            self._execute("""
+                CREATE TABLE IF NOT EXISTS job_runs (
+                    job_name TEXT PRIMARY KEY,
+                    last_run_date TEXT NOT NULL,
+                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        elif self.db_type == "postgresql":
+            self._execute("""
+                CREATE TABLE IF NOT EXISTS job_runs (
+                    job_name VARCHAR(50) PRIMARY KEY,
+                    last_run_date DATE NOT NULL,
+                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        else:
+            self._execute("""
+                CREATE TABLE IF NOT EXISTS job_runs (
+                    job_name VARCHAR(50) PRIMARY KEY,
+                    last_run_date DATE NOT NULL,
+                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+
+        # 表版本号（见 cache.py）；modified_at 为最后一次写入的 Unix 时间（HTTP Last-Modified 用）
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                modified_at BIGINT NOT NULL DEFAULT 0
+            )
+        """)
+        self._add_column_if_missing('table_versions', 'modified_at', 'BIGINT NOT NULL DEFAULT 0')
+        existing = {row['table_name'] for row in self._execute("SELECT table_name FROM table_versions", fetch=True)}
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        for table in VERSIONED_TABLES:
+            if table not in existing:
+                self._execute(f"INSERT INTO table_versions (table_name, version) VALUES ({ph}, 0)", (table,))
+
+        # 每年的发送位图（见 sent_bitmap.py）
+        blob_type = {"sqlite": "BLOB", "postgresql": "BYTEA", "mysql": "MEDIUMBLOB"}[self.db_type]
+        self._execute(f"""
+            CREATE TABLE IF NOT EXISTS sent_bitmaps (
+                year INTEGER PRIMARY KEY,
+                bits {blob_type} NOT NULL,
+                log_id BIGINT NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # 每日发送统计汇总：记录发送结果时同一事务内累加，首次创建时由 send_logs 回填
+        day_type = "TEXT" if self.db_type == "sqlite" else "DATE"
+        stats_created = not self._table_exists('send_stats_daily')
+        self._execute(f"""
+            CREATE TABLE IF NOT EXISTS send_stats_daily (
+                day {day_type} NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                error_class VARCHAR(20) NOT NULL DEFAULT '',
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, status, error_class)
+            )
+        """)
+
+        # 导入任务检查点：每提交一批写一次，中断后按文件哈希从最后的检查点继续
+        if self.db_type == "sqlite":
+            self._execute("""
+                CREATE TABLE IF NOT EXISTS import_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_name TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    source TEXT DEFAULT 'cli',
+                    update_existing INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'running',
+                    byte_offset INTEGER DEFAULT 0,
+                    rows_done INTEGER DEFAULT 0,
+                    inserted INTEGER DEFAULT 0,
+                    skipped INTEGER DEFAULT 0,
+                    invalid INTEGER DEFAULT 0,
+                    chunks INTEGER DEFAULT 0,
+                    error TEXT,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            self._execute("""
+                CREATE TABLE IF NOT EXISTS import_job_chunks (
+                    job_id INTEGER NOT NULL,
+                    chunk_no INTEGER NOT NULL,
+                    byte_offset INTEGER NOT NULL,
+                    rows_done INTEGER NOT NULL,
+                    rows_read INTEGER NOT NULL,
+                    rows_written INTEGER NOT NULL,
+                    seconds REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (job_id, chunk_no)
+                )
+            """)
+        else:
+            id_column = "SERIAL PRIMARY KEY" if self.db_type == "postgresql" else "INT AUTO_INCREMENT PRIMARY KEY"
+            suffix = "" if self.db_type == "postgresql" else " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+            self._execute(f"""
+                CREATE TABLE IF NOT EXISTS import_jobs (
+                    id {id_column},
+                    file_name VARCHAR(255) NOT NULL,
+                    file_hash VARCHAR(64) NOT NULL,
+                    file_size BIGINT NOT NULL,
+                    source VARCHAR(20) DEFAULT 'cli',
+                    update_existing SMALLINT DEFAULT 0,
+                    status VARCHAR(20) DEFAULT 'running',
+                    byte_offset BIGINT DEFAULT 0,
+                    rows_done BIGINT DEFAULT 0,
+                    inserted BIGINT DEFAULT 0,
+                    skipped BIGINT DEFAULT 0,
+                    invalid BIGINT DEFAULT 0,
+                    chunks INT DEFAULT 0,
+                    error TEXT,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP NULL
+                ){suffix}
+            """)
+            self._execute(f"""
+                CREATE TABLE IF NOT EXISTS import_job_chunks (
+                    job_id INT NOT NULL,
+                    chunk_no INT NOT NULL,
+                    byte_offset BIGINT NOT NULL,
+                    rows_done BIGINT NOT NULL,
+                    rows_read INT NOT NULL,
+                    rows_written INT NOT NULL,
+                    seconds DOUBLE PRECISION NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (job_id, chunk_no)
+                ){suffix}
+            """)
+        self._add_index_if_missing('import_jobs', 'idx_import_jobs_file_hash', 'file_hash')
+
+        # Web 后台任务（见 job_queue.py）：状态变化时写入，任意 worker 都能查询进度；时间为 Unix 时间
+        id_column = {"sqlite": "INTEGER PRIMARY KEY AUTOINCREMENT", "postgresql": "SERIAL PRIMARY KEY",
+                     "mysql": "INT AUTO_INCREMENT PRIMARY KEY"}[self.db_type]
+        self._execute(f"""
+            CREATE TABLE IF NOT EXISTS background_jobs (
+                id {id_column},
+                kind VARCHAR(20) NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                progress REAL,
+                message VARCHAR(255),
+                result TEXT,
+                error TEXT,
+                queued_at DOUBLE PRECISION NOT NULL,
+                started_at DOUBLE PRECISION,
+                finished_at DOUBLE PRECISION,
+                heartbeat_at DOUBLE PRECISION
+            )
+        """)
+        # background_jobs.heartbeat_at：所在进程最近一次确认任务仍在排队或执行的时间
+        self._add_column_if_missing('background_jobs', 'heartbeat_at', 'DOUBLE PRECISION')
+
+        # send_logs.message_id：落盘 spool id 或 HTTP API 返回的消息 ID
+        self._add_column_if_missing('send_logs', 'message_id', 'VARCHAR(255)')
+        # send_logs.birthday_year：本次祝福对应的生日年份（补发跨年时不同于发送年份），合并发送位图时使用
+        self._add_column_if_missing('send_logs', 'birthday_year', 'INTEGER')
+
+        # send_logs 索引：按时间倒序分页、按状态 + 时间统计、按用户查找（及级联删除）
+        self._add_index_if_missing('send_logs', 'idx_send_logs_sent_at', 'sent_at')
+        self._add_index_if_missing('send_logs', 'idx_send_logs_status_sent_at', 'status, sent_at')
+        self._add_index_if_missing('send_logs', 'idx_send_logs_user_id', 'user_id')
+
+        # users.birthday_doy：生日在闰年日历中的序号，供即将过生日的区间查询使用
+        self._add_column_if_missing('users', 'birthday_doy', 'SMALLINT')
+        self._add_index_if_missing('users', 'idx_users_birthday_doy', 'birthday_doy')
+        self.conn.commit()
+        # 新建的统计表在建表语句提交之后再回填
+        if stats_created:
+            self.rebuild_send_stats()
+        self._ensure_search_index()
+        self._ensure_birthday_counts()
+        self.backfill_birthday_doy()
+
+    def _table_exists(self, table):
+        """表是否已存在"""
+        if self.db_type == "sqlite":
+            rows = self._execute(
+                "SELECT COUNT(*) AS cnt FROM sqlite_master WHERE type = 'table' AND name = ?", (table,), fetch=True
+            )
+        else:
+            schema = "current_schema()" if self.db_type == "postgresql" else "DATABASE()"
+            rows = self._execute(f"""
+                SELECT COUNT(*) AS cnt FROM information_schema.tables
+                WHERE table_schema = {schema} AND table_name = %s
+            """, (table,), fetch=True)
+        return rows[0]['cnt'] > 0
+
+    def _add_column_if_missing(self, table, column, column_type):
+        """为已有表补充新列（幂等）"""
+        if self.db_type == "sqlite":
+            columns = [row['name'] for row in self._execute(f"PRAGMA table_info({table})", fetch=True)]
+            if column not in columns:
+                self._execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        elif self.db_type == "postgresql":
+            self._execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}")
+        else:
+            rows = self._execute("""
+                SELECT COUNT(*) AS cnt FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            """, (table, column), fetch=True)
+            if not rows[0]['cnt']:
+                self._execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _add_index_if_missing(self, table, index, columns):
+        """创建索引（幂等）"""
+        if self.db_type == "mysql":
+            rows = self._execute("""
+                SELECT COUNT(*) AS cnt FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            """, (table, index), fetch=True)
+            if not rows[0]['cnt']:
+                self._execute(f"CREATE INDEX {index} ON {table} ({columns})")
+        else:
+            self._execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})")
+
+    def _ensure_search_index(self):
+        """
+        用户搜索索引（幂等）
+
+        - SQLite: users_fts（FTS5 外部内容表，前缀索引）+ 增删改触发器
+        - PostgreSQL: pg_trgm GIN 索引（lower(name) || ' ' || lower(email)）
+        - MySQL: name, email 上的 FULLTEXT 索引（ngram 分词，支持中文）
+        扩展或 FTS5 不可用时跳过，search_users 退回 LIKE 扫描
+        """
+        try:
+            if self.db_type == "sqlite":
+                exists = self._execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'", fetch=True
+                )
+                self._execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                        name, email, content='users', content_rowid='id', prefix='2 3'
+                    )
+                """)
+                self._execute("""
+                    CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+                        INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+                    END
+                """)
+                self._execute("""
+                    CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+                        INSERT INTO users_fts(users_fts, rowid, name, email)
+                        VALUES ('delete', old.id, old.name, old.email);
+                    END
+                """)
+                self._execute("""
+                    CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name, email ON users BEGIN
+                        INSERT INTO users_fts(users_fts, rowid, name, email)
+                        VALUES ('delete', old.id, old.name, old.email);
+                        INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+                    END
+                """)
+                if not exists:
+                    # 首次创建时为已有用户建立索引
+                    self._execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+            elif self.db_type == "postgresql":
+                self._execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                self._execute("""
+                    CREATE INDEX IF NOT EXISTS idx_users_search_trgm ON users
+                    USING gin ((lower(name) || ' ' || lower(email)) gin_trgm_ops)
+                """)
+            else:
+                rows = self._execute("""
+                    SELECT COUNT(*) AS cnt FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = 'ft_users_search'
+                """, fetch=True)
+                if not rows[0]['cnt']:
+                    self._execute("ALTER TABLE users ADD FULLTEXT INDEX ft_users_search (name, email) WITH PARSER ngram")
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"⚠️  [搜索索引] 创建失败，搜索将使用 LIKE 扫描: {e}")
+
+    def backfill_birthday_doy(self):
+        """为 birthday_doy 为空的用户补算生日序号（新增列后或绕过 DBManager 写入的数据）"""
+        rows = self._execute("SELECT id, dob FROM users WHERE birthday_doy IS NULL", fetch=True)
+        updates = [(birthday_day_of_year(row['dob']), row['id']) for row in rows]
+        updates = [u for u in updates if u[0] is not None]
+        if not updates:
+            return 0
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        self.conn.cursor().executemany(f"UPDATE users SET birthday_doy = {ph} WHERE id = {ph}", updates)
+        self.bump_table_versions('users')
+        self.conn.commit()
+        invalidate_user_cache()
+        invalidate_calendar()
+        return len(updates)
+
+    # ========== 表版本号 ==========
+
+    def bump_table_versions(self, *tables):
+        """写入后递增这些表的版本号（不提交，与写入同一事务）"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        self.conn.cursor().execute(
+            f"UPDATE table_versions SET version = version + 1, modified_at = {ph} "
+            f"WHERE table_name IN ({', '.join([ph] * len(tables))})",
+            (int(time.time()),) + tables
+        )
+
+    def get_table_versions(self, tables):
+        """这些表当前的版本号（与 tables 同序的元组）；table_versions 不存在时返回 None"""
+        return self.get_table_state(tables)[0]
+
+    def get_table_state(self, tables):
+        """
+        这些表的版本号和最后写入时间
+
+        Returns:
+            (versions, modified_at): 与 tables 同序的版本号元组、最近一次写入的 Unix 时间（从未写入为 0）；
+            table_versions 不存在时为 (None, 0)
+        """
+        if not tables:
+            return (), 0
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        try:
+            rows = self._execute(
+                f"SELECT table_name, version, modified_at FROM table_versions "
+                f"WHERE table_name IN ({', '.join([ph] * len(tables))})",
+                tuple(tables), fetch=True
+            )
+        except (sqlite3.Error, psycopg2.Error, pymysql.err.Error):
+            self.conn.rollback()
+            return None, 0
+        versions = {row['table_name']: int(row['version']) for row in rows}
+        modified_at = max([int(row['modified_at']) for row in rows] or [0])
+        return tuple(versions.get(table, 0) for table in tables), modified_at
+
+    # ========== 任务运行标记 ==========
 
+    def get_last_completed_run(self, job_name):
+        """获取任务最近一次完成的日期（date），从未完成返回 None"""
+        if self.db_type == "sqlite":
+            sql = "SELECT last_run_date FROM job_runs WHERE job_name = ?"
+        else:
+            sql = "SELECT last_run_date FROM job_runs WHERE job_name = %s"
+        rows = self._execute(sql, (job_name,), fetch=True)
+        if not rows:
+            return None
+        value = rows[0]['last_run_date']
+        if isinstance(value, str):
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        return value
+
+    def mark_job_completed(self, job_name, run_date):
+        """记录任务完成日期（只前进不后退）"""
+        run_date = run_date.strftime('%Y-%m-%d')
         if self.db_type == "sqlite":
-            # SQLite 日期函数
             sql = """
-                SELECT id, name, email, dob
-                FROM users
-                WHERE cast(strftime('%m', dob) as integer) = ?
-                  AND cast(strftime('%d', dob) as integer) = ?
-                  AND (last_sent_year IS NULL OR last_sent_year < ?)
-                ORDER BY id
+                INSERT INTO job_runs (job_name, last_run_date, completed_at)
+                VALUES (?, ?, datetime('now'))
+                ON CONFLICT(job_name) DO UPDATE SET
+                    last_run_date = MAX(last_run_date, excluded.last_run_date),
+                    completed_at = excluded.completed_at
             """
-            return self._execute(sql, (today.month, today.day, today.year), fetch=True)
         elif self.db_type == "postgresql":
-            # PostgreSQL 日期函数
             sql = """
-                SELECT id, name, email, dob
-                FROM users
-                WHERE EXTRACT(MONTH FROM dob) = %s
-                  AND EXTRACT(DAY FROM dob) = %s
-                  AND (last_sent_year IS NULL OR last_sent_year < %s)
-                ORDER BY id
+                INSERT INTO job_runs (job_name, last_run_date, completed_at)
+                VALUES (%s, %s, NOW())
+                ON CONFLICT (job_name) DO UPDATE SET
+                    last_run_date = GREATEST(job_runs.last_run_date, EXCLUDED.last_run_date),
+                    completed_at = EXCLUDED.completed_at
             """
-            return self._execute(sql, (today.month, today.day, today.year), fetch=True)
         else:
-            # MySQL 日期函数
             sql = """
-                SELECT id, name, email, dob
-                FROM users
-                WHERE MONTH(dob) = %s
-                  AND DAY(dob) = %s
-                  AND (last_sent_year IS NULL OR last_sent_year < %s)
-                ORDER BY id
+                INSERT INTO job_runs (job_name, last_run_date, completed_at)
+                VALUES (%s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                    last_run_date = GREATEST(last_run_date, VALUES(last_run_date)),
+                    completed_at = VALUES(completed_at)
             """
-            return self._execute(sql, (today.month, today.day, today.year), fetch=True)
+        self._execute(sql, (job_name, run_date))
+        self.conn.commit()
 
-    def update_send_status(self, user_id, success=True, error_msg=None):
-        """更新用户发送状态"""
-        if success:
-            if self.db_type == "sqlite":
-                sql = "UPDATE users SET last_sent_year = ? WHERE id = ?"
-                self._execute(sql, (datetime.now().year, user_id))
-                log_sql = """
-                    INSERT INTO send_logs (user_id, sent_at, status)
-                    VALUES (?, datetime('now'), 'success')
-                """
-                self._execute(log_sql, (user_id,))
-            else:
-                # MySQL 和 PostgreSQL 都使用 %s 和 NOW()
-                sql = "UPDATE users SET last_sent_year = %s WHERE id = %s"
-                self._execute(sql, (datetime.now().year, user_id))
-                log_sql = """
-                    INSERT INTO send_logs (user_id, sent_at, status)
-                    VALUES (%s, NOW(), 'success')
-                """
-                self._execute(log_sql, (user_id,))
+    # ========== 生日相关 ==========
+
+    def get_todays_birthdays(self):
+        """
+        获取今天过生日且今年未发送的用户
+
+        走 birthday_doy 索引；非闰年的 2 月 28 日同时包括 2 月 29 日出生的用户
+        """
+        self.backfill_birthday_doy()
+        today = datetime.now()
+        doys = observed_doys(today.date())
+
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        sql = f"""
+            SELECT id, name, email, dob
+            FROM users
+            WHERE birthday_doy IN ({', '.join([ph] * len(doys))})
+              AND (last_sent_year IS NULL OR last_sent_year < {ph})
+            ORDER BY id
+        """
+        return self._execute(sql, (*doys, today.year), fetch=True)
+
+    def get_missed_birthdays(self, start_date, end_date):
+        """
+        获取生日落在 (start_date, end_date] 区间内、且当年尚未发送的用户
+
+        区间最长一年，跨年时按 birthday_doy 拆成两段；"当年"指该次生日所在的年份
+
+        Args:
+            start_date: 上次完成运行的日期（不含）
+            end_date: 补发截止日期（含）
+
+        Returns:
+            list: 用户列表，附带 birthday_year 字段
+        """
+        start_doy = birthday_day_of_year(start_date)
+        end_doy = birthday_day_of_year(end_date)
+        # 非闰年 2 月 29 日出生的用户按 2 月 28 日过生日
+        if not is_leap(start_date.year) and (start_date.month, start_date.day) == (2, 28):
+            start_doy = 60
+        if not is_leap(end_date.year) and (end_date.month, end_date.day) == (2, 28):
+            end_doy = 60
+
+        # 在 birthday_doy 索引上做区间查询
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        sql = f"""
+            SELECT id, name, email, dob, {ph} AS birthday_year
+            FROM users
+            WHERE birthday_doy > {ph} AND birthday_doy <= {ph}
+              AND (last_sent_year IS NULL OR last_sent_year < {ph})
+            ORDER BY birthday_doy, id
+        """
+        if start_date.year == end_date.year:
+            return self._execute(sql, (end_date.year, start_doy, end_doy, end_date.year), fetch=True)
+        # 跨年: (start, 12-31] + [01-01, end]
+        rows = self._execute(sql, (start_date.year, start_doy, 366, start_date.year), fetch=True)
+        return rows + self._execute(sql, (end_date.year, 0, end_doy, end_date.year), fetch=True)
+
+    def get_upcoming_birthdays(self, limit=10, within_days=30):
+        """
+        获取未来 within_days 天内过生日的前 limit 位用户（含今天）
+
+        在 birthday_doy 索引上做区间查询，跨年时拆成两段，只取 LIMIT 行；
+        非闰年中 2 月 29 日出生的用户按 2 月 28 日计算
+
+        Returns:
+            list: 用户列表，附带 days_until_birthday、next_birthday 字段
+        """
+        today = datetime.now().date()
+        end = today + timedelta(days=within_days)
+        start_doy = birthday_day_of_year(today)
+        end_doy = birthday_day_of_year(end)
+        if not is_leap(end.year) and (end.month, end.day) == (2, 28):
+            end_doy = 60
+
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        sql = f"""
+            SELECT id, name, email, dob, last_sent_year, birthday_doy
+            FROM users
+            WHERE birthday_doy >= {ph} AND birthday_doy <= {ph}
+            ORDER BY birthday_doy, id
+            LIMIT {ph}
+        """
+        if end.year == today.year and end_doy >= start_doy:
+            rows = self._execute(sql, (start_doy, end_doy, limit), fetch=True)
         else:
-            # 记录失败日志
-            if self.db_type == "sqlite":
-                log_sql = """
-                    INSERT INTO send_logs (user_id, sent_at, status, error_msg)
-                    VALUES (?, datetime('now'), 'failed', ?)
-                """
-                self._execute(log_sql, (user_id, error_msg))
-            else:
-                log_sql = """
-                    INSERT INTO send_logs (user_id, sent_at, status, error_msg)
-                    VALUES (%s, NOW(), 'failed', %s)
-                """
-                self._execute(log_sql, (user_id, error_msg))
+            # 跨年: [今天, 12-31] + [01-01, 截止日]
+            rows = self._execute(sql, (start_doy, 366, limit), fetch=True)
+            if len(rows) < limit:
+                rows += self._execute(sql, (1, end_doy, limit - len(rows)), fetch=True)
 
+        result = []
+        for row in rows:
+            month, day = doy_to_month_day(row['birthday_doy'])
+            when = next_birthday(date(2000, month, day), today)
+            if (when - today).days > within_days:
+                continue
+            row['next_birthday'] = when
+            row['days_until_birthday'] = (when - today).days
+            result.append(row)
+        return result
+
+    def update_send_status(self, user_id, success=True, error_msg=None, year=None, message_id=None):
+        """
+        更新用户发送状态
+
+        Args:
+            year: 本次祝福对应的生日年份（补发跨年时使用），默认今年
+            message_id: 落盘 spool id 或 HTTP API 返回的消息 ID（可选）
+        """
+        self.record_send_results([(user_id, success, error_msg, year, message_id)])
+
+    def record_send_results(self, results):
+        """
+        批量记录发送结果（同一事务，executemany）
+
+        Args:
+            results: [(user_id, success, error_msg, year, message_id), ...]
+        """
+        current_year = datetime.now().year
+        sent = [(year or current_year, user_id) for user_id, success, _, year, _ in results if success]
+        logs = [
+            (user_id, 'success' if success else 'failed', None if success else error_msg, message_id,
+             year or current_year)
+            for user_id, success, error_msg, year, message_id in results
+        ]
+
+        if self.db_type == "sqlite":
+            update_sql = "UPDATE users SET last_sent_year = ?, updated_at = datetime('now') WHERE id = ?"
+            log_sql = """
+                INSERT INTO send_logs (user_id, sent_at, status, error_msg, message_id, birthday_year)
+                VALUES (?, datetime('now'), ?, ?, ?, ?)
+            """
+        else:
+            # MySQL 和 PostgreSQL 都使用 %s 和 NOW()
+            update_sql = "UPDATE users SET last_sent_year = %s, updated_at = NOW() WHERE id = %s"
+            log_sql = """
+                INSERT INTO send_logs (user_id, sent_at, status, error_msg, message_id, birthday_year)
+                VALUES (%s, NOW(), %s, %s, %s, %s)
+            """
+
+        # 同一事务内累加当天的统计汇总
+        counts = {}
+        for _, status, error_msg, _, _ in logs:
+            key = (status, classify_error_message(error_msg))
+            counts[key] = counts.get(key, 0) + 1
+
+        cursor = self.conn.cursor()
+        if sent:
+            cursor.executemany(update_sql, sent)
+            self.bump_table_versions('users')
+        if logs:
+            cursor.executemany(log_sql, logs)
+            cursor.executemany(self._send_stats_upsert_sql(),
+                               [(status, error_class, n) for (status, error_class), n in counts.items()])
         self.conn.commit()
 
+        for year in {year for year, _ in sent}:
+            notify_sent([user_id for sent_year, user_id in sent if sent_year == year], year)
+
+    # ========== 发送位图 ==========
+
+    def get_sent_bitmap_version(self, year):
+        """数据库中某年位图的版本号，没有返回 None"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(f"SELECT version FROM sent_bitmaps WHERE year = {ph}", (year,), fetch=True)
+        return rows[0]['version'] if rows else None
+
+    def load_sent_bitmap(self, year):
+        """
+        加载某年的发送位图
+
+        数据库中没有时由 users.last_sent_year = year 生成并保存；
+        更早的年份只能还原出之后没有再发送过的用户
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(
+            f"SELECT bits, log_id, version FROM sent_bitmaps WHERE year = {ph}", (year,), fetch=True
+        )
+        if rows:
+            row = rows[0]
+            return SentBitmap(year, bytes(row['bits']), row['log_id'], row['version'])
+
+        log_id = self._execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM send_logs", fetch=True)[0]['max_id']
+        bitmap = SentBitmap(year, log_id=log_id)
+        for row in self.iter_query(f"SELECT id FROM users WHERE last_sent_year = {ph}", (year,)):
+            bitmap.add(row['id'])
+        self.save_sent_bitmap(bitmap)
+        return bitmap
+
+    def merge_sent_logs(self, bitmap):
+        """
+        把 bitmap.log_id 之后新增的成功发送合并进位图，返回扫描的日志条数
+
+        年份取日志中记录的生日年份（加这一列之前的旧日志取用户当前的 last_sent_year）；
+        log_id 推进到扫描过的最后一条日志（含失败的），下次不再重复扫描
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(f"""
+            SELECT l.id, l.user_id, l.status, COALESCE(l.birthday_year, u.last_sent_year) AS birthday_year
+            FROM send_logs l LEFT JOIN users u ON u.id = l.user_id
+            WHERE l.id > {ph}
+            ORDER BY l.id
+        """, (bitmap.log_id,), fetch=True)
+        for row in rows:
+            if row['status'] == 'success' and row['birthday_year'] == bitmap.year:
+                bitmap.add(row['user_id'])
+        if rows:
+            bitmap.log_id = rows[-1]['id']
+            bitmap.dirty = True
+        return len(rows)
+
+    def save_sent_bitmap(self, bitmap):
+        """
+        保存位图（按 version 乐观并发）
+
+        Returns:
+            bool: 是否保存成功；False 表示其他进程已改写，调用方应重新加载
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        now = "datetime('now')" if self.db_type == "sqlite" else "NOW()"
+        bits = bitmap.to_bytes()
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            UPDATE sent_bitmaps SET bits = {ph}, log_id = {ph}, version = version + 1, updated_at = {now}
+            WHERE year = {ph} AND version = {ph}
+        """, (bits, bitmap.log_id, bitmap.year, bitmap.version))
+        saved = cursor.rowcount == 1
+        if not saved and self.get_sent_bitmap_version(bitmap.year) is None:
+            cursor.execute(f"""
+                INSERT INTO sent_bitmaps (year, bits, log_id, version) VALUES ({ph}, {ph}, {ph}, {ph})
+            """, (bitmap.year, bits, bitmap.log_id, bitmap.version + 1))
+            saved = True
+        self.conn.commit()
+        if saved:
+            bitmap.version += 1
+            bitmap.dirty = False
+        return saved
+
+    def sync_user_sent_bitmaps(self, user_id, last_sent_year):
+        """
+        手工修改 last_sent_year 后改写已保存的位图：
+        该年置位，之后的年份清除（重新变为未发送），更早的年份不变
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(
+            f"SELECT year FROM sent_bitmaps WHERE year >= {ph}", (last_sent_year or 0,), fetch=True
+        )
+        for row in rows:
+            bitmap = self.load_sent_bitmap(row['year'])
+            if bitmap.year == last_sent_year:
+                bitmap.add(user_id)
+            else:
+                bitmap.discard(user_id)
+            if bitmap.dirty:
+                self.save_sent_bitmap(bitmap)
+        forget_sent_bitmaps()
+
+    def get_missed_users(self, year, through=None):
+        """
+        某年生日已过（截至 through，默认今天或年末）却没有发送成功的用户
+
+        只读 users 的 id / 生日序号，成员判断在位图上向量化完成，不扫描 send_logs
+        """
+        import numpy as np
+        through = min(through or date.today(), date(year, 12, 31))
+        last_doy = birthday_day_of_year(through)
+        if not is_leap(year) and (through.month, through.day) == (2, 28):
+            # 非闰年 2 月 29 日出生的用户在 2 月 28 日过生日
+            last_doy = LEAP_DAY_DOY
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(
+            f"SELECT id FROM users WHERE birthday_doy <= {ph} ORDER BY id", (last_doy,), fetch=True
+        )
+        ids = np.fromiter((row['id'] for row in rows), dtype=np.int64, count=len(rows))
+        missed = ids[~get_sent_bitmap(self, year).contains_many(ids)]
+        users = []
+        for start in range(0, len(missed), 500):
+            batch = missed[start:start + 500].tolist()
+            users += self._execute(
+                f"SELECT id, name, email, dob, last_sent_year FROM users WHERE id IN ({', '.join([ph] * len(batch))})",
+                tuple(batch), fetch=True
+            )
+        return sorted(users, key=lambda user: user['id'])
+
     # ========== 祝福语相关 ==========
 
     def get_random_wish(self):
@@ -195,6 +862,12 @@ class DBManager:
         rows = self._execute(sql, fetch=True)
         return rows[0]['content'] if rows else "生日快乐！愿你天天开心，万事如意！"
 
+    def get_active_wishes(self):
+        """获取所有启用的祝福语内容（批量生成时在内存中随机挑选）"""
+        rows = cached(self, 'active_wishes', ('wishes',),
+                      lambda: self._execute("SELECT content FROM wishes WHERE is_active = 1", fetch=True))
+        return [row['content'] for row in rows] or ["生日快乐！愿你天天开心，万事如意！"]
+
     def add_wish(self, content, category='general'):
         """添加祝福语"""
         if self.db_type == "sqlite":
@@ -207,30 +880,613 @@ class DBManager:
         return True
 
     def get_all_wishes(self):
-        """获取所有祝福语"""
+        """获取所有祝福语（缓存，祝福语变更后失效）"""
         sql = "SELECT * FROM wishes ORDER BY category, id"
-        return self._execute(sql, fetch=True)
+        return cached(self, 'all_wishes', ('wishes',), lambda: self._execute(sql, fetch=True))
 
     # ========== 用户管理 ==========
 
     def add_user(self, name, email, dob):
         """添加单个用户"""
+        doy = birthday_day_of_year(dob)
+        cursor = self.conn.cursor()
         if self.db_type == "sqlite":
-            sql = "INSERT OR IGNORE INTO users (name, email, dob) VALUES (?, ?, ?)"
-            self._execute(sql, (name, email, dob))
+            sql = "INSERT OR IGNORE INTO users (name, email, dob, birthday_doy) VALUES (?, ?, ?, ?)"
         else:
-            sql = "INSERT IGNORE INTO users (name, email, dob) VALUES (%s, %s, %s)"
-            self._execute(sql, (name, email, dob))
+            sql = "INSERT IGNORE INTO users (name, email, dob, birthday_doy) VALUES (%s, %s, %s, %s)"
+        cursor.execute(sql, (name, email, dob, doy))
+        self.bump_table_versions('users')
         self.conn.commit()
+        invalidate_user_cache()
+        if cursor.rowcount:
+            notify_user_changed(cursor.lastrowid, dob)
         return True
 
+    def find_existing_emails(self, emails):
+        """返回 emails 中已存在于 users 表的邮箱集合（走 email 唯一索引，一次查询）"""
+        if not emails:
+            return set()
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(
+            f"SELECT email FROM users WHERE email IN ({', '.join([ph] * len(emails))})",
+            tuple(emails), fetch=True
+        )
+        return {row['email'] for row in rows}
+
+    def _upsert_users_sql(self, rows_per_statement, update_existing=False):
+        """users 批量写入语句（每行 name, email, dob, birthday_doy；邮箱冲突时跳过或更新）"""
+        if self.db_type == "sqlite":
+            values = ', '.join(['(?, ?, ?, ?)'] * rows_per_statement)
+            if update_existing:
+                conflict = """ON CONFLICT(email) DO UPDATE SET name = excluded.name, dob = excluded.dob,
+                              birthday_doy = excluded.birthday_doy, updated_at = datetime('now')"""
+            else:
+                conflict = "ON CONFLICT(email) DO NOTHING"
+            return f"INSERT INTO users (name, email, dob, birthday_doy) VALUES {values} {conflict}"
+        values = ', '.join(['(%s, %s, %s, %s)'] * rows_per_statement)
+        if self.db_type == "postgresql":
+            if update_existing:
+                conflict = """ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name, dob = EXCLUDED.dob,
+                              birthday_doy = EXCLUDED.birthday_doy, updated_at = NOW()"""
+            else:
+                conflict = "ON CONFLICT (email) DO NOTHING"
+            return f"INSERT INTO users (name, email, dob, birthday_doy) VALUES {values} {conflict}"
+        if update_existing:
+            return f"""INSERT INTO users (name, email, dob, birthday_doy) VALUES {values}
+                       ON DUPLICATE KEY UPDATE name = VALUES(name), dob = VALUES(dob),
+                       birthday_doy = VALUES(birthday_doy), updated_at = NOW()"""
+        return f"INSERT IGNORE INTO users (name, email, dob, birthday_doy) VALUES {values}"
+
+    def upsert_users(self, users, update_existing=False, commit=True):
+        """
+        多行 INSERT 批量写入用户（一条语句、一次提交）
+
+        Args:
+            users: [(name, email, dob), ...]，dob 为 YYYY-MM-DD
+            update_existing: 邮箱已存在时更新姓名和生日（否则跳过）
+            commit: 是否立即提交（False 时由调用方与检查点一起提交）
+
+        Returns:
+            int: 受影响的行数
+        """
+        if not users:
+            return 0
+        rows = [(name, email, dob, birthday_day_of_year(dob)) for name, email, dob in users]
+        cursor = self.conn.cursor()
+        cursor.execute(self._upsert_users_sql(len(rows), update_existing),
+                       tuple(value for row in rows for value in row))
+        self.bump_table_versions('users')
+        if commit:
+            self.conn.commit()
+        invalidate_user_cache()
+        invalidate_calendar()
+        return cursor.rowcount
+
+    # 由 dob 推导闰年日历序号的 SQL 表达式（批量装载时与插入在同一条语句中计算）
+    _DOY_SQL = {
+        "sqlite": "CAST(strftime('%j', '2000-' || substr(dob, 6, 5)) AS INTEGER)",
+        "postgresql": "EXTRACT(DOY FROM to_date('2000-' || to_char(dob, 'MM-DD'), 'YYYY-MM-DD'))::int",
+        "mysql": "DAYOFYEAR(CONCAT('2000-', DATE_FORMAT(dob, '%m-%d')))",
+    }
+
+    def bulk_load_users(self, users, update_existing=False, commit=True):
+        """
+        用数据库原生装载方式批量写入用户：先装入临时表，再一条 INSERT ... SELECT 合并到 users
+
+        - PostgreSQL: COPY ... FROM STDIN（copy_expert）
+        - MySQL: LOAD DATA LOCAL INFILE（服务器未开启 local_infile 时退回 executemany）
+        - SQLite: 同一事务内 executemany 写入临时表
+
+        Args:
+            users: [(name, email, dob), ...]，dob 为 YYYY-MM-DD，同一批内邮箱不重复
+            update_existing: 邮箱已存在时更新姓名和生日（否则跳过）
+            commit: 是否立即提交（False 时由调用方与检查点一起提交）
+
+        Returns:
+            int: 新增（或更新）的行数
+        """
+        if not users:
+            return 0
+        cursor = self.conn.cursor()
+        try:
+            if self.db_type == "postgresql":
+                cursor.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS import_staging (
+                        name VARCHAR(100), email VARCHAR(100), dob DATE
+                    ) ON COMMIT DELETE ROWS
+                """)
+                buffer = io.StringIO()
+                csv.writer(buffer, lineterminator='\n').writerows(users)
+                buffer.seek(0)
+                cursor.copy_expert("COPY import_staging (name, email, dob) FROM STDIN WITH (FORMAT csv)", buffer)
+            elif self.db_type == "mysql":
+                cursor.execute("""
+                    CREATE TEMPORARY TABLE IF NOT EXISTS import_staging (
+                        name VARCHAR(100), email VARCHAR(100), dob DATE
+                    ) DEFAULT CHARSET=utf8mb4
+                """)
+                cursor.execute("DELETE FROM import_staging")
+                self._load_data_infile(cursor, users)
+            else:
+                cursor.execute("CREATE TEMP TABLE IF NOT EXISTS import_staging (name TEXT, email TEXT, dob TEXT)")
+                cursor.execute("DELETE FROM import_staging")
+                cursor.executemany("INSERT INTO import_staging (name, email, dob) VALUES (?, ?, ?)", users)
+
+            cursor.execute(self._merge_staging_sql(update_existing))
+            affected = cursor.rowcount
+            self.bump_table_versions('users')
+            if commit:
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        invalidate_user_cache()
+        invalidate_calendar()
+        return affected
+
+    def _load_data_infile(self, cursor, users):
+        """MySQL: 写入临时 CSV 后 LOAD DATA LOCAL INFILE；不支持时逐批 executemany"""
+        fd, path = tempfile.mkstemp(prefix='import-', suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f, lineterminator='\n').writerows(users)
+            cursor.execute("""
+                LOAD DATA LOCAL INFILE %s INTO TABLE import_staging CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+                LINES TERMINATED BY '\\n' (name, email, dob)
+            """, (path,))
+        except pymysql.err.OperationalError as e:
+            print(f"⚠️  [批量装载] LOAD DATA 不可用，改用 executemany: {e}")
+            cursor.executemany("INSERT INTO import_staging (name, email, dob) VALUES (%s, %s, %s)", users)
+        finally:
+            os.remove(path)
+
+    def _merge_staging_sql(self, update_existing):
+        """临时表 -> users（生日序号在同一条语句中推导）"""
+        select = f"SELECT name, email, dob, {self._DOY_SQL[self.db_type]} FROM import_staging"
+        insert = "INSERT INTO users (name, email, dob, birthday_doy)"
+        if self.db_type == "mysql":
+            if update_existing:
+                return f"""{insert} {select}
+                           ON DUPLICATE KEY UPDATE name = VALUES(name), dob = VALUES(dob),
+                           birthday_doy = VALUES(birthday_doy), updated_at = NOW()"""
+            return f"INSERT IGNORE INTO users (name, email, dob, birthday_doy) {select}"
+        if self.db_type == "sqlite":
+            # SQLite 的 INSERT ... SELECT ... ON CONFLICT 需要 WHERE 子句消除语法歧义
+            select += " WHERE true"
+            now = "datetime('now')"
+        else:
+            now = "NOW()"
+        if update_existing:
+            return f"""{insert} {select}
+                       ON CONFLICT (email) DO UPDATE SET name = excluded.name, dob = excluded.dob,
+                       birthday_doy = excluded.birthday_doy, updated_at = {now}"""
+        return f"{insert} {select} ON CONFLICT (email) DO NOTHING"
+
+    # ========== 导入任务检查点 ==========
+
+    def create_import_job(self, file_name, file_hash, file_size, source='cli', update_existing=False):
+        """登记一次导入，返回任务 ID"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        sql = f"""
+            INSERT INTO import_jobs (file_name, file_hash, file_size, source, update_existing)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+        """
+        params = (file_name, file_hash, file_size, source, int(update_existing))
+        cursor = self.conn.cursor()
+        if self.db_type == "postgresql":
+            cursor.execute(sql + " RETURNING id", params)
+            job_id = cursor.fetchone()[0]
+        else:
+            cursor.execute(sql, params)
+            job_id = cursor.lastrowid
+        self.conn.commit()
+        return job_id
+
+    def find_resumable_import_job(self, file_hash):
+        """同一文件最近一次未完成（进行中、中断或失败）的导入，没有返回 None"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(f"""
+            SELECT * FROM import_jobs
+            WHERE file_hash = {ph} AND status IN ('running', 'failed')
+            ORDER BY id DESC LIMIT 1
+        """, (file_hash,), fetch=True)
+        return rows[0] if rows else None
+
+    def claim_import_job(self, job_id):
+        """
+        接管未完成的导入（条件 UPDATE），成功返回 True
+
+        只有失败的任务，或 IMPORT_STALE_MINUTES 分钟内没有新检查点的 running 任务（进程已退出）可以接管；
+        接管时刷新 updated_at，两个进程同时接管同一任务只有一个能成功
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        minutes = int(Config.IMPORT_STALE_MINUTES)
+        if self.db_type == "sqlite":
+            now, cutoff = "datetime('now')", f"datetime('now', '-{minutes} minutes')"
+        elif self.db_type == "postgresql":
+            now, cutoff = "NOW()", f"NOW() - INTERVAL '{minutes} minutes'"
+        else:
+            now, cutoff = "NOW()", f"NOW() - INTERVAL {minutes} MINUTE"
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            UPDATE import_jobs SET status = 'running', error = NULL, updated_at = {now}
+            WHERE id = {ph} AND (status = 'failed' OR (status = 'running' AND updated_at < {cutoff}))
+        """, (job_id,))
+        claimed = cursor.rowcount == 1
+        self.conn.commit()
+        return claimed
+
+    def save_import_checkpoint(self, job_id, chunk_no, byte_offset, rows_done, rows_read, rows_written,
+                               seconds, inserted, skipped, invalid):
+        """
+        记录一批的检查点并提交
+
+        与该批数据在同一个事务中提交：数据写入了，检查点一定也在
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        now = "datetime('now')" if self.db_type == "sqlite" else "NOW()"
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO import_job_chunks (job_id, chunk_no, byte_offset, rows_done, rows_read, rows_written, seconds)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+        """, (job_id, chunk_no, byte_offset, rows_done, rows_read, rows_written, round(seconds, 4)))
+        cursor.execute(f"""
+            UPDATE import_jobs SET status = 'running', byte_offset = {ph}, rows_done = {ph}, inserted = {ph},
+                   skipped = {ph}, invalid = {ph}, chunks = {ph}, error = NULL, updated_at = {now}
+            WHERE id = {ph}
+        """, (byte_offset, rows_done, inserted, skipped, invalid, chunk_no, job_id))
+        self.conn.commit()
+
+    def finish_import_job(self, job_id, status='done', error=None):
+        """标记导入结束（done / failed）"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        now = "datetime('now')" if self.db_type == "sqlite" else "NOW()"
+        self._execute(f"""
+            UPDATE import_jobs SET status = {ph}, error = {ph}, updated_at = {now}, finished_at = {now}
+            WHERE id = {ph}
+        """, (status, error, job_id))
+        self.conn.commit()
+
+    def get_import_job(self, job_id):
+        """按 ID 获取导入任务记录"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(f"SELECT * FROM import_jobs WHERE id = {ph}", (job_id,), fetch=True)
+        return rows[0] if rows else None
+
+    def get_import_jobs(self, limit=20):
+        """最近的导入任务"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        return self._execute(f"SELECT * FROM import_jobs ORDER BY id DESC LIMIT {ph}", (limit,), fetch=True)
+
+    def get_import_job_chunks(self, job_id):
+        """导入任务每一批的检查点和耗时"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        return self._execute(
+            f"SELECT * FROM import_job_chunks WHERE job_id = {ph} ORDER BY chunk_no", (job_id,), fetch=True
+        )
+
+    # ========== Web 后台任务 ==========
+
+    def create_background_job(self, kind, queued_at):
+        """登记一个后台任务，返回任务 ID；顺带清理一天前结束的任务"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        sql = f"""INSERT INTO background_jobs (kind, status, queued_at, heartbeat_at)
+                  VALUES ({ph}, 'queued', {ph}, {ph})"""
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM background_jobs WHERE finished_at < {ph}", (queued_at - 86400,))
+        if self.db_type == "postgresql":
+            cursor.execute(sql + " RETURNING id", (kind, queued_at, queued_at))
+            job_id = cursor.fetchone()[0]
+        else:
+            cursor.execute(sql, (kind, queued_at, queued_at))
+            job_id = cursor.lastrowid
+        self.conn.commit()
+        return job_id
+
+    def update_background_job(self, job_id, **fields):
+        """更新后台任务的状态、进度、结果等字段"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        columns = ', '.join(f"{column} = {ph}" for column in fields)
+        self._execute(f"UPDATE background_jobs SET {columns} WHERE id = {ph}", tuple(fields.values()) + (job_id,))
+        self.conn.commit()
+
+    def touch_background_jobs(self, job_ids, now):
+        """刷新本进程内未结束任务的心跳"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        self._execute(
+            f"UPDATE background_jobs SET heartbeat_at = {ph} WHERE id IN ({', '.join([ph] * len(job_ids))})",
+            (now,) + tuple(job_ids)
+        )
+        self.conn.commit()
+
+    def fail_stale_background_jobs(self, before, now):
+        """
+        把心跳早于 before 的排队中 / 执行中任务标记为失败，返回标记的条数
+
+        任务只在提交它的进程内执行，进程退出（重启、崩溃、部署）后它们不会再有人更新
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            UPDATE background_jobs SET status = 'failed', error = {ph}, finished_at = {ph}
+            WHERE status IN ('queued', 'running') AND COALESCE(heartbeat_at, queued_at) < {ph}
+        """, ("任务所在的进程已退出，任务未完成", now, before))
+        count = cursor.rowcount
+        self.conn.commit()
+        return count
+
+    def get_background_job(self, job_id):
+        """按 ID 获取后台任务记录"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(f"SELECT * FROM background_jobs WHERE id = {ph}", (job_id,), fetch=True)
+        return rows[0] if rows else None
+
+    def get_user(self, user_id):
+        """按 ID 获取用户，不存在返回 None"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(f"SELECT * FROM users WHERE id = {ph}", (user_id,), fetch=True)
+        return rows[0] if rows else None
+
+    def update_user(self, user_id, name, email, dob, last_sent_year=None):
+        """更新用户信息（同时更新生日序号）"""
+        old = self.get_user(user_id)
+        doy = birthday_day_of_year(dob)
+        if self.db_type == "sqlite":
+            sql = """UPDATE users SET name=?, email=?, dob=?, birthday_doy=?, last_sent_year=?,
+                     updated_at=datetime('now') WHERE id=?"""
+        else:
+            sql = """UPDATE users SET name=%s, email=%s, dob=%s, birthday_doy=%s, last_sent_year=%s,
+                     updated_at=NOW() WHERE id=%s"""
+        self._execute(sql, (name, email, dob, doy, last_sent_year, user_id))
+        self.conn.commit()
+        invalidate_user_cache()
+        if old:
+            notify_user_changed(user_id, dob, old['dob'])
+            if old['last_sent_year'] != last_sent_year:
+                self.sync_user_sent_bitmaps(user_id, last_sent_year)
+
+    def delete_user(self, user_id):
+        """删除用户（级联删除相关日志）"""
+        old = self.get_user(user_id)
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        self._execute(f"DELETE FROM users WHERE id = {ph}", (user_id,))
+        self.conn.commit()
+        invalidate_user_cache()
+        if old:
+            notify_user_deleted(user_id, old['dob'])
+
+    def get_users_by_ids(self, user_ids):
+        """按 ID 批量获取用户，按传入顺序返回（已删除的跳过）"""
+        if not user_ids:
+            return []
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(
+            f"SELECT * FROM users WHERE id IN ({', '.join([ph] * len(user_ids))})",
+            tuple(user_ids), fetch=True
+        )
+        by_id = {row['id']: row for row in rows}
+        return [by_id[user_id] for user_id in user_ids if user_id in by_id]
+
+    def search_users(self, query, limit=50, after=0):
+        """
+        按姓名或邮箱搜索用户（前缀匹配），按 ID 分页
+
+        Args:
+            query: 搜索词，空白分隔的多个词需同时匹配
+            limit: 每页最多返回多少位
+            after: 上一页最后一个用户 ID（键集分页，从 0 开始）
+
+        Returns:
+            list: 用户列表，按 ID 升序
+        """
+        terms = re.findall(r'\w+', (query or '').lower())
+        if not terms:
+            return []
+        limit = int(limit)
+        after = int(after or 0)
+
+        try:
+            if self.db_type == "sqlite":
+                # FTS5：每个词加引号防止被当作语法，* 表示前缀
+                match = ' '.join(f'"{term}"*' for term in terms)
+                sql = """
+                    SELECT u.* FROM users_fts f JOIN users u ON u.id = f.rowid
+                    WHERE users_fts MATCH ? AND f.rowid > ?
+                    ORDER BY f.rowid LIMIT ?
+                """
+                return self._execute(sql, (match, after, limit), fetch=True)
+            if self.db_type == "postgresql":
+                # 与 pg_trgm 索引相同的表达式；LIKE '%词%' 可以走三元组索引
+                conditions = ' AND '.join(["lower(name) || ' ' || lower(email) LIKE %s"] * len(terms))
+                sql = f"SELECT * FROM users WHERE {conditions} AND id > %s ORDER BY id LIMIT %s"
+                return self._execute(sql, (*[f"%{term}%" for term in terms], after, limit), fetch=True)
+            # MySQL 布尔模式：+词* 表示必须出现的前缀
+            match = ' '.join(f'+{term}*' for term in terms)
+            sql = """
+                SELECT * FROM users
+                WHERE MATCH(name, email) AGAINST (%s IN BOOLEAN MODE) AND id > %s
+                ORDER BY id LIMIT %s
+            """
+            return self._execute(sql, (match, after, limit), fetch=True)
+        except (sqlite3.OperationalError, pymysql.err.InternalError, pymysql.err.OperationalError):
+            # 搜索索引不存在时退回 LIKE 扫描
+            return self._search_users_like(terms, limit, after)
+
+    def _search_users_like(self, terms, limit, after):
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        conditions = ' AND '.join([f"(lower(name) LIKE {ph} OR lower(email) LIKE {ph})"] * len(terms))
+        params = [p for term in terms for p in (f"%{term}%", f"%{term}%")]
+        sql = f"SELECT * FROM users WHERE {conditions} AND id > {ph} ORDER BY id LIMIT {ph}"
+        return self._execute(sql, (*params, after, limit), fetch=True)
+
     def get_all_users(self):
         """获取所有用户"""
         sql = "SELECT * FROM users ORDER BY dob"
         return self._execute(sql, fetch=True)
 
+    def _ensure_birthday_counts(self):
+        """
+        生日直方图 birthday_counts（幂等）：每个生日序号（1-366，0 为无法解析的生日）一行用户数，
+        由 users 上的触发器维护，导入、批量装载等绕过 DBManager 的写入也会计入
+
+        - SQLite / MySQL: 行级触发器，每行更新一至两个格子
+        - PostgreSQL: 语句级触发器 + 过渡表，批量写入时按序号分组后一次更新
+        首次创建时按现有用户填充；触发器不可用时删除该表，统计退回全表聚合
+        """
+        try:
+            if self._table_exists('birthday_counts'):
+                return
+            self._execute("""
+                CREATE TABLE birthday_counts (
+                    doy SMALLINT PRIMARY KEY,
+                    count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cell = "COALESCE({}.birthday_doy, 0)"
+            if self.db_type == "sqlite":
+                self._execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS users_bc_insert AFTER INSERT ON users BEGIN
+                        UPDATE birthday_counts SET count = count + 1 WHERE doy = {cell.format('new')};
+                    END
+                """)
+                self._execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS users_bc_delete AFTER DELETE ON users BEGIN
+                        UPDATE birthday_counts SET count = count - 1 WHERE doy = {cell.format('old')};
+                    END
+                """)
+                self._execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS users_bc_update AFTER UPDATE OF birthday_doy ON users
+                    WHEN old.birthday_doy IS NOT new.birthday_doy BEGIN
+                        UPDATE birthday_counts
+                        SET count = count + (doy = {cell.format('new')}) - (doy = {cell.format('old')})
+                        WHERE doy IN ({cell.format('old')}, {cell.format('new')});
+                    END
+                """)
+            elif self.db_type == "postgresql":
+                self._execute("""
+                    CREATE OR REPLACE FUNCTION users_bc_apply() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP = 'INSERT' THEN
+                            UPDATE birthday_counts c SET count = c.count + d.cnt
+                            FROM (SELECT COALESCE(birthday_doy, 0) AS doy, COUNT(*) AS cnt
+                                  FROM new_rows GROUP BY 1) d
+                            WHERE c.doy = d.doy;
+                        ELSIF TG_OP = 'DELETE' THEN
+                            UPDATE birthday_counts c SET count = c.count - d.cnt
+                            FROM (SELECT COALESCE(birthday_doy, 0) AS doy, COUNT(*) AS cnt
+                                  FROM old_rows GROUP BY 1) d
+                            WHERE c.doy = d.doy;
+                        ELSE
+                            -- 只更新净变化不为 0 的格子（发送状态等其他列的更新不碰直方图）
+                            UPDATE birthday_counts c SET count = c.count + d.delta
+                            FROM (SELECT doy, SUM(delta) AS delta FROM (
+                                      SELECT COALESCE(birthday_doy, 0) AS doy, 1 AS delta FROM new_rows
+                                      UNION ALL
+                                      SELECT COALESCE(birthday_doy, 0), -1 FROM old_rows
+                                  ) t GROUP BY doy HAVING SUM(delta) <> 0) d
+                            WHERE c.doy = d.doy;
+                        END IF;
+                        RETURN NULL;
+                    END
+                    $$ LANGUAGE plpgsql
+                """)
+                self._execute("""
+                    CREATE TRIGGER users_bc_insert AFTER INSERT ON users
+                    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE users_bc_apply()
+                """)
+                self._execute("""
+                    CREATE TRIGGER users_bc_delete AFTER DELETE ON users
+                    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE users_bc_apply()
+                """)
+                self._execute("""
+                    CREATE TRIGGER users_bc_update AFTER UPDATE ON users
+                    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE PROCEDURE users_bc_apply()
+                """)
+            else:
+                self._execute(f"""
+                    CREATE TRIGGER users_bc_insert AFTER INSERT ON users FOR EACH ROW
+                    UPDATE birthday_counts SET count = count + 1 WHERE doy = {cell.format('NEW')}
+                """)
+                self._execute(f"""
+                    CREATE TRIGGER users_bc_delete AFTER DELETE ON users FOR EACH ROW
+                    UPDATE birthday_counts SET count = count - 1 WHERE doy = {cell.format('OLD')}
+                """)
+                self._execute(f"""
+                    CREATE TRIGGER users_bc_update AFTER UPDATE ON users FOR EACH ROW
+                    UPDATE birthday_counts
+                    SET count = count + (doy = {cell.format('NEW')}) - (doy = {cell.format('OLD')})
+                    WHERE doy IN ({cell.format('OLD')}, {cell.format('NEW')})
+                      AND NOT (OLD.birthday_doy <=> NEW.birthday_doy)
+                """)
+
+            # 与触发器在同一事务中按现有用户填充（MySQL 的 DDL 会隐式提交）
+            self.rebuild_birthday_counts(commit=False)
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"⚠️  [生日统计] 创建失败，统计将使用全表聚合: {e}")
+            try:
+                # 已创建的触发器（SQLite / MySQL 已提交）必须先删掉，否则之后写 users 会因表不存在而失败
+                on_users = " ON users" if self.db_type == "postgresql" else ""
+                for trigger in ('users_bc_insert', 'users_bc_delete', 'users_bc_update'):
+                    self._execute(f"DROP TRIGGER IF EXISTS {trigger}{on_users}")
+                if self.db_type == "postgresql":
+                    self._execute("DROP FUNCTION IF EXISTS users_bc_apply()")
+                self._execute("DROP TABLE IF EXISTS birthday_counts")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+
+    def rebuild_birthday_counts(self, commit=True):
+        """按 users 重新计算生日直方图（首次创建时，或怀疑计数漂移时手动执行）"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        rows = self._execute(
+            "SELECT COALESCE(birthday_doy, 0) AS doy, COUNT(*) AS cnt FROM users GROUP BY COALESCE(birthday_doy, 0)",
+            fetch=True
+        )
+        counts = {row['doy']: row['cnt'] for row in rows}
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM birthday_counts")
+        cursor.executemany(f"INSERT INTO birthday_counts (doy, count) VALUES ({ph}, {ph})",
+                           [(doy, counts.get(doy, 0)) for doy in range(0, 367)])
+        # 用户统计的缓存挂在 users 上
+        self.bump_table_versions('users')
+        if commit:
+            self.conn.commit()
+
     def get_user_stats(self):
-        """获取用户统计信息"""
+        """
+        获取用户统计信息：总数、今日寿星、本月生日
+
+        读生日直方图中的几个格子，与用户数无关；非闰年的 2 月 28 日今日寿星包括 2 月 29 日出生的用户。
+        结果按日期缓存，用户变更后失效
+        """
+        today = datetime.now().date()
+        return cached(self, ('user_stats', today), ('users',), lambda: self._get_user_stats(today))
+
+    def _get_user_stats(self, today):
+        """get_user_stats 的计算部分（不经缓存）"""
+        doys = observed_doys(today)
+        month_start = day_of_year(today.month, 1)
+        month_end = day_of_year(today.month + 1, 1) - 1 if today.month < 12 else 366
+        try:
+            rows = self._execute("SELECT doy, count FROM birthday_counts", fetch=True)
+        except (sqlite3.Error, psycopg2.Error, pymysql.err.Error):
+            self.conn.rollback()
+            rows = []
+        if not rows:
+            return self._get_user_stats_scan()
+        counts = {row['doy']: int(row['count']) for row in rows}
+        return {
+            'total_users': sum(counts.values()),
+            'today_birthdays': sum(counts.get(doy, 0) for doy in doys),
+            'this_month_birthdays': sum(counts.get(doy, 0) for doy in range(month_start, month_end + 1)),
+        }
+
+    def _get_user_stats_scan(self):
+        """全表聚合的用户统计（生日直方图不可用时）"""
         if self.db_type == "sqlite":
             sql = """
                 SELECT
@@ -267,52 +1523,227 @@ class DBManager:
     # ========== 发送日志 ==========
 
     def get_send_logs(self, limit=100):
-        """获取发送日志"""
-        if self.db_type == "sqlite":
-            sql = """
-                SELECT l.*, u.name, u.email
-                FROM send_logs l
-                JOIN users u ON l.user_id = u.id
-                ORDER BY l.sent_at DESC
-                LIMIT ?
-            """
-            return self._execute(sql, (limit,), fetch=True)
-        else:
-            sql = """
-                SELECT l.*, u.name, u.email
-                FROM send_logs l
-                JOIN users u ON l.user_id = u.id
-                ORDER BY l.sent_at DESC
-                LIMIT %s
-            """
-            return self._execute(sql, (limit,), fetch=True)
+        """
+        获取最近的发送日志
+
+        先在 sent_at 索引上倒序取 limit 行，再与 users 连接，不对整张表连接后排序
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        sql = f"""
+            SELECT l.*, u.name, u.email
+            FROM (
+                SELECT * FROM send_logs
+                ORDER BY sent_at DESC, id DESC
+                LIMIT {ph}
+            ) l
+            JOIN users u ON l.user_id = u.id
+            ORDER BY l.sent_at DESC, l.id DESC
+        """
+        return self._execute(sql, (limit,), fetch=True)
+
+    def _export_filters(self, date_column, start=None, end=None):
+        """导出的日期区间条件（end 含当天，写成半开区间以便走索引）"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        conditions, params = [], []
+        if start:
+            conditions.append(f"{date_column} >= {ph}")
+            params.append(start.strftime('%Y-%m-%d'))
+        if end:
+            conditions.append(f"{date_column} < {ph}")
+            params.append((end + timedelta(days=1)).strftime('%Y-%m-%d'))
+        return conditions, params
+
+    def iter_users_export(self, start=None, end=None, status=None):
+        """
+        逐行读取要导出的用户（按 ID 排序）
+
+        Args:
+            start / end: 按创建日期过滤（date，含两端）
+            status: 'sent' 今年已发送 / 'unsent' 今年未发送
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        conditions, params = self._export_filters('created_at', start, end)
+        if status == 'sent':
+            conditions.append(f"last_sent_year = {ph}")
+            params.append(date.today().year)
+        elif status == 'unsent':
+            conditions.append(f"(last_sent_year IS NULL OR last_sent_year < {ph})")
+            params.append(date.today().year)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT id, name, email, dob, last_sent_year, created_at FROM users {where} ORDER BY id"
+        return self.iter_query(sql, tuple(params))
+
+    def iter_send_logs_export(self, start=None, end=None, status=None):
+        """
+        逐行读取要导出的发送日志（按 ID 排序）
+
+        Args:
+            start / end: 按发送日期过滤（date，含两端）
+            status: 'success' / 'failed'
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        conditions, params = self._export_filters('l.sent_at', start, end)
+        if status:
+            conditions.append(f"l.status = {ph}")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"""
+            SELECT l.id, l.user_id, u.name, u.email, l.sent_at, l.status, l.error_msg, l.message_id
+            FROM send_logs l
+            LEFT JOIN users u ON l.user_id = u.id
+            {where}
+            ORDER BY l.id
+        """
+        return self.iter_query(sql, tuple(params))
 
     def get_today_send_count(self):
-        """获取今天发送成功的数量"""
+        """获取今天发送成功的数量（sent_at 写成区间条件，走 status + sent_at 索引）"""
         if self.db_type == "sqlite":
-            sql = """
-                SELECT COUNT(*) as count
-                FROM send_logs
-                WHERE date(sent_at) = date('now')
-                AND status = 'success'
-            """
+            today = "sent_at >= date('now') AND sent_at < date('now', '+1 day')"
         elif self.db_type == "postgresql":
-            sql = """
-                SELECT COUNT(*) as count
-                FROM send_logs
-                WHERE DATE(sent_at) = CURRENT_DATE
-                AND status = 'success'
-            """
+            today = "sent_at >= CURRENT_DATE AND sent_at < CURRENT_DATE + INTERVAL '1 day'"
         else:
-            sql = """
-                SELECT COUNT(*) as count
-                FROM send_logs
-                WHERE DATE(sent_at) = CURDATE()
-                AND status = 'success'
-            """
+            today = "sent_at >= CURDATE() AND sent_at < CURDATE() + INTERVAL 1 DAY"
+        sql = f"""
+            SELECT COUNT(*) as count
+            FROM send_logs
+            WHERE status = 'success' AND {today}
+        """
         rows = self._execute(sql, fetch=True)
         return rows[0]['count'] if rows else 0
 
+    # ========== 发送统计汇总 ==========
+
+    def _send_stats_upsert_sql(self):
+        """今天某个 (状态, 错误类别) 的计数累加 count 条"""
+        if self.db_type == "sqlite":
+            return """
+                INSERT INTO send_stats_daily (day, status, error_class, count) VALUES (date('now'), ?, ?, ?)
+                ON CONFLICT (day, status, error_class) DO UPDATE SET count = count + excluded.count
+            """
+        if self.db_type == "postgresql":
+            return """
+                INSERT INTO send_stats_daily (day, status, error_class, count) VALUES (CURRENT_DATE, %s, %s, %s)
+                ON CONFLICT (day, status, error_class) DO UPDATE SET count = send_stats_daily.count + excluded.count
+            """
+        return """
+            INSERT INTO send_stats_daily (day, status, error_class, count) VALUES (CURDATE(), %s, %s, %s)
+            ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+        """
+
+    def rebuild_send_stats(self, start=None, end=None):
+        """
+        由 send_logs 重算 [start, end] 的每日汇总（默认从最早的日志到今天）
+
+        按 (日期, 状态, 错误信息) 在数据库中分组，只有分组结果回到 Python 归类。
+        start 不早于现存最早一条日志的日期：更早的日志已归档删除（归档按整天切分），
+        这些日期的汇总无法重算，原样保留
+
+        Returns:
+            int: 写入的汇总行数
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        first = self._execute("SELECT MIN(sent_at) AS first FROM send_logs", fetch=True)[0]['first']
+        if first is None:
+            return 0
+        start = max(start, parse_dob(first)) if start else parse_dob(first)
+        end = end or date.today()
+        day_expr = {"sqlite": "date(sent_at)", "postgresql": "CAST(sent_at AS DATE)",
+                    "mysql": "DATE(sent_at)"}[self.db_type]
+
+        totals = {}
+        conditions, params = self._export_filters('sent_at', start, end)
+        for row in self.iter_query(f"""
+            SELECT {day_expr} AS day, status, error_msg, COUNT(*) AS cnt
+            FROM send_logs
+            WHERE {' AND '.join(conditions)}
+            GROUP BY {day_expr}, status, error_msg
+        """, tuple(params)):
+            key = (str(row['day'])[:10], row['status'], classify_error_message(row['error_msg']))
+            totals[key] = totals.get(key, 0) + row['cnt']
+
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM send_stats_daily WHERE day >= {ph} AND day <= {ph}",
+                       (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')))
+        cursor.executemany(
+            f"INSERT INTO send_stats_daily (day, status, error_class, count) VALUES ({ph}, {ph}, {ph}, {ph})",
+            [(day, status, error_class, n) for (day, status, error_class), n in totals.items()]
+        )
+        self.conn.commit()
+        return len(totals)
+
+    def get_send_stats_daily(self, start, end=None):
+        """
+        [start, end] 每天的发送成功 / 失败数（读汇总表，没有发送的日期不返回）
+
+        Returns:
+            list: [{'day': 'YYYY-MM-DD', 'success': n, 'failed': n}, ...]，按日期升序
+        """
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        end = end or date.today()
+        rows = self._execute(f"""
+            SELECT day, status, SUM(count) AS cnt
+            FROM send_stats_daily
+            WHERE day >= {ph} AND day <= {ph}
+            GROUP BY day, status
+            ORDER BY day
+        """, (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')), fetch=True)
+        days = {}
+        for row in rows:
+            day = days.setdefault(str(row['day'])[:10], {'success': 0, 'failed': 0})
+            day[row['status']] = day.get(row['status'], 0) + int(row['cnt'])
+        return [dict(day=key, **value) for key, value in days.items()]
+
+    def get_send_error_summary(self, start=None, end=None):
+        """区间内失败发送按错误类别的计数 {类别: 次数}（不指定区间为全部历史）"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        conditions, params = ["status = 'failed'"], []
+        if start:
+            conditions.append(f"day >= {ph}")
+            params.append(start.strftime('%Y-%m-%d'))
+        if end:
+            conditions.append(f"day <= {ph}")
+            params.append(end.strftime('%Y-%m-%d'))
+        rows = self._execute(f"""
+            SELECT error_class, SUM(count) AS cnt
+            FROM send_stats_daily
+            WHERE {' AND '.join(conditions)}
+            GROUP BY error_class
+            ORDER BY cnt DESC
+        """, tuple(params), fetch=True)
+        return {row['error_class']: int(row['cnt']) for row in rows}
+
+    def get_send_totals(self):
+        """全部历史的发送成功 / 失败总数（读汇总表，含已归档的日志）"""
+        rows = self._execute("SELECT status, SUM(count) AS cnt FROM send_stats_daily GROUP BY status", fetch=True)
+        totals = {'success': 0, 'failed': 0}
+        for row in rows:
+            totals[row['status']] = int(row['cnt'])
+        return totals
+
+    # ========== 发送日志归档 ==========
+
+    def get_send_logs_to_archive(self, before, limit):
+        """sent_at 早于 before 的最早 limit 条日志（按 ID，附带用户姓名和邮箱）"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        return self._execute(f"""
+            SELECT l.id, l.user_id, u.name, u.email, l.sent_at, l.status, l.error_msg, l.message_id
+            FROM send_logs l
+            LEFT JOIN users u ON u.id = l.user_id
+            WHERE l.sent_at < {ph}
+            ORDER BY l.id
+            LIMIT {ph}
+        """, (before.strftime('%Y-%m-%d'), limit), fetch=True)
+
+    def delete_archived_send_logs(self, before, last_id):
+        """删除已归档的一批日志（ID 不超过 last_id 且早于 before），返回删除行数"""
+        ph = "?" if self.db_type == "sqlite" else "%s"
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM send_logs WHERE id <= {ph} AND sent_at < {ph}",
+                       (last_id, before.strftime('%Y-%m-%d')))
+        self.conn.commit()
+        return cursor.rowcount
+
     # ========== 连接管理 ==========
 
     def close(self):
@@ -5,17 +5,30 @@
 """
 
 import smtplib
+import time
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import Header
 from email.utils import formataddr
 from config import Config
 from rate_limiter import get_rate_limiter, RateLimitExceeded
+from circuit_breaker import TRIPPING_ERRORS, ERROR_NETWORK
+from sender_pool import get_sender_pool
 
 
-# 速率限制器实例
+# 速率限制器实例（收件人冷却和全局总量）
 _rate_limiter = get_rate_limiter()
 
+# 发件账号池（每个账号独立的配额、熔断器和 SMTP 连接池）
+_sender_pool = get_sender_pool()
+
+# 熔断期间被推迟的发送（由守护进程的重试任务消费）
+_retry_queue = deque(maxlen=Config.RETRY_QUEUE_MAX)
+
+# 熔断时返回的错误信息（调用方据此区分"推迟"与"失败"）
+CIRCUIT_OPEN_ERROR = "熔断中: SMTP 中继暂不可用，已推迟发送"
+
 
 # HTML 邮件模板 - 现代设计风格
 EMAIL_TEMPLATE = """<!DOCTYPE html>
@@ -161,75 +174,150 @@ def build_text_email(user_name, wish_content, year=None):
 """
 
 
-def send_birthday_email(to_email, user_name, wish_content, check_rate_limit=True):
+def build_birthday_message(to_email, user_name, wish_content, from_addr=None):
+    """
+    构建生日邮件（MIME 多部分）
+
+    Args:
+        to_email: 收件人邮箱
+        user_name: 收件人姓名
+        wish_content: 祝福语内容
+        from_addr: 发件人邮箱（默认 MAIL_USER）
+
+    Returns:
+        MIMEMultipart: 邮件对象
+    """
+    # 创建多部分邮件
+    msg = MIMEMultipart('alternative')
+
+    # 设置邮件头
+    msg['From'] = formataddr(
+        (Header(Config.MAIL_FROM_NAME, 'utf-8').encode(), from_addr or Config.MAIL_USER)
+    )
+    msg['To'] = formataddr(
+        (Header(user_name, 'utf-8').encode(), to_email)
+    )
+    msg['Subject'] = Header(f"🎂 {user_name}，生日快乐！", 'utf-8')
+
+    # 纯文本版本（备用）
+    text_content = build_text_email(user_name, wish_content)
+    msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
+
+    # HTML 版本（首选）
+    html_content = build_html_email(user_name, wish_content)
+    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+
+    return msg
+
+
+def get_retry_queue():
+    """获取熔断期间推迟发送的队列"""
+    return _retry_queue
+
+
+def send_birthday_email(to_email, user_name, wish_content, check_rate_limit=True, defer_meta=None):
     """
     发送生日邮件
 
+    从发件账号池选择今日发送最少的可用账号；账号被限流、封禁或连接失败时
+    自动切换到下一个账号。SMTP 连接保留在账号的连接池中供后续发送复用，
+    批量发送结束后调用 close_sender_sessions() 关闭
+
     Args:
         to_email: 收件人邮箱
         user_name: 收件人姓名
         wish_content: 祝福语内容
         check_rate_limit: 是否检查速率限制（默认True）
+        defer_meta: 熔断时放入重试队列的附加信息（如 user_id），为 None 则不入队
 
     Returns:
-        tuple: (是否成功, 错误信息)
+        tuple: (是否成功, 错误信息)；所有账号熔断时错误信息为 CIRCUIT_OPEN_ERROR
     """
-    # 速率限制检查
+    # 速率限制检查（等待最小发送间隔，而不是直接拒绝）
     if check_rate_limit:
+        _rate_limiter.wait_for_interval()
         can_send, reason = _rate_limiter.check_limit(to_email)
         if not can_send:
             error = f"速率限制: {reason}"
             print(f"⏱️ [发送受限] {to_email} - {reason}")
             return False, error
 
-    try:
-        # 创建多部分邮件
-        msg = MIMEMultipart('alternative')
-
-        # 设置邮件头
-        msg['From'] = formataddr(
-            (Header(Config.MAIL_FROM_NAME, 'utf-8').encode(), Config.MAIL_USER)
-        )
-        msg['To'] = formataddr(
-            (Header(user_name, 'utf-8').encode(), to_email)
-        )
-        msg['Subject'] = Header(f"🎂 {user_name}，生日快乐！", 'utf-8')
-
-        # 纯文本版本（备用）
-        text_content = build_text_email(user_name, wish_content)
-        msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-
-        # HTML 版本（首选）
-        html_content = build_html_email(user_name, wish_content)
-        msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-
-        # 连接 SMTP 服务器并发送
-        server = smtplib.SMTP_SSL(Config.MAIL_SERVER, Config.MAIL_PORT)
-        server.login(Config.MAIL_USER, Config.MAIL_AUTH_CODE)
-        server.sendmail(Config.MAIL_USER, [to_email], msg.as_string())
-        server.quit()
+    tried = []
+    error = None
+    while True:
+        account, reason = _sender_pool.acquire(exclude=tried)
+        if account is None:
+            break
+        tried.append(account)
+
+        session = account.acquire_session()
+        broken = False
+        try:
+            msg = build_birthday_message(to_email, user_name, wish_content, from_addr=account.user)
+            session.send_message(account.user, [to_email], msg.as_string())
+        except Exception as e:
+            error_class = account.breaker.record_failure(e)
+            broken = error_class == ERROR_NETWORK or session.smtp is None
+            error = _describe_error(e)
+            print(f"❌ [发送失败] {to_email} via {account.user} - {error}")
+            if error_class in TRIPPING_ERRORS:
+                # 账号或中继问题，换下一个账号重试
+                continue
+            return False, error
+        finally:
+            account.release_session(session, broken=broken)
 
+        account.breaker.record_success()
+        account.limiter.record_sent(to_email)
         # 记录成功发送
         if check_rate_limit:
             _rate_limiter.record_sent(to_email)
 
-        print(f"✅ [发送成功] {user_name} -> {to_email}")
+        print(f"✅ [发送成功] {user_name} -> {to_email}" + (f" (via {account.user})" if len(_sender_pool.accounts) > 1 else ""))
         return True, None
 
-    except smtplib.SMTPAuthenticationError as e:
-        error = f"认证失败：请检查邮箱授权码是否正确"
-        print(f"❌ [发送失败] {to_email} - {error}")
+    if error is not None and reason != 'circuit_open':
         return False, error
 
-    except smtplib.SMTPException as e:
-        error = f"SMTP 错误: {str(e)}"
-        print(f"❌ [发送失败] {to_email} - {error}")
-        return False, error
+    if reason == 'circuit_open':
+        if defer_meta is not None:
+            _retry_queue.append(dict(defer_meta, email=to_email, name=user_name,
+                                     wish=wish_content, queued_at=time.time()))
+        print(f"🔌 [发送推迟] {to_email} - 所有发件账号熔断中")
+        return False, CIRCUIT_OPEN_ERROR
 
-    except Exception as e:
-        error = f"未知错误: {str(e)}"
-        print(f"❌ [发送失败] {to_email} - {error}")
-        return False, error
+    error = "所有发件账号已达到发送限额" if reason == 'quota' else "没有可用的发件账号"
+    print(f"⏱️ [发送受限] {to_email} - {error}")
+    return False, error
+
+
+def _describe_error(e):
+    """把发送异常转换为错误信息"""
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return "认证失败：请检查邮箱授权码是否正确"
+    if isinstance(e, smtplib.SMTPException):
+        return f"SMTP 错误: {str(e)}"
+    return f"未知错误: {str(e)}"
+
+
+def close_sender_sessions():
+    """关闭账号池中的空闲 SMTP 连接，返回各会话的吞吐量统计"""
+    return _sender_pool.close_sessions()
+
+
+def print_session_stats(stats):
+    """打印 SMTP 会话（或其他传输）吞吐量统计"""
+    if not stats['messages'] and not stats['failed']:
+        return
+    if 'transport' in stats:
+        print(f"📈 [{stats['transport']}] 投递统计: {stats['messages']} 封成功 / {stats['failed']} 封失败, "
+              f"{stats['batches']} 批, {stats['messages_per_sec']} 封/秒")
+        return
+    account = f" {stats['account']}" if stats.get('account') else ""
+    print(f"📈 [SMTP{account}] 会话统计: {stats['messages']} 封成功 / {stats['failed']} 封失败, "
+          f"{stats['messages_per_sec']} 封/秒, {stats['bytes_per_sec'] / 1024:.1f} KB/秒, "
+          f"平均命令延迟 {stats['avg_command_latency_ms']} ms, "
+          f"PIPELINING: {'是' if stats['pipelining'] else '否'}")
 
 
 def send_test_email(to_email):
@@ -250,13 +338,13 @@ def send_test_email(to_email):
 # 批量发送（带速率限制）
 def send_batch_emails(email_list):
     """
-    批量发送邮件
+    批量发送邮件（复用账号池中的 SMTP 连接）
 
     Args:
         email_list: 邮件列表，格式为 [(email, name, wish), ...]
 
     Returns:
-        dict: 统计信息 {success: 成功数, failed: 失败数, errors: 错误列表}
+        dict: 统计信息 {success: 成功数, failed: 失败数, errors: 错误列表, throughput: 各会话统计}
     """
     result = {
         'success': 0,
@@ -272,6 +360,9 @@ def send_batch_emails(email_list):
             result['failed'] += 1
             result['errors'].append({'email': email, 'error': error})
 
+    result['throughput'] = close_sender_sessions()
+    for stats in result['throughput']:
+        print_session_stats(stats)
     return result
 
 
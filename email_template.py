@@ -7,6 +7,7 @@
 import re
 from typing import Dict, List, Optional
 from db_manager import DBManager
+from cache import cached
 
 
 class EmailTemplate:
@@ -434,10 +435,12 @@ class EmailTemplate:
 """
 
     def get_template(self, name: str) -> Optional[Dict]:
-        """获取指定模板"""
+        """获取指定模板（缓存，模板变更后失效）"""
         if name == 'default':
             return self.DEFAULT_TEMPLATE
+        return cached(self.db, ('email_template', name), ('email_templates',), lambda: self._get_template(name))
 
+    def _get_template(self, name: str) -> Optional[Dict]:
         if self.db.db_type == 'sqlite':
             templates = self.db._execute(
                 "SELECT * FROM email_templates WHERE name = ? AND is_active = 1",
@@ -454,7 +457,10 @@ class EmailTemplate:
         return templates[0] if templates else None
 
     def list_templates(self) -> List[Dict]:
-        """列出所有模板"""
+        """列出所有模板（缓存，模板变更后失效）"""
+        return cached(self.db, 'email_templates', ('email_templates',), self._list_templates)
+
+    def _list_templates(self) -> List[Dict]:
         if self.db.db_type == 'sqlite':
             templates = self.db._execute(
                 "SELECT * FROM email_templates ORDER BY created_at DESC",
@@ -589,7 +595,10 @@ class EmailTemplate:
         return True
 
     def get_default_template(self) -> Optional[Dict]:
-        """获取默认模板"""
+        """获取默认模板（缓存，模板变更后失效）"""
+        return cached(self.db, 'default_email_template', ('email_templates',), self._get_default_template)
+
+    def _get_default_template(self) -> Optional[Dict]:
         if self.db.db_type == 'sqlite':
             templates = self.db._execute(
                 "SELECT * FROM email_templates WHERE is_default = 1 AND is_active = 1",
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+数据导出
+用户和发送日志以 CSV 或 JSON Lines 流式导出（可选边导出边 gzip 压缩）；
+数据库用服务端游标逐批读取，按块生成输出，内存占用与总行数无关。
+Web 端 /users/export、/logs/export 与命令行共用这里的生成器
+"""
+
+import csv
+import io
+import json
+import sys
+import zlib
+import argparse
+from datetime import datetime, date
+from db_manager import DBManager
+
+
+# 导出类型 -> (读取方法, 列)
+EXPORTS = {
+    'users': ('iter_users_export', ['id', 'name', 'email', 'dob', 'last_sent_year', 'created_at']),
+    'logs': ('iter_send_logs_export', ['id', 'user_id', 'name', 'email', 'sent_at', 'status',
+                                       'error_msg', 'message_id']),
+}
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# 每累计这么多字节输出一块
+CHUNK_SIZE = 64 * 1024
+
+# 各类型可用的 status 过滤值
+EXPORT_STATUSES = {
+    'users': ('sent', 'unsent'),
+    'logs': ('success', 'failed'),
+}
+
+
+def _cell(value, empty=''):
+    if value is None:
+        return empty
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def encode_rows(rows, columns, fmt='csv'):
+    """
+    把行编码为文本块
+
+    表头（或第一行之前）立即输出一块，之后每满 CHUNK_SIZE 输出一块；
+    CSV 带 UTF-8 BOM，方便 Excel 直接打开中文
+    """
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(columns)
+        write = lambda row: writer.writerow([_cell(row.get(col)) for col in columns])
+    else:
+        write = lambda row: buffer.write(
+            json.dumps({col: _cell(row.get(col), None) for col in columns}, ensure_ascii=False) + '\n'
+        )
+
+    # 表头先发出去，客户端立即收到首字节
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+
+    for row in rows:
+        write(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    """边生成边 gzip 压缩；第一块同步刷新，保证首字节立即发出"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if first:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(kind, fmt='csv', compress=False, start=None, end=None, status=None, db=None):
+    """
+    流式导出
+
+    Args:
+        kind: 'users' / 'logs'
+        fmt: 'csv' / 'jsonl'
+        compress: 是否 gzip 压缩
+        start / end: 日期区间（date，含两端；用户按创建日期，日志按发送日期）
+        status: 用户 'sent' / 'unsent'，日志 'success' / 'failed'
+        db: 数据库连接（默认自行打开，导出结束后关闭）
+
+    Returns:
+        生成 bytes 输出块的迭代器（参数在调用时立即校验，无效时抛出 ValueError）
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"未知的导出类型: {kind}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}（可选: {', '.join(EXPORT_FORMATS)}）")
+    if status and status not in EXPORT_STATUSES[kind]:
+        raise ValueError(f"无效的状态: {status}（可选: {', '.join(EXPORT_STATUSES[kind])}）")
+
+    method, columns = EXPORTS[kind]
+
+    def generate():
+        own_db = db is None
+        conn = db or DBManager()
+        try:
+            rows = getattr(conn, method)(start=start, end=end, status=status)
+            chunks = encode_rows(rows, columns, fmt)
+            yield from (gzip_chunks(chunks) if compress else chunks)
+        finally:
+            if own_db:
+                conn.close()
+
+    return generate()
+
+
+def export_filename(kind, fmt, compress=False):
+    """下载文件名，如 users-20260101.csv.gz"""
+    return f"{kind}-{date.today():%Y%m%d}.{fmt}" + ('.gz' if compress else '')
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='导出用户或发送日志')
+    parser.add_argument('kind', choices=sorted(EXPORTS), help='导出内容')
+    parser.add_argument('-f', '--format', default='csv', choices=EXPORT_FORMATS, help='输出格式')
+    parser.add_argument('-o', '--output', help='输出文件（默认标准输出）')
+    parser.add_argument('-z', '--gzip', action='store_true', help='gzip 压缩')
+    parser.add_argument('--from', dest='start', type=date.fromisoformat, help='开始日期 YYYY-MM-DD')
+    parser.add_argument('--to', dest='end', type=date.fromisoformat, help='结束日期 YYYY-MM-DD（含）')
+    parser.add_argument('--status', help='用户: sent/unsent，日志: success/failed')
+    args = parser.parse_args()
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for chunk in stream_export(args.kind, args.format, args.gzip, args.start, args.end, args.status):
+            out.write(chunk)
+            written += len(chunk)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.output:
+            out.close()
+
+    if args.output:
+        print(f"✅ 已导出到 {args.output}（{written} 字节）", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+JSON 接口的 HTTP 条件请求与响应缓存
+监控和大屏轮询的接口（/api/stats、/api/upcoming-birthdays、/api/rate-limit）：
+
+- 依赖数据库表的接口：ETag 由 table_versions 中的版本号（及日期）生成，Last-Modified 为最后写入时间；
+  客户端带 If-None-Match / If-Modified-Since 且数据没变时，只查一次版本号就返回 304
+- 不依赖数据库的接口（进程内状态，如速率限制计数）：每次重新生成，ETag 为响应内容的哈希，
+  内容没变时返回 304，不缓存响应、max-age 为 0（计数和熔断状态随时在变）
+- 依赖数据库表的接口生成好的 JSON 在本进程内缓存 API_CACHE_SECONDS 秒（表版本变化时立即作废），
+  并以 Cache-Control: private, max-age 告诉客户端这段时间内不必再请求
+"""
+
+import hashlib
+import time
+from datetime import date, datetime, timezone
+from functools import wraps
+from flask import Response, request
+from config import Config
+from cache import QueryCache
+from db_manager import DBManager
+
+
+class _Uncacheable(Exception):
+    """视图返回了非 200 响应（不缓存，原样返回）"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+# 生成好的响应体：键 -> JSON 字节
+_response_cache = QueryCache(ttl=Config.API_CACHE_SECONDS)
+
+
+def get_response_cache():
+    """获取本进程的响应缓存（统计用）"""
+    return _response_cache
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def _not_modified(etag, modified_at):
+    """请求的缓存副本是否仍然有效（If-None-Match 优先）"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and modified_at:
+        return int(request.if_modified_since.timestamp()) >= int(modified_at)
+    return False
+
+
+def _finish(response, etag, modified_at, max_age):
+    response.set_etag(etag)
+    if modified_at:
+        response.last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def conditional_json(tables=(), daily=False, max_age=None):
+    """
+    为返回 JSON 的视图加上 ETag / Last-Modified / 304 和短期响应缓存（放在 login_required 之后）
+
+    Args:
+        tables: 响应依赖的表（版本号变化即视为数据变化），为空时按响应内容生成 ETag、不缓存响应
+        daily: 响应随日期变化（如今日寿星），日期也计入 ETag，Last-Modified 不早于当天零点
+        max_age: 缓存秒数（默认：有 tables 时 API_CACHE_SECONDS，否则 0）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not tables:
+                ttl = max_age or 0
+                response = view(*args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                etag = _etag(response.get_data())
+                if request.if_none_match and request.if_none_match.contains(etag):
+                    return _finish(Response(status=304), etag, None, ttl)
+                return _finish(response, etag, None, ttl)
+
+            ttl = Config.API_CACHE_SECONDS if max_age is None else max_age
+            key = (request.endpoint, request.query_string, tuple(sorted(kwargs.items())))
+            with DBManager() as db:
+                versions, modified_at = db.get_table_state(tables)
+            if versions is None:
+                return view(*args, **kwargs)
+            if daily:
+                today = date.today()
+                versions += (today.isoformat(),)
+                modified_at = max(modified_at, int(time.mktime(today.timetuple())))
+            etag = _etag(key, versions)
+            if _not_modified(etag, modified_at):
+                return _finish(Response(status=304), etag, modified_at, ttl)
+
+            def render():
+                response = view(*args, **kwargs)
+                if response.status_code != 200:
+                    raise _Uncacheable(response)
+                return response.get_data()
+
+            try:
+                body = _response_cache.get_or_compute(None, key, tables, render, ttl, versions=versions)
+            except _Uncacheable as e:
+                return e.response
+            return _finish(Response(body, mimetype='application/json'), etag, modified_at, ttl)
+        return wrapper
+    return decorator
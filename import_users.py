@@ -2,13 +2,28 @@
 """
 用户批量导入脚本
 支持从 CSV/Excel 文件批量导入用户数据
+
+CSV 默认流式导入（csv.reader，内存占用固定）；--pandas 使用向量化校验，--workers N 多进程解析。
+流式和多进程导入每批提交时在 import_jobs 记录检查点，中断后再次导入同一文件会从检查点继续
 """
 
-import pandas as pd
 import sys
 import os
-from datetime import datetime
+import io
+import re
+import csv
+import time
+import codecs
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
+from config import Config
 from db_manager import DBManager
+from validators import Validators
+
+# pandas 只在向量化路径（--pandas、Excel、--workers）中按需导入，流式路径不需要它
 
 
 def normalize_date(date_str):
@@ -38,81 +53,122 @@ def normalize_date(date_str):
     raise ValueError(f"无法解析日期: {date_str}")
 
 
-def import_from_csv(file_path):
+# 每块读取的行数：一块向量化校验后在一个事务内写入
+CHUNK_ROWS = 100000
+
+REQUIRED_COLUMNS = ['name', 'email', 'dob']
+
+# 年-月-日（分隔符可以是 - / .，月日可以是一位数；Excel 日期单元格转字符串后也能匹配）
+DATE_PATTERN = r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})'
+
+
+def prepare_chunk(df):
     """
-    从 CSV 文件导入用户
+    向量化校验并规范化一块数据
 
     Args:
-        file_path: CSV 文件路径
+        df: 含 name / email / dob 列的 DataFrame
 
     Returns:
-        dict: 导入结果统计
+        (count, rows, errors, duplicates): count 为本块行数，rows 为 [(name, email, dob), ...]，
+        errors 为 [(块内行下标, 错误说明), ...]，duplicates 为块内重复邮箱的行数
     """
-    print(f"📂 正在读取文件: {file_path}")
-
-    try:
-        # 读取 CSV 文件
-        df = pd.read_csv(file_path, encoding='utf-8')
-    except UnicodeDecodeError:
-        # 尝试其他编码
-        try:
-            df = pd.read_csv(file_path, encoding='gbk')
-        except Exception as e:
-            return {'success': False, 'error': f"文件编码错误: {e}"}
-    except Exception as e:
-        return {'success': False, 'error': f"读取文件失败: {e}"}
-
-    # 验证必要的列
-    required_columns = ['name', 'email', 'dob']
-    missing = [col for col in required_columns if col not in df.columns]
-
+    import pandas as pd
+    df = df[REQUIRED_COLUMNS].fillna('').astype(str).reset_index(drop=True)
+    name = df['name'].str.strip()
+    email = df['email'].str.strip()
+    dob_text = df['dob'].str.strip()
+
+    missing = (name == '') | (email == '') | (dob_text == '')
+    bad_email = ~missing & ~email.str.match(Validators.EMAIL_REGEX.pattern)
+
+    parts = dob_text.str.extract(DATE_PATTERN).astype(float)
+    dates = pd.to_datetime(
+        pd.DataFrame({'year': parts[0], 'month': parts[1], 'day': parts[2]}), errors='coerce'
+    )
+    bad_date = ~missing & ~bad_email & dates.isna()
+
+    errors = [(i, "姓名、邮箱、生日不能为空") for i in df.index[missing]]
+    errors += [(i, f"无效的邮箱地址 - {v}") for i, v in email[bad_email].items()]
+    errors += [(i, f"无效的日期格式 - {v}") for i, v in dob_text[bad_date].items()]
+
+    good = ~(missing | bad_email | bad_date)
+    clean = pd.DataFrame({
+        'name': name[good],
+        'email': email[good],
+        'dob': dates[good].dt.strftime('%Y-%m-%d'),
+    })
+
+    # 同一块内重复的邮箱以最后一行为准
+    deduped = clean.drop_duplicates('email', keep='last')
+    return len(df), list(deduped.itertuples(index=False, name=None)), sorted(errors), len(clean) - len(deduped)
+
+
+def check_columns(columns):
+    """检查必要列，缺少时返回错误结果，否则返回 None"""
+    missing = [col for col in REQUIRED_COLUMNS if col not in columns]
     if missing:
         return {
             'success': False,
-            'error': f"CSV 缺少必要列: {', '.join(missing)}\n需要的列: {', '.join(required_columns)}"
+            'error': f"文件缺少必要列: {', '.join(missing)}\n需要的列: {', '.join(REQUIRED_COLUMNS)}"
         }
+    return None
 
-    print(f"✅ 文件读取成功，共 {len(df)} 条记录\n")
 
-    # 导入数据
+def import_chunks(chunks, update_existing=False, job=None):
+    """
+    导入流水线：逐块向量化校验，合格的行用数据库原生方式装载（每块一个事务）：
+    PostgreSQL COPY / MySQL LOAD DATA / SQLite 临时表，再 INSERT ... SELECT 合并，生日序号在同一条语句中推导
+
+    带 job 时每块的数据和检查点（字节偏移、行号、计数、耗时）在同一个事务中提交，
+    中断后可以从最后一个检查点继续
+
+    Args:
+        chunks: 按文件顺序的 (prepare_chunk() 结果, 本块结束的字节偏移) 迭代器
+        update_existing: 邮箱已存在时更新姓名和生日（默认跳过）
+        job: import_jobs 记录（续传时带着已完成的行数和计数），None 表示不记录检查点
+
+    Returns:
+        dict: 导入结果统计
+    """
     db = DBManager()
-    success_count = 0
-    skip_count = 0
+    job = job or {}
+    total = job.get('rows_done') or 0
+    success_count = job.get('inserted') or 0
+    skip_count = job.get('skipped') or 0
+    invalid_before = job.get('invalid') or 0
+    chunk_no = job.get('chunks') or 0
     error_list = []
+    started = chunk_started = time.time()
 
     try:
-        for idx, row in df.iterrows():
-            try:
-                name = str(row['name']).strip()
-                email = str(row['email']).strip()
-                dob = str(row['dob']).strip()
-
-                # 验证邮箱格式
-                if '@' not in email:
-                    error_list.append(f"第 {idx+2} 行: 无效的邮箱地址 - {email}")
-                    skip_count += 1
-                    continue
-
-                # 验证并规范化日期格式
-                try:
-                    dob = normalize_date(dob)
-                except Exception as e:
-                    error_list.append(f"第 {idx+2} 行: 无效的日期格式 - {dob}")
-                    skip_count += 1
-                    continue
-
-                # 插入数据库
-                if db.add_user(name, email, dob):
-                    success_count += 1
-                    print(f"✅ [{success_count}] {name} - {email}")
-                else:
-                    skip_count += 1
-                    print(f"⏭️  [跳过] {email} (已存在)")
-
-            except Exception as e:
-                skip_count += 1
-                error_list.append(f"第 {idx+2} 行: {str(e)}")
-
+        for (count, rows, errors, duplicates), offset in chunks:
+            written = db.bulk_load_users(rows, update_existing=update_existing, commit=not job)
+            if update_existing:
+                written = len(rows)
+
+            # 行号：表头占第 1 行
+            error_list.extend(f"第 {total + i + 2} 行: {message}" for i, message in errors)
+            total += count
+            success_count += written
+            skip_count += len(rows) - written + duplicates
+            chunk_no += 1
+            if job:
+                db.save_import_checkpoint(
+                    job['id'], chunk_no, offset, total, count, written, time.time() - chunk_started,
+                    success_count, skip_count, invalid_before + len(error_list)
+                )
+            chunk_started = time.time()
+            elapsed = max(chunk_started - started, 1e-9)
+            print(f"✅ 已处理 {total} 行（写入 {success_count}，{total / elapsed:.0f} 行/秒）")
+        if job:
+            db.finish_import_job(job['id'])
+    except Exception as e:
+        if job:
+            # 未提交的一块连同检查点一起回滚，下次从上一个检查点继续
+            db.conn.rollback()
+            db.finish_import_job(job['id'], 'failed', str(e)[:500])
+        raise
     finally:
         db.close()
 
@@ -121,7 +177,8 @@ def import_from_csv(file_path):
     print("📊 导入完成:")
     print(f"   ✅ 成功: {success_count} 条")
     print(f"   ⏭️  跳过: {skip_count} 条")
-    print(f"   ❌ 错误: {len(error_list)} 条")
+    print(f"   ❌ 错误: {invalid_before + len(error_list)} 条")
+    print(f"   ⏱️  耗时: {time.time() - started:.2f} 秒")
 
     if error_list:
         print("\n❌ 错误详情:")
@@ -134,42 +191,352 @@ def import_from_csv(file_path):
 
     return {
         'success': True,
-        'total': len(df),
+        'job_id': job.get('id'),
+        'total': total,
         'success_count': success_count,
         'skip_count': skip_count,
-        'error_count': len(error_list)
+        'error_count': invalid_before + len(error_list),
+        'errors': error_list,
     }
 
 
-def import_from_excel(file_path):
+# ========== 检查点与续传 ==========
+
+def file_sha256(file_path):
+    """文件内容的 SHA-256，用来识别同一个文件的再次导入"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def begin_import_job(file_path, update_existing=False, restart=False, source='cli', file_name=None):
+    """
+    登记导入任务，返回 import_jobs 记录
+
+    同一文件（按内容哈希）有失败或已中断的任务时接管并返回它，调用方从其 byte_offset 继续；
+    restart=True 时把旧任务标记为 cancelled 并重新开始。
+    同一文件的导入仍在进行（running 且 IMPORT_STALE_MINUTES 分钟内有检查点）时抛出 RuntimeError
+    """
+    file_hash = file_sha256(file_path)
+    db = DBManager()
+    try:
+        job = db.find_resumable_import_job(file_hash)
+        if job and not db.claim_import_job(job['id']):
+            raise RuntimeError(f"同一文件正在导入中（任务 #{job['id']}），请等待完成；"
+                               f"若该导入已中断，{Config.IMPORT_STALE_MINUTES} 分钟后重新上传即可继续")
+        if job and restart:
+            db.finish_import_job(job['id'], 'cancelled', "已重新导入")
+            job = None
+        if job:
+            if job['byte_offset']:
+                print(f"♻️  继续未完成的导入 #{job['id']}：已完成 {job['rows_done']} 行，"
+                      f"从第 {job['byte_offset']} 字节继续")
+            return db.get_import_job(job['id'])
+        job_id = db.create_import_job(file_name or os.path.basename(file_path), file_hash,
+                                      os.path.getsize(file_path), source, update_existing)
+        return db.get_import_job(job_id)
+    finally:
+        db.close()
+
+
+class CountingLines:
+    """
+    逐行读取二进制文件并解码，offset 为已交给 csv.reader 的字节数
+
+    csv.reader 每返回一条记录，offset 都落在行边界上，可以直接作为检查点
+    """
+
+    def __init__(self, f, encoding):
+        self.f = f
+        self.offset = f.tell()
+        # BOM 只在文件开头，续传时从中间读取按普通 UTF-8 解码
+        self.encoding = 'utf-8' if encoding == 'utf-8-sig' else encoding
+
+    def __iter__(self):
+        for line in self.f:
+            self.offset += len(line)
+            yield line.decode(self.encoding)
+
+
+def show_import_jobs(job_id=None):
+    """列出最近的导入任务；指定任务 ID 时显示每一批的耗时"""
+    with DBManager() as db:
+        if job_id is None:
+            print(f"{'ID':>5}  {'状态':<9} {'行数':>10} {'新增':>10} {'跳过':>9} {'错误':>7} {'批次':>5}  文件")
+            for job in db.get_import_jobs():
+                print(f"{job['id']:>5}  {job['status']:<9} {job['rows_done']:>10} {job['inserted']:>10} "
+                      f"{job['skipped']:>9} {job['invalid']:>7} {job['chunks']:>5}  {job['file_name']}")
+            return
+
+        job = db.get_import_job(job_id)
+        if not job:
+            print(f"❌ 导入任务不存在: {job_id}")
+            return
+        print(f"📋 导入任务 #{job['id']} {job['file_name']}（{job['status']}，开始于 {job['started_at']}）")
+        if job['error']:
+            print(f"   ❌ {job['error']}")
+        for chunk in db.get_import_job_chunks(job_id):
+            rate = chunk['rows_read'] / chunk['seconds'] if chunk['seconds'] else 0
+            print(f"   第 {chunk['chunk_no']:>4} 批: {chunk['rows_read']:>7} 行，写入 {chunk['rows_written']:>7}，"
+                  f"{chunk['seconds']:.3f} 秒（{rate:.0f} 行/秒），到第 {chunk['rows_done']} 行 / "
+                  f"{chunk['byte_offset']} 字节")
+
+
+# ========== pandas 导入 ==========
+
+def _read_csv_chunks(file_path, encoding):
+    import pandas as pd
+    return pd.read_csv(file_path, encoding=encoding, dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS)
+
+
+def import_from_csv(file_path, update_existing=False):
+    """
+    从 CSV 文件导入用户（pandas 向量化路径，分块读取）
+
+    Args:
+        file_path: CSV 文件路径
+        update_existing: 邮箱已存在时更新
+
+    Returns:
+        dict: 导入结果统计
+    """
+    print(f"📂 正在读取文件: {file_path}")
+
+    try:
+        reader = _read_csv_chunks(file_path, detect_encoding(file_path))
+        first = next(reader, None)
+    except Exception as e:
+        return {'success': False, 'error': f"读取文件失败: {e}"}
+
+    if first is None:
+        return {'success': False, 'error': "文件为空"}
+    error = check_columns(first.columns)
+    if error:
+        return error
+
+    chunks = itertools.chain([first], reader)
+    return import_chunks(((prepare_chunk(df), None) for df in chunks), update_existing)
+
+
+# ========== 流式导入（不依赖 pandas） ==========
+
+# 读文件的缓冲区大小
+READ_BUFFER_SIZE = 1024 * 1024
+
+_DATE_RE = re.compile(DATE_PATTERN)
+
+
+def prepare_rows(rows, indexes):
+    """
+    逐行校验一块 csv.reader 的结果，返回值与 prepare_chunk() 相同
+
+    Args:
+        rows: 行列表（list of list）
+        indexes: name / email / dob 三列在行中的位置
+    """
+    name_i, email_i, dob_i = indexes
+    width = max(indexes) + 1
+    email_match = Validators.EMAIL_REGEX.match
+    clean = {}
+    errors = []
+    duplicates = 0
+
+    for i, row in enumerate(rows):
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        name, email, dob_text = row[name_i].strip(), row[email_i].strip(), row[dob_i].strip()
+        if not (name and email and dob_text):
+            errors.append((i, "姓名、邮箱、生日不能为空"))
+            continue
+        if not email_match(email):
+            errors.append((i, f"无效的邮箱地址 - {email}"))
+            continue
+        m = _DATE_RE.match(dob_text)
+        try:
+            dob = date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+        except (AttributeError, ValueError):
+            errors.append((i, f"无效的日期格式 - {dob_text}"))
+            continue
+        # 同一块内重复的邮箱以最后一行为准
+        if email in clean:
+            duplicates += 1
+        clean[email] = (name, email, dob)
+
+    return len(rows), list(clean.values()), errors, duplicates
+
+
+def import_csv_stream(file_path, update_existing=False, chunk_rows=CHUNK_ROWS, restart=False):
+    """
+    流式导入 CSV：csv.reader 逐行读取缓冲文件，每 chunk_rows 行校验后写入一次
+
+    编码从文件开头判断，不会因解码失败重读文件；内存占用只与 chunk_rows 有关。
+    每批提交时记录检查点，同一文件再次导入时从上次中断的位置继续
+
+    Args:
+        file_path: CSV 文件路径
+        update_existing: 邮箱已存在时更新
+        chunk_rows: 每批行数
+        restart: 忽略未完成的导入，从头开始
+
+    Returns:
+        dict: 导入结果统计
+    """
+    print(f"📂 正在读取文件: {file_path}")
+
+    encoding = detect_encoding(file_path)
+    with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        try:
+            header = next(csv.reader([f.readline().decode(encoding)]), None)
+        except UnicodeDecodeError as e:
+            return {'success': False, 'error': f"文件编码错误（按 {encoding} 解码）: {e}"}
+        if not header:
+            return {'success': False, 'error': "文件为空"}
+        header = [col.strip() for col in header]
+        error = check_columns(header)
+        if error:
+            return error
+        indexes = [header.index(col) for col in REQUIRED_COLUMNS]
+
+        try:
+            job = begin_import_job(file_path, update_existing, restart)
+        except RuntimeError as e:
+            return {'success': False, 'error': str(e)}
+        if job['byte_offset'] > f.tell():
+            f.seek(job['byte_offset'])
+        lines = CountingLines(f, encoding)
+        reader = csv.reader(lines)
+
+        def chunks():
+            while True:
+                rows = list(itertools.islice(reader, chunk_rows))
+                if not rows:
+                    return
+                yield prepare_rows(rows, indexes), lines.offset
+
+        try:
+            return import_chunks(chunks(), update_existing, job)
+        except UnicodeDecodeError as e:
+            return {'success': False, 'error': f"文件编码错误（按 {encoding} 解码）: {e}"}
+
+
+def import_from_excel(file_path, update_existing=False):
     """
-    从 Excel 文件导入用户
+    从 Excel 文件导入用户（直接进入同一条流水线）
 
     Args:
         file_path: Excel 文件路径
+        update_existing: 邮箱已存在时更新
 
     Returns:
         dict: 导入结果统计
     """
     print(f"📂 正在读取 Excel 文件: {file_path}")
 
+    import pandas as pd
     try:
-        # 读取 Excel 文件
-        df = pd.read_excel(file_path)
+        df = pd.read_excel(file_path, dtype=str)
     except Exception as e:
         return {'success': False, 'error': f"读取 Excel 文件失败: {e}"}
 
-    # 将 DataFrame 保存为临时 CSV，然后复用导入逻辑
-    temp_csv = file_path.replace('.xlsx', '_temp.csv').replace('.xls', '_temp.csv')
-    df.to_csv(temp_csv, index=False, encoding='utf-8')
+    print(f"✅ 文件读取成功，共 {len(df)} 条记录\n")
+    error = check_columns(df.columns)
+    if error:
+        return error
+    chunks = (df.iloc[i:i + CHUNK_ROWS] for i in range(0, len(df), CHUNK_ROWS))
+    return import_chunks(((prepare_chunk(chunk), None) for chunk in chunks), update_existing)
+
+
+# ========== 多进程导入 ==========
 
+# 每个子进程一次解析的字节数（按行边界切分）
+RANGE_BYTES = 8 * 1024 * 1024
+
+
+def detect_encoding(file_path, sample_size=64 * 1024):
+    """根据文件开头判断编码：有 BOM 为 utf-8-sig，能按 UTF-8 解码为 utf-8，否则按 gbk"""
+    with open(file_path, 'rb') as f:
+        head = f.read(sample_size)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
     try:
-        result = import_from_csv(temp_csv)
-        return result
-    finally:
-        # 删除临时文件
-        if os.path.exists(temp_csv):
-            os.remove(temp_csv)
+        # 末尾可能截断在多字节字符中间，增量解码不要求结束
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gbk'
+
+
+def split_byte_ranges(file_path, start, range_bytes=RANGE_BYTES):
+    """从 start 开始按约 range_bytes 切分文件，每段结束在换行符之后（字段内不能含换行）"""
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + range_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+def parse_range(file_path, start, end, header, encoding):
+    """子进程：解析并校验 [start, end) 字节区间"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    text = data.decode('utf-8' if encoding == 'utf-8-sig' else encoding)
+    import pandas as pd
+    df = pd.read_csv(io.StringIO(header + text), dtype=str, keep_default_na=False)
+    return prepare_chunk(df)
+
+
+def import_csv_parallel(file_path, workers, update_existing=False, restart=False):
+    """
+    多进程导入大 CSV：按字节区间切分，子进程并行解析和校验，结果按文件顺序交给一个写入者
+
+    同时在途的区间最多 workers * 2 个，内存占用与文件大小无关；每个区间写入后记录检查点
+
+    Args:
+        file_path: CSV 文件路径
+        workers: 进程数
+        update_existing: 邮箱已存在时更新
+        restart: 忽略未完成的导入，从头开始
+
+    Returns:
+        dict: 导入结果统计
+    """
+    print(f"📂 正在读取文件: {file_path}（{workers} 个进程）")
+
+    encoding = detect_encoding(file_path)
+    with open(file_path, 'rb') as f:
+        header = f.readline().decode(encoding)
+        data_start = f.tell()
+    if not header.strip():
+        return {'success': False, 'error': "文件为空"}
+    error = check_columns(next(csv.reader([header])))
+    if error:
+        return error
+
+    try:
+        job = begin_import_job(file_path, update_existing, restart)
+    except RuntimeError as e:
+        return {'success': False, 'error': str(e)}
+    data_start = max(data_start, job['byte_offset'])
+
+    def results():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for start, end in split_byte_ranges(file_path, data_start):
+                pending.append((executor.submit(parse_range, file_path, start, end, header, encoding), end))
+                if len(pending) >= workers * 2:
+                    future, end = pending.popleft()
+                    yield future.result(), end
+            while pending:
+                future, end = pending.popleft()
+                yield future.result(), end
+
+    return import_chunks(results(), update_existing, job)
 
 
 def create_sample_csv(output_path="users_sample.csv"):
@@ -200,6 +567,11 @@ def main():
     if len(sys.argv) < 2:
         print("使用方法:")
         print("  python import_users.py <文件路径>           # 导入用户")
+        print("  python import_users.py <文件路径> --update  # 导入并更新已存在用户")
+        print("  python import_users.py <文件路径> --workers 4  # 多进程解析大 CSV 文件")
+        print("  python import_users.py <文件路径> --pandas  # CSV 使用 pandas 向量化校验")
+        print("  python import_users.py <文件路径> --restart # 不从上次中断处继续，重新导入")
+        print("  python import_users.py --jobs [任务ID]      # 查看导入记录 / 每批耗时")
         print("  python import_users.py --sample             # 创建示例文件")
         print("\n支持的文件格式: .csv, .xlsx, .xls")
         print("\nCSV 文件格式要求:")
@@ -208,6 +580,27 @@ def main():
         return
 
     file_path = sys.argv[1]
+    options = sys.argv[2:]
+    update_existing = '--update' in options
+    restart = '--restart' in options
+
+    # 补齐新增的表结构（import_jobs 等）
+    try:
+        with DBManager() as db:
+            db.ensure_schema()
+    except Exception as e:
+        print(f"⚠️ 表结构检查失败: {e}")
+
+    if file_path == '--jobs':
+        show_import_jobs(int(options[0]) if options and options[0].isdigit() else None)
+        return
+    workers = 1
+    if '--workers' in options:
+        try:
+            workers = max(1, int(options[options.index('--workers') + 1]))
+        except (IndexError, ValueError):
+            print("❌ --workers 需要一个正整数")
+            return
 
     if file_path in ['--sample', '-s', 'sample']:
         # 创建示例文件
@@ -221,10 +614,14 @@ def main():
     # 判断文件类型并导入
     file_ext = os.path.splitext(file_path)[1].lower()
 
-    if file_ext == '.csv':
-        result = import_from_csv(file_path)
+    if file_ext == '.csv' and workers > 1:
+        result = import_csv_parallel(file_path, workers, update_existing, restart)
+    elif file_ext == '.csv' and '--pandas' in options:
+        result = import_from_csv(file_path, update_existing)
+    elif file_ext == '.csv':
+        result = import_csv_stream(file_path, update_existing, restart=restart)
     elif file_ext in ['.xlsx', '.xls']:
-        result = import_from_excel(file_path)
+        result = import_from_excel(file_path, update_existing)
     else:
         print(f"❌ 不支持的文件格式: {file_ext}")
         print("   支持的格式: .csv, .xlsx, .xls")
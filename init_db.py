@@ -274,9 +274,27 @@ def init_mysql():
 def init_database():
     """根据配置初始化数据库"""
     if Config.DB_TYPE.lower() == "sqlite":
-        return init_sqlite()
+        ok = init_sqlite()
     else:
-        return init_mysql()
+        ok = init_mysql()
+
+    if ok:
+        ensure_extra_schema()
+    return ok
+
+
+def ensure_extra_schema():
+    """创建后续版本新增的表（由 DBManager.ensure_schema 统一维护）"""
+    from db_manager import DBManager
+
+    try:
+        with DBManager() as db:
+            db.ensure_schema()
+        print("✅ 扩展表结构已就绪")
+        return True
+    except Exception as e:
+        print(f"❌ 扩展表结构创建失败: {e}")
+        return False
 
 
 def reset_database():
@@ -293,7 +311,7 @@ def reset_database():
         if os.path.exists(Config.DB_SQLITE_PATH):
             os.remove(Config.DB_SQLITE_PATH)
             print(f"✅ 已删除数据库文件")
-        return init_sqlite()
+        return init_database()
     else:
         # MySQL 重置
         import pymysql
@@ -309,7 +327,7 @@ def reset_database():
                 cursor.execute(f"DROP DATABASE IF EXISTS {Config.DB_NAME}")
                 print(f"✅ 数据库 '{Config.DB_NAME}' 已删除")
             conn.close()
-            return init_mysql()
+            return init_database()
         except Exception as e:
             print(f"❌ 重置失败: {e}")
             return False
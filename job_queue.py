@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Web 进程内的后台任务队列
+手动发送、批量导入等耗时操作由路由提交到这里，立即返回任务 ID；
+JOB_WORKERS 个后台线程依次执行，进度、结果和耗时通过 /api/jobs/<id> 查询。
+请求线程不再等待 TLS 握手、SMTP 往返或整份文件写库。
+
+任务在提交它的进程内执行；状态变化（以及每秒至多一次的进度）写入 background_jobs 表，
+多 worker 部署时轮询落到其他进程也能查到。
+
+进程重启后未完成的任务不会继续执行：本进程定期刷新未结束任务的心跳，
+超过 JOB_STALE_SECONDS 没有心跳的排队中 / 执行中任务在队列启动或被查询时标记为失败，轮询方不会一直等下去
+"""
+
+import json
+import queue
+import time
+from collections import OrderedDict
+from threading import Lock, Thread
+from config import Config
+from db_manager import DBManager
+
+
+# 进度写入数据库的最小间隔（秒）
+PROGRESS_SAVE_INTERVAL = 1.0
+
+
+def _heartbeat_interval():
+    """心跳间隔：过期时限的五分之一"""
+    return max(1.0, Config.JOB_STALE_SECONDS / 5)
+
+
+def _save(job_id, **fields):
+    """把任务状态写入 background_jobs（失败只告警，不影响任务本身）"""
+    try:
+        with DBManager() as db:
+            db.update_background_job(int(job_id), heartbeat_at=time.time(), **fields)
+    except Exception as e:
+        print(f"⚠️ [任务] 保存任务 {job_id} 状态失败: {e}")
+
+
+class Job:
+    """一个后台任务"""
+
+    def __init__(self, job_id, kind, func, args, kwargs, queued_at=None):
+        self.id = job_id
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+        self.status = 'queued'     # queued / running / done / failed
+        self.progress = None       # 0-100，任务不汇报时为 None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.queued_at = queued_at or time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._saved_at = 0
+
+    def report(self, progress=None, message=None, result=None):
+        """任务执行中汇报进度（result 为阶段性结果，如导入明细，需可 JSON 序列化）"""
+        if progress is not None:
+            self.progress = round(progress, 1)
+        if message is not None:
+            self.message = message[:255]
+        if result is not None:
+            self.result = result
+        if time.time() - self._saved_at >= PROGRESS_SAVE_INTERVAL:
+            self._saved_at = time.time()
+            fields = {'progress': self.progress, 'message': self.message}
+            if result is not None:
+                fields['result'] = json.dumps(result, ensure_ascii=False, default=str)
+            _save(self.id, **fields)
+
+    def run(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        _save(self.id, status=self.status, started_at=self.started_at)
+        try:
+            self.result = self.func(self, *self.args, **self.kwargs)
+            self.progress = 100.0
+            self.status = 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+            print(f"❌ [任务] {self.kind}#{self.id} 失败: {e}")
+        finally:
+            self.finished_at = time.time()
+            _save(self.id, status=self.status, progress=self.progress, message=self.message,
+                  result=json.dumps(self.result, ensure_ascii=False, default=str),
+                  error=self.error, finished_at=self.finished_at)
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        """状态、进度、结果和耗时（JSON）"""
+        now = time.time()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'queued_seconds': round((self.started_at or now) - self.queued_at, 3),
+            'run_seconds': round((self.finished_at or now) - self.started_at, 3) if self.started_at else 0,
+        }
+
+
+def record_to_dict(record):
+    """background_jobs 记录转为与 Job.to_dict() 相同的结构（任务不在本进程时使用）"""
+    now = time.time()
+    started_at, finished_at = record['started_at'], record['finished_at']
+    return {
+        'id': str(record['id']),
+        'kind': record['kind'],
+        'status': record['status'],
+        'progress': record['progress'],
+        'message': record['message'],
+        'result': json.loads(record['result']) if record['result'] else None,
+        'error': record['error'],
+        'queued_seconds': round((started_at or now) - record['queued_at'], 3),
+        'run_seconds': round((finished_at or now) - started_at, 3) if started_at else 0,
+    }
+
+
+class JobQueue:
+    """固定数量工作线程的任务队列"""
+
+    def __init__(self, workers=None, max_jobs=None):
+        self.workers = workers or Config.JOB_WORKERS
+        self.max_jobs = max_jobs or Config.JOB_HISTORY
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = Lock()
+        self._threads = []
+
+    def _start_workers(self):
+        # 第一次提交时才启动线程（gunicorn 预加载应用后 fork 的子进程里线程不会被继承）
+        if not self._threads:
+            for i in range(self.workers):
+                thread = Thread(target=self._work, name=f"job-worker-{i + 1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _heartbeat(self):
+        """定期刷新本进程内未结束任务的心跳，其他进程据此判断它们仍有人执行"""
+        while True:
+            time.sleep(_heartbeat_interval())
+            with self._lock:
+                job_ids = [int(job.id) for job in self._jobs.values() if not job.finished]
+            if not job_ids:
+                continue
+            try:
+                with DBManager() as db:
+                    db.touch_background_jobs(job_ids, time.time())
+            except Exception as e:
+                print(f"⚠️ [任务] 刷新任务心跳失败: {e}")
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                self._queue.task_done()
+
+    def submit(self, kind, func, *args, **kwargs):
+        """
+        提交任务，立即返回 Job
+
+        Args:
+            kind: 任务类型（send / import ...）
+            func: func(job, *args, **kwargs)，返回值作为结果（需可 JSON 序列化），抛出异常即失败
+        """
+        queued_at = time.time()
+        with DBManager() as db:
+            job_id = db.create_background_job(kind, queued_at)
+        job = Job(str(job_id), kind, func, args, kwargs, queued_at)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+            for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[job_id]
+            self._start_workers()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        """按 ID 查找任务，不存在返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_stats(self):
+        """队列状态"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            'workers': self.workers,
+            'queued': sum(1 for j in jobs if j.status == 'queued'),
+            'running': sum(1 for j in jobs if j.status == 'running'),
+            'done': sum(1 for j in jobs if j.status == 'done'),
+            'failed': sum(1 for j in jobs if j.status == 'failed'),
+        }
+
+
+# 全局单例（本进程内共享）
+_queue_instance = None
+_queue_lock = Lock()
+
+
+def fail_stale_jobs():
+    """把所在进程已退出（超过 JOB_STALE_SECONDS 没有心跳）的未结束任务标记为失败，返回条数"""
+    now = time.time()
+    try:
+        with DBManager() as db:
+            count = db.fail_stale_background_jobs(now - Config.JOB_STALE_SECONDS, now)
+    except Exception as e:
+        print(f"⚠️ [任务] 清理过期任务失败: {e}")
+        return 0
+    if count:
+        print(f"🧹 [任务] {count} 个任务所在的进程已退出，已标记为失败")
+    return count
+
+
+def get_job_queue():
+    """获取本进程的任务队列（首次创建时清理其他进程遗留的过期任务）"""
+    global _queue_instance
+    with _queue_lock:
+        if _queue_instance is None:
+            _queue_instance = JobQueue()
+            fail_stale_jobs()
+        return _queue_instance
+
+
+def submit_job(kind, func, *args, **kwargs):
+    """get_job_queue().submit 的简写"""
+    return get_job_queue().submit(kind, func, *args, **kwargs)
+
+
+def get_job(job_id):
+    """
+    按 ID 查找任务的状态（dict），不存在返回 None
+
+    本进程内没有时读 background_jobs（多 worker 部署时轮询可能落到其他进程）
+    """
+    job = get_job_queue().get(job_id)
+    if job is not None:
+        return job.to_dict()
+    if not job_id.isdigit():
+        return None
+    with DBManager() as db:
+        record = db.get_background_job(int(job_id))
+        if (record and record['status'] in ('queued', 'running')
+                and (record['heartbeat_at'] or record['queued_at']) < time.time() - Config.JOB_STALE_SECONDS):
+            # 执行它的进程已退出
+            fail_stale_jobs()
+            record = db.get_background_job(int(job_id))
+    return record_to_dict(record) if record else None
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+发送日志归档
+早于 LOG_RETENTION_DAYS 天的 send_logs 按批移到 LOG_ARCHIVE_DIR 下的 gzip JSON Lines 文件：
+每批写入临时文件、fsync 后原子改名为 send_logs-<首个ID>-<最后ID>.jsonl.gz，再从数据库删除这一批。
+中途中断时下次会选中同一批、生成同名文件覆盖，不会重复归档。
+
+归档文件逐行流式读取，日志页面可以分页浏览
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import argparse
+import itertools
+from datetime import date, timedelta
+from config import Config
+from db_manager import DBManager
+from export_data import EXPORTS, encode_rows, gzip_chunks
+
+
+ARCHIVE_COLUMNS = EXPORTS['logs'][1]
+
+_ARCHIVE_RE = re.compile(r'^send_logs-(\d+)-(\d+)\.jsonl\.gz$')
+
+
+def archive_path(name):
+    """归档文件的完整路径；文件名不合法时抛出 ValueError"""
+    if not _ARCHIVE_RE.match(name or ''):
+        raise ValueError(f"无效的归档文件名: {name}")
+    return os.path.join(Config.LOG_ARCHIVE_DIR, name)
+
+
+def _write_archive(rows):
+    """把一批日志写成归档文件，返回文件名"""
+    name = f"send_logs-{rows[0]['id']:010d}-{rows[-1]['id']:010d}.jsonl.gz"
+    path = archive_path(name)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for chunk in gzip_chunks(encode_rows(rows, ARCHIVE_COLUMNS, 'jsonl')):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return name
+
+
+def archive_send_logs(days=None, batch_size=None, db=None):
+    """
+    把早于 days 天的发送日志移入归档文件
+
+    Args:
+        days: 保留天数（默认 LOG_RETENTION_DAYS）
+        batch_size: 每批（每个文件）条数（默认 LOG_ARCHIVE_BATCH_SIZE）
+        db: 数据库连接（默认自行打开）
+
+    Returns:
+        dict: {'files': 文件数, 'rows': 归档条数}
+    """
+    days = Config.LOG_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or Config.LOG_ARCHIVE_BATCH_SIZE
+    stats = {'files': 0, 'rows': 0}
+    if days <= 0:
+        return stats
+
+    before = date.today() - timedelta(days=days)
+    os.makedirs(Config.LOG_ARCHIVE_DIR, exist_ok=True)
+    own_db = db is None
+    db = db or DBManager()
+    try:
+        while True:
+            rows = db.get_send_logs_to_archive(before, batch_size)
+            if not rows:
+                break
+            name = _write_archive(rows)
+            deleted = db.delete_archived_send_logs(before, rows[-1]['id'])
+            stats['files'] += 1
+            stats['rows'] += deleted
+            print(f"🗄️ [归档] {name}: {len(rows)} 条")
+            if len(rows) < batch_size:
+                break
+    finally:
+        if own_db:
+            db.close()
+    return stats
+
+
+def list_archives():
+    """归档文件列表（最新的在前）"""
+    if not os.path.isdir(Config.LOG_ARCHIVE_DIR):
+        return []
+    result = []
+    for name in os.listdir(Config.LOG_ARCHIVE_DIR):
+        m = _ARCHIVE_RE.match(name)
+        if m:
+            result.append({
+                'name': name,
+                'first_id': int(m.group(1)),
+                'last_id': int(m.group(2)),
+                'size': os.path.getsize(os.path.join(Config.LOG_ARCHIVE_DIR, name)),
+            })
+    return sorted(result, key=lambda item: item['first_id'], reverse=True)
+
+
+def iter_archive(name):
+    """逐行读取归档文件中的日志（边解压边解析）"""
+    with gzip.open(archive_path(name), 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_archive(name, offset=0, limit=200):
+    """读取归档文件中的一页日志，只解压到这一页为止"""
+    return list(itertools.islice(iter_archive(name), offset, offset + limit))
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='归档早期的发送日志')
+    parser.add_argument('--days', type=int, default=Config.LOG_RETENTION_DAYS, help='保留天数')
+    parser.add_argument('--batch-size', type=int, default=Config.LOG_ARCHIVE_BATCH_SIZE, help='每个文件的条数')
+    parser.add_argument('--list', action='store_true', help='列出归档文件')
+    args = parser.parse_args()
+
+    if args.list:
+        for item in list_archives():
+            print(f"{item['name']}  {item['size'] / 1024:.1f} KB")
+        return
+
+    if args.days <= 0:
+        print("❌ 保留天数必须大于 0", file=sys.stderr)
+        sys.exit(1)
+    stats = archive_send_logs(args.days, args.batch_size)
+    print(f"✅ 已归档 {stats['rows']} 条日志，{stats['files']} 个文件 -> {Config.LOG_ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
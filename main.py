@@ -4,13 +4,21 @@
 每天定时扫描并发送生日祝福邮件
 """
 
-import schedule
-import time
+import os
 import sys
-from datetime import datetime
+import time
+import random
+import sqlite3
+from collections import deque
+from datetime import datetime, timedelta
 from db_manager import DBManager
-from email_service import send_birthday_email
+from email_service import print_session_stats, get_retry_queue, build_birthday_message, CIRCUIT_OPEN_ERROR
+from spool import SpoolWriter, FORMAT_MAILDIR, FORMAT_PICKUP
+from transports import get_transport, deliver
+from sent_bitmap import get_sent_bitmap, save_sent_bitmaps
+from log_archive import archive_send_logs
 from config import Config
+from scheduler import Scheduler, CronExpression, daily_cron, MISSED_SKIP
 
 
 def print_banner():
@@ -24,6 +32,67 @@ def print_banner():
     print(banner)
 
 
+# 补发队列：启动时由 catch-up 填充，调度器按速率逐个发送
+_catch_up_queue = deque()
+_catch_up_end = None
+
+# 待补发/重试队列清空后才写入的完成日期
+_pending_completion = None
+
+SCAN_JOB_NAME = 'scan_and_send'
+CATCH_UP_JOB_NAME = 'catch_up'
+RETRY_JOB_NAME = 'retry_deferred'
+
+
+def complete_when_drained(db, run_date):
+    """
+    记录扫描任务完成日期；补发或熔断重试队列未清空时先挂起，
+    避免停机后丢失待发送用户（重启时由 catch-up 重新找回）
+    """
+    global _pending_completion
+
+    if _pending_completion is None or run_date > _pending_completion:
+        _pending_completion = run_date
+
+    if _catch_up_queue or get_retry_queue():
+        return False
+
+    db.mark_job_completed(SCAN_JOB_NAME, _pending_completion)
+    _pending_completion = None
+    return True
+
+
+def build_message_item(db, user, year=None):
+    """为用户挑选祝福语，生成传输层的邮件条目"""
+    print(f"\n📧 正在处理: {user['name']} ({user['email']})")
+
+    # 获取随机祝福语
+    wish = db.get_random_wish()
+    print(f"   祝福语: {wish[:30]}...")
+    return {'email': user['email'], 'name': user['name'], 'wish': wish, 'user': user, 'year': year}
+
+
+def record_send_result(db, user, is_sent, error_msg, year=None, message_id=None):
+    """
+    更新发送状态，返回是否成功
+
+    message_id 为传输层返回的消息 ID（HTTP API 的 id、落盘的 spool id），记入 send_logs；
+    熔断期间不写失败日志，用户进入重试队列等待中继恢复
+    """
+    if is_sent:
+        db.update_send_status(user['id'], success=True, year=year, message_id=message_id)
+    elif error_msg != CIRCUIT_OPEN_ERROR:
+        db.update_send_status(user['id'], success=False, error_msg=error_msg, year=year, message_id=message_id)
+    return is_sent
+
+
+def send_to_user(db, user, year=None):
+    """向单个用户发送祝福并更新发送状态，返回是否成功"""
+    item = build_message_item(db, user, year)
+    is_sent, error_msg, message_id = get_transport().send_many([item])[0]
+    return record_send_result(db, user, is_sent, error_msg, year, message_id)
+
+
 def job_scan_and_send():
     """定时任务：扫描并发送生日邮件"""
     print("\n" + "=" * 55)
@@ -34,47 +103,45 @@ def job_scan_and_send():
     try:
         db = DBManager()
 
-        # 1. 获取今天过生日的用户
-        users = db.get_todays_birthdays()
+        # 1. 获取今天过生日的用户（发送位图再确认一遍，避免其他进程刚发过的重复发送）
+        sent = get_sent_bitmap(db)
+        users = [user for user in db.get_todays_birthdays() if user['id'] not in sent]
 
         if not users:
             print("📭 今天暂时没有人过生日。")
-            return
-
-        print(f"🎉 发现 {len(users)} 位寿星，准备发送...")
-
-        # 2. 遍历发送邮件
-        success_count = 0
-        failed_count = 0
-
-        for user in users:
-            print(f"\n📧 正在处理: {user['name']} ({user['email']})")
-
-            # 获取随机祝福语
-            wish = db.get_random_wish()
-            print(f"   祝福语: {wish[:30]}...")
-
-            # 发送邮件
-            is_sent, error_msg = send_birthday_email(
-                user['email'],
-                user['name'],
-                wish
-            )
-
-            # 更新发送状态
-            if is_sent:
-                db.update_send_status(user['id'], success=True)
-                success_count += 1
-            else:
-                db.update_send_status(user['id'], success=False, error_msg=error_msg)
-                failed_count += 1
-
-        # 3. 输出结果统计
-        print("\n" + "=" * 55)
-        print(f"📊 本次任务完成:")
-        print(f"   ✅ 成功: {success_count} 封")
-        print(f"   ❌ 失败: {failed_count} 封")
-        print("=" * 55 + "\n")
+        else:
+            print(f"🎉 发现 {len(users)} 位寿星，准备发送...")
+
+            # 2. 按传输的批量提示分批发送（SMTP 复用发件账号池中的会话）
+            success_count = 0
+            failed_count = 0
+            deferred_before = len(get_retry_queue())
+
+            transport = get_transport()
+            items = [build_message_item(db, user) for user in users]
+            for item, (is_sent, error_msg, message_id) in zip(items, deliver(items, transport)):
+                if record_send_result(db, item['user'], is_sent, error_msg, message_id=message_id):
+                    success_count += 1
+                else:
+                    failed_count += 1
+            session_stats = transport.close()
+            deferred_count = len(get_retry_queue()) - deferred_before
+            failed_count -= deferred_count
+
+            # 3. 输出结果统计
+            print("\n" + "=" * 55)
+            print(f"📊 本次任务完成:")
+            print(f"   ✅ 成功: {success_count} 封")
+            print(f"   ❌ 失败: {failed_count} 封")
+            if deferred_count:
+                print(f"   🔌 熔断推迟: {deferred_count} 封（中继恢复后自动重试）")
+            for stats in session_stats:
+                print_session_stats(stats)
+            print("=" * 55 + "\n")
+
+        # 4. 保存发送位图，记录完成标记
+        save_sent_bitmaps(db)
+        complete_when_drained(db, datetime.now().date())
 
     except KeyboardInterrupt:
         print("\n⚠️ 任务被用户中断")
@@ -88,11 +155,154 @@ def job_scan_and_send():
             db.close()
 
 
+def prepare_catch_up(include_today):
+    """
+    启动时的补发检查：找出上次完成运行之后错过的生日并放入补发队列
+
+    Args:
+        include_today: 今天的定时发送时间是否已过（已过则今天也需要补发）
+
+    Returns:
+        int: 入队人数
+    """
+    global _catch_up_end
+
+    today = datetime.now().date()
+    end_date = today if include_today else today - timedelta(days=1)
+
+    db = DBManager()
+    try:
+        last_date = db.get_last_completed_run(SCAN_JOB_NAME)
+        if last_date is None:
+            # 首次运行没有标记，不回溯，只记录起点
+            db.mark_job_completed(SCAN_JOB_NAME, end_date)
+            return 0
+
+        # 最多回溯 CATCHUP_MAX_DAYS 天
+        start_date = max(last_date, today - timedelta(days=Config.CATCHUP_MAX_DAYS))
+        if start_date >= end_date:
+            return 0
+
+        users = db.get_missed_birthdays(start_date, end_date)
+        if not users:
+            db.mark_job_completed(SCAN_JOB_NAME, end_date)
+            return 0
+
+        print(f"🕰️ [补发] {start_date} ~ {end_date} 期间错过 {len(users)} 位寿星，已加入补发队列")
+        _catch_up_queue.extend(users)
+        _catch_up_end = end_date
+        return len(users)
+    finally:
+        db.close()
+
+
+def job_catch_up(scheduler=None):
+    """定时任务：从补发队列取出一位用户发送，队列清空后记录完成标记"""
+    if not _catch_up_queue:
+        return
+
+    db = DBManager()
+    try:
+        user = _catch_up_queue.popleft()
+        year = user.get('birthday_year')
+        if user['id'] in get_sent_bitmap(db, year):
+            print(f"⏭️ [补发] {user['name']} 的 {year} 年祝福已发送，跳过")
+        else:
+            send_to_user(db, user, year=year)
+
+        if not _catch_up_queue:
+            save_sent_bitmaps(db)
+            complete_when_drained(db, _catch_up_end)
+            for stats in get_transport().close():
+                print_session_stats(stats)
+            print(f"✅ [补发] 补发队列已完成（截至 {_catch_up_end}）")
+            if scheduler is not None:
+                scheduler.remove_job(CATCH_UP_JOB_NAME)
+    finally:
+        db.close()
+
+
+def job_retry_deferred():
+    """定时任务：熔断恢复后重发被推迟的邮件"""
+    queue = get_retry_queue()
+    if not queue:
+        return
+
+    print(f"🔁 [重试] 重试队列中有 {len(queue)} 封推迟的邮件")
+    db = DBManager()
+    try:
+        # 仍在熔断时 send_birthday_email 会把条目重新放回队尾，因此只遍历一轮
+        for _ in range(len(queue)):
+            if not queue:
+                break
+            item = queue.popleft()
+            if item['user']['id'] in get_sent_bitmap(db, item['year']):
+                continue
+            send_to_user(db, item['user'], year=item['year'])
+        get_transport().close()
+        save_sent_bitmaps(db)
+
+        if not queue and _pending_completion is not None:
+            complete_when_drained(db, _pending_completion)
+    finally:
+        db.close()
+
+
 def job_backup_database():
     """定时任务：每周备份数据库（可选）"""
     print(f"🔄 [备份] 数据库备份任务执行中... [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
-    # TODO: 实现数据库备份逻辑
-    print("📁 [备份] 备份功能待实现")
+
+    db = DBManager()
+    try:
+        if db.db_type != "sqlite":
+            # MySQL / PostgreSQL 请使用 mysqldump / pg_dump 等原生工具
+            print(f"ℹ️ [备份] {db.db_type} 数据库请使用原生备份工具，跳过")
+            return
+
+        os.makedirs(Config.BACKUP_DIR, exist_ok=True)
+        filename = f"birthday_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+        backup_path = os.path.join(Config.BACKUP_DIR, filename)
+
+        # 使用 SQLite 在线备份 API，备份期间不阻塞写入
+        target = sqlite3.connect(backup_path)
+        try:
+            db.conn.backup(target)
+        finally:
+            target.close()
+        print(f"📁 [备份] 已备份到: {backup_path}")
+
+        # 只保留最近 BACKUP_KEEP 份
+        backups = sorted(
+            f for f in os.listdir(Config.BACKUP_DIR)
+            if f.startswith('birthday_') and f.endswith('.db')
+        )
+        for old in backups[:-Config.BACKUP_KEEP] if Config.BACKUP_KEEP > 0 else []:
+            os.remove(os.path.join(Config.BACKUP_DIR, old))
+            print(f"🗑️ [备份] 已清理旧备份: {old}")
+    finally:
+        db.close()
+
+
+def job_archive_send_logs():
+    """定时任务：把早于 LOG_RETENTION_DAYS 天的发送日志移入归档文件"""
+    print(f"🔄 [归档] 发送日志归档任务执行中... [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
+    stats = archive_send_logs()
+    print(f"🗄️ [归档] 已归档 {stats['rows']} 条日志（{stats['files']} 个文件）")
+
+
+def show_missed(year=None):
+    """列出某年生日已过却没有发送成功的用户（按发送位图比对）"""
+    year = year or datetime.now().year
+    with DBManager() as db:
+        users = db.get_missed_users(year)
+    if not users:
+        print(f"✅ {year} 年没有漏发的用户")
+        return
+    print(f"📭 {year} 年漏发 {len(users)} 位用户:")
+    for user in users[:50]:
+        print(f"   {user['id']:>8}  {user['name']}  {user['email']}  {user['dob']}")
+    if len(users) > 50:
+        print(f"   ... 还有 {len(users) - 50} 位")
 
 
 def run_once():
@@ -101,14 +311,113 @@ def run_once():
     job_scan_and_send()
 
 
+def run_spool(path, fmt=FORMAT_MAILDIR):
+    """
+    落盘模式：只生成邮件，写入 maildir / pickup 目录交给本机 MTA 投递
+
+    每 SPOOL_BATCH_SIZE 封为一批：渲染 -> 写临时文件 -> fsync 一次 -> 原子改名，
+    随后在同一事务中记录该批的 spool id，生成速度只受磁盘限制
+    """
+    print(f"📥 落盘模式：写入 {fmt} 目录 {path}\n")
+    writer = SpoolWriter(path, fmt)
+    started = time.perf_counter()
+
+    with DBManager() as db:
+        users = db.get_todays_birthdays()
+        if not users:
+            print("📭 今天暂时没有人过生日。")
+            return
+
+        wishes = db.get_active_wishes()
+        for start in range(0, len(users), Config.SPOOL_BATCH_SIZE):
+            batch = users[start:start + Config.SPOOL_BATCH_SIZE]
+            messages = [
+                build_birthday_message(user['email'], user['name'], random.choice(wishes)).as_bytes()
+                for user in batch
+            ]
+            spool_ids = writer.write_batch(messages)
+            db.record_send_results([
+                (user['id'], True, None, None, spool_id)
+                for user, spool_id in zip(batch, spool_ids)
+            ])
+            print(f"   ✅ 第 {writer.batches} 批: {len(spool_ids)} 封")
+
+        complete_when_drained(db, datetime.now().date())
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats = writer.get_stats()
+    print(f"\n📊 已落盘 {stats['messages']} 封 / {stats['batches']} 批, "
+          f"{stats['bytes_written'] / 1024 / 1024:.1f} MB, {stats['messages'] / elapsed:.0f} 封/秒, "
+          f"fsync 耗时 {stats['sync_time']}s")
+
+
+def build_scheduler():
+    """根据配置创建调度器并注册任务"""
+    scheduler = Scheduler()
+
+    send_cron = CronExpression(Config.SEND_CRON) if Config.SEND_CRON else daily_cron(Config.SEND_TIME)
+    scheduler.add_job(
+        SCAN_JOB_NAME,
+        job_scan_and_send,
+        cron=send_cron,
+        jitter=Config.SCHEDULER_JITTER_SECONDS,
+        missed_policy=Config.SCHEDULER_MISSED_POLICY,
+        grace_seconds=Config.SCHEDULER_GRACE_SECONDS
+    )
+
+    # 熔断恢复后重发推迟的邮件
+    scheduler.add_job(
+        RETRY_JOB_NAME,
+        job_retry_deferred,
+        interval=Config.CIRCUIT_RECOVERY_SECONDS,
+        missed_policy=MISSED_SKIP
+    )
+
+    # 可选：每周备份（错过则跳过，等下一个周期）
+    if Config.BACKUP_CRON:
+        scheduler.add_job(
+            'backup_database',
+            job_backup_database,
+            cron=Config.BACKUP_CRON,
+            missed_policy=MISSED_SKIP,
+            grace_seconds=Config.SCHEDULER_GRACE_SECONDS
+        )
+
+    # 发送日志归档（错过则跳过，等下一个周期）
+    if Config.LOG_ARCHIVE_CRON and Config.LOG_RETENTION_DAYS > 0:
+        scheduler.add_job(
+            'archive_send_logs',
+            job_archive_send_logs,
+            cron=Config.LOG_ARCHIVE_CRON,
+            missed_policy=MISSED_SKIP,
+            grace_seconds=Config.SCHEDULER_GRACE_SECONDS
+        )
+
+    return scheduler
+
+
 def run_daemon():
     """以守护进程模式运行"""
     # 设置定时任务
-    schedule.every().day.at(Config.SEND_TIME).do(job_scan_and_send)
-    # 可选：每周备份
-    # schedule.every().week.at("02:00").do(job_backup_database)
+    scheduler = build_scheduler()
+
+    # 停机期间错过的生日：入队后按 CATCHUP_RATE_PER_MINUTE 速率补发
+    try:
+        scan_job = scheduler.jobs[SCAN_JOB_NAME]
+        include_today = scan_job.next_run.date() > datetime.now().date()
+        if prepare_catch_up(include_today):
+            interval = max(60.0 / max(Config.CATCHUP_RATE_PER_MINUTE, 1), Config.MIN_EMAIL_INTERVAL)
+            scheduler.add_job(
+                CATCH_UP_JOB_NAME,
+                lambda: job_catch_up(scheduler),
+                interval=interval,
+                missed_policy=MISSED_SKIP
+            )
+    except Exception as e:
+        print(f"⚠️ 补发检查失败: {e}")
 
-    print(f"📅 定时任务已设置: 每天 {Config.SEND_TIME} 执行")
+    for job in scheduler.get_stats():
+        print(f"📅 定时任务已设置: {job['name']} [{job['schedule']}] 下次执行 {job['next_run']}")
     print(f"⏰ 当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("⏳ 等待定时任务触发... (按 Ctrl+C 退出)\n")
 
@@ -126,13 +435,15 @@ def run_daemon():
 
     print("")
 
-    # 持续运行
+    # 持续运行（睡眠到下一个任务到期）
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        scheduler.run_forever()
     except KeyboardInterrupt:
-        print("\n\n👋 程序已退出")
+        print("\n\n📊 任务运行统计:")
+        for job in scheduler.get_stats():
+            print(f"   - {job['name']}: 运行 {job['run_count']} 次, "
+                  f"平均耗时 {job['avg_duration']}s, 最长 {job['max_duration']}s")
+        print("\n👋 程序已退出")
 
 
 def main():
@@ -147,6 +458,13 @@ def main():
             print(f"   - {error}")
         sys.exit(1)
 
+    # 补齐新增的表结构（job_runs 等）
+    try:
+        with DBManager() as db:
+            db.ensure_schema()
+    except Exception as e:
+        print(f"⚠️ 表结构检查失败: {e}")
+
     # 解析命令行参数
     if len(sys.argv) > 1:
         command = sys.argv[1].lower()
@@ -154,12 +472,38 @@ def main():
         if command in ['--once', '-o', 'test', 'run']:
             # 立即执行一次
             run_once()
+        elif command == '--spool':
+            # 落盘模式：python main.py --spool DIR [pickup]
+            if len(sys.argv) < 3:
+                print("❌ 请指定落盘目录: python main.py --spool DIR [maildir|pickup]")
+                sys.exit(1)
+            fmt = sys.argv[3].lower() if len(sys.argv) > 3 else FORMAT_MAILDIR
+            if fmt not in (FORMAT_MAILDIR, FORMAT_PICKUP):
+                print(f"❌ 未知的落盘格式: {fmt}（可选: maildir, pickup）")
+                sys.exit(1)
+            run_spool(sys.argv[2], fmt)
+        elif command == '--missed':
+            # 某年漏发的用户：python main.py --missed [YEAR]
+            show_missed(int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else None)
+        elif command == '--rebuild-stats':
+            # 由发送日志重算每日统计汇总，并按 users 表重算生日分布：python main.py --rebuild-stats [YYYY-MM-DD]
+            start = datetime.strptime(sys.argv[2], '%Y-%m-%d').date() if len(sys.argv) > 2 else None
+            with DBManager() as db:
+                rows = db.rebuild_send_stats(start)
+                db.rebuild_birthday_counts()
+            print(f"✅ 已重算每日发送统计（{rows} 行）和生日分布")
         elif command in ['--help', '-h', 'help']:
             # 显示帮助
             print("""
 使用方法:
     python main.py              # 以守护进程模式运行
     python main.py --once       # 立即执行一次任务（测试用）
+    python main.py --spool DIR [maildir|pickup]
+                                # 落盘模式：今日祝福写入目录，交给本机 MTA 投递
+    python main.py --missed [YEAR]
+                                # 列出某年生日已过却没有发送成功的用户
+    python main.py --rebuild-stats [YYYY-MM-DD]
+                                # 由发送日志重算（回填）每日发送统计，并重算生日分布
     python main.py -h           # 显示帮助信息
             """)
         else:
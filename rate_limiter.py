@@ -22,12 +22,12 @@ class RateLimiter:
     - 平滑发送控制（避免瞬间爆发）
     """
 
-    def __init__(self):
-        # 速率配置
-        self.max_per_hour = getattr(Config, 'MAX_EMAILS_PER_HOUR', 50)
-        self.max_per_day = getattr(Config, 'MAX_EMAILS_PER_DAY', 200)
-        self.cooldown_seconds = getattr(Config, 'EMAIL_COOLDOWN_SECONDS', 300)  # 5分钟
-        self.min_interval_seconds = getattr(Config, 'MIN_EMAIL_INTERVAL', 2)  # 最小间隔2秒
+    def __init__(self, max_per_hour=None, max_per_day=None, cooldown_seconds=None, min_interval_seconds=None):
+        # 速率配置（未指定时使用 Config 中的全局配置）
+        self.max_per_hour = max_per_hour if max_per_hour is not None else getattr(Config, 'MAX_EMAILS_PER_HOUR', 50)
+        self.max_per_day = max_per_day if max_per_day is not None else getattr(Config, 'MAX_EMAILS_PER_DAY', 200)
+        self.cooldown_seconds = cooldown_seconds if cooldown_seconds is not None else getattr(Config, 'EMAIL_COOLDOWN_SECONDS', 300)  # 5分钟
+        self.min_interval_seconds = min_interval_seconds if min_interval_seconds is not None else getattr(Config, 'MIN_EMAIL_INTERVAL', 2)  # 最小间隔2秒
 
         # 记录状态
         self.hourly_count = 0
@@ -97,6 +97,23 @@ class RateLimiter:
 
             return True, None
 
+    def interval_remaining(self):
+        """距离满足最小发送间隔还需等待的秒数"""
+        with self.lock:
+            return max(0.0, self.min_interval_seconds - (time.time() - self.last_email_time))
+
+    def wait_for_interval(self):
+        """等待到满足最小发送间隔（平滑发送，而不是直接拒绝）"""
+        remaining = self.interval_remaining()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def quota_available(self):
+        """小时和日限额是否还有余量（不检查冷却和间隔）"""
+        with self.lock:
+            self._reset_if_needed()
+            return self.hourly_count < self.max_per_hour and self.daily_count < self.max_per_day
+
     def record_sent(self, recipient_email=None):
         """记录成功发送的邮件"""
         with self.lock:
@@ -162,11 +179,24 @@ _rate_limiter_lock = Lock()
 
 
 def get_rate_limiter():
-    """获取全局速率限制器实例"""
+    """
+    获取全局速率限制器实例
+
+    负责收件人冷却和全局总量；配置多个发件账号时总量为各账号之和，
+    每个账号另有自己的限制器（见 sender_pool.py）
+    """
     global _rate_limiter_instance
     with _rate_limiter_lock:
         if _rate_limiter_instance is None:
-            _rate_limiter_instance = RateLimiter()
+            accounts = Config.get_mail_accounts()
+            if len(accounts) > 1:
+                _rate_limiter_instance = RateLimiter(
+                    max_per_hour=sum(a['hourly_limit'] for a in accounts),
+                    max_per_day=sum(a['daily_limit'] for a in accounts),
+                    min_interval_seconds=0
+                )
+            else:
+                _rate_limiter_instance = RateLimiter()
         return _rate_limiter_instance
 
 
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+事件驱动的定时任务调度器
+用最小堆维护各任务的下次运行时间，只睡眠到最近一个任务到期，
+取代 schedule.run_pending() 每秒轮询的方式
+"""
+
+import heapq
+import random
+import time
+import traceback
+from datetime import datetime, timedelta
+from threading import Event, Lock
+
+
+# 错过运行的处理策略
+MISSED_CATCH_UP = 'catch_up'    # 逐次补跑所有错过的运行
+MISSED_SKIP = 'skip'            # 直接跳过错过的运行
+MISSED_COALESCE = 'coalesce'    # 多次错过合并为一次运行
+
+MISSED_POLICIES = (MISSED_CATCH_UP, MISSED_SKIP, MISSED_COALESCE)
+
+# 单次睡眠上限（秒），防止系统时钟被调整后长时间睡过头
+MAX_SLEEP_SECONDS = 3600
+
+# catch_up 策略单次最多补跑次数
+MAX_CATCH_UP_RUNS = 24
+
+
+class CronExpression:
+    """
+    简化版 cron 表达式
+
+    格式: "分 时 日 月 周"，支持 *、*/n、a-b、a-b/n 和逗号列表，
+    周字段 0 和 7 都表示周日；另支持 @hourly / @daily / @weekly / @monthly 别名
+    """
+
+    ALIASES = {
+        '@hourly': '0 * * * *',
+        '@daily': '0 0 * * *',
+        '@midnight': '0 0 * * *',
+        '@weekly': '0 0 * * 0',
+        '@monthly': '0 0 1 * *',
+        '@yearly': '0 0 1 1 *',
+    }
+
+    # (最小值, 最大值)
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        text = self.ALIASES.get(self.expr.lower(), self.expr)
+        fields = text.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式需要 5 个字段: {expr}")
+
+        parsed = [self._parse_field(f, lo, hi) for f, (lo, hi) in zip(fields, self.FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # cron 中 0 和 7 都是周日，统一转换为 Python 的 weekday()（周一=0）
+        self.weekdays = {(d - 1) % 7 for d in weekdays}
+        self.day_restricted = fields[2] != '*'
+        self.weekday_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field, lo, hi):
+        """解析单个字段，返回允许值集合"""
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_str = part.split('/', 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"cron 步长必须为正数: {field}")
+
+            if part == '*':
+                start, end = lo, hi
+            elif '-' in part:
+                start_str, end_str = part.split('-', 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = hi if step > 1 else start
+
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"cron 字段超出范围 [{lo}-{hi}]: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt):
+        """日期匹配（日与周同时受限时按 cron 惯例取并集）"""
+        day_ok = dt.day in self.days
+        weekday_ok = dt.weekday() in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        if self.day_restricted:
+            return day_ok
+        if self.weekday_restricted:
+            return weekday_ok
+        return True
+
+    def next_after(self, dt):
+        """返回严格晚于 dt 的下一个匹配时间（精确到分钟）"""
+        candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                # 跳到下个月 1 日 00:00
+                year = candidate.year + (candidate.month // 12)
+                month = candidate.month % 12 + 1
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+
+        raise ValueError(f"cron 表达式在 5 年内没有匹配时间: {self.expr}")
+
+    def __repr__(self):
+        return f"CronExpression({self.expr!r})"
+
+
+def daily_cron(hhmm):
+    """将 "HH:MM" 转换为每日 cron 表达式"""
+    hour, minute = hhmm.strip().split(':')
+    return CronExpression(f"{int(minute)} {int(hour)} * * *")
+
+
+class ScheduledJob:
+    """调度器中的单个任务及其运行统计"""
+
+    def __init__(self, name, func, cron=None, interval=None, jitter=0,
+                 missed_policy=MISSED_COALESCE, grace_seconds=300):
+        if (cron is None) == (interval is None):
+            raise ValueError("cron 和 interval 必须且只能指定一个")
+        if missed_policy not in MISSED_POLICIES:
+            raise ValueError(f"未知的错过运行策略: {missed_policy}")
+
+        self.name = name
+        self.func = func
+        self.cron = CronExpression(cron) if isinstance(cron, str) else cron
+        self.interval = interval
+        self.jitter = jitter
+        self.missed_policy = missed_policy
+        self.grace_seconds = grace_seconds
+
+        # 下次计划时间（未加抖动）与实际触发时间（加抖动后）
+        self.scheduled_at = None
+        self.next_run = None
+        # 已被 remove_job 移除
+        self.cancelled = False
+
+        # 运行统计
+        self.run_count = 0
+        self.error_count = 0
+        self.missed_count = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_duration = None
+        self.last_run = None
+        self.last_error = None
+
+    def compute_next(self, after):
+        """计算 after 之后的下一次计划时间"""
+        if self.cron is not None:
+            return self.cron.next_after(after)
+        return after + timedelta(seconds=self.interval)
+
+    def schedule_after(self, after):
+        """安排 after 之后的下一次运行（叠加随机抖动）"""
+        self.scheduled_at = self.compute_next(after)
+        offset = random.uniform(0, self.jitter) if self.jitter else 0
+        self.next_run = self.scheduled_at + timedelta(seconds=offset)
+        return self.next_run
+
+    def count_missed(self, now):
+        """统计从计划时间到 now 之间错过的运行次数（含计划时间本身）"""
+        count = 0
+        moment = self.scheduled_at
+        while moment <= now and count < MAX_CATCH_UP_RUNS:
+            count += 1
+            moment = self.compute_next(moment)
+        return count
+
+    def record_run(self, started, duration, error=None):
+        """记录一次运行结果"""
+        self.run_count += 1
+        self.last_run = started
+        self.last_duration = duration
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        if error is not None:
+            self.error_count += 1
+            self.last_error = str(error)
+
+    def get_stats(self):
+        """获取任务统计信息"""
+        return {
+            'name': self.name,
+            'schedule': self.cron.expr if self.cron is not None else f"every {self.interval}s",
+            'missed_policy': self.missed_policy,
+            'next_run': self.next_run.strftime('%Y-%m-%d %H:%M:%S') if self.next_run else None,
+            'last_run': self.last_run.strftime('%Y-%m-%d %H:%M:%S') if self.last_run else None,
+            'run_count': self.run_count,
+            'error_count': self.error_count,
+            'missed_count': self.missed_count,
+            'last_duration': round(self.last_duration, 3) if self.last_duration is not None else None,
+            'avg_duration': round(self.total_duration / self.run_count, 3) if self.run_count else None,
+            'max_duration': round(self.max_duration, 3),
+            'last_error': self.last_error,
+        }
+
+
+class Scheduler:
+    """
+    基于最小堆的调度器
+
+    功能:
+    - 睡眠到最近一个任务到期，无空闲轮询
+    - 支持 cron 表达式、固定间隔和随机抖动
+    - 错过运行策略: catch_up / skip / coalesce
+    - 记录每个任务的运行耗时
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._heap = []
+        self._seq = 0
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopped = False
+
+    def add_job(self, name, func, cron=None, interval=None, jitter=0,
+                missed_policy=MISSED_COALESCE, grace_seconds=300):
+        """
+        注册任务
+
+        Args:
+            name: 任务名称（唯一）
+            func: 无参可调用对象
+            cron: cron 表达式字符串或 CronExpression
+            interval: 固定间隔秒数（与 cron 二选一）
+            jitter: 随机抖动上限（秒）
+            missed_policy: 错过运行策略
+            grace_seconds: 迟到多少秒以内仍视为正常运行
+
+        Returns:
+            ScheduledJob: 任务对象
+        """
+        job = ScheduledJob(name, func, cron=cron, interval=interval, jitter=jitter,
+                           missed_policy=missed_policy, grace_seconds=grace_seconds)
+        with self._lock:
+            if name in self.jobs:
+                raise ValueError(f"任务已存在: {name}")
+            self.jobs[name] = job
+            job.schedule_after(datetime.now())
+            self._push(job)
+        # 唤醒主循环，重新计算睡眠时间
+        self._wakeup.set()
+        return job
+
+    def remove_job(self, name):
+        """移除任务（堆中的条目在弹出时惰性丢弃）"""
+        with self._lock:
+            job = self.jobs.pop(name, None)
+            if job is not None:
+                job.cancelled = True
+        return job is not None
+
+    def _push(self, job):
+        self._seq += 1
+        heapq.heappush(self._heap, (job.next_run, self._seq, job))
+
+    def _run_job(self, job):
+        """执行任务并记录耗时，异常不会中断调度器"""
+        started = datetime.now()
+        t0 = time.perf_counter()
+        error = None
+        try:
+            job.func()
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            error = e
+            print(f"⚠️ [调度] 任务 {job.name} 执行出错: {e}")
+            traceback.print_exc()
+        duration = time.perf_counter() - t0
+        job.record_run(started, duration, error)
+        print(f"⏱️ [调度] 任务 {job.name} 耗时 {duration:.3f}s")
+
+    def _dispatch(self, job, now):
+        """处理一个到期任务（按错过运行策略），并安排下一次运行"""
+        lateness = (now - job.next_run).total_seconds()
+
+        if lateness <= job.grace_seconds:
+            runs = 1
+        else:
+            missed = job.count_missed(now)
+            job.missed_count += missed
+            if job.missed_policy == MISSED_SKIP:
+                runs = 0
+            elif job.missed_policy == MISSED_CATCH_UP:
+                runs = missed
+            else:
+                runs = 1
+            print(f"⚠️ [调度] 任务 {job.name} 错过 {missed} 次运行（迟到 {int(lateness)}s），"
+                  f"策略 {job.missed_policy}，执行 {runs} 次")
+
+        for _ in range(runs):
+            self._run_job(job)
+
+        # 以当前时间为基准安排下一次，避免连续补跑
+        with self._lock:
+            if job.cancelled:
+                return
+            job.schedule_after(max(datetime.now(), job.scheduled_at))
+            self._push(job)
+
+    def run_pending(self):
+        """执行所有已到期的任务，返回距下一个任务的秒数（无任务时为 None）"""
+        while True:
+            with self._lock:
+                if not self._heap:
+                    return None
+                next_run, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                now = datetime.now()
+                if next_run > now:
+                    return (next_run - now).total_seconds()
+                heapq.heappop(self._heap)
+            self._dispatch(job, now)
+
+    def run_forever(self):
+        """主循环：睡眠到下一个任务到期，直到 stop() 被调用"""
+        self._stopped = False
+        while not self._stopped:
+            delay = self.run_pending()
+            timeout = MAX_SLEEP_SECONDS if delay is None else min(delay, MAX_SLEEP_SECONDS)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def stop(self):
+        """停止主循环"""
+        self._stopped = True
+        self._wakeup.set()
+
+    def next_run_time(self):
+        """最近一个任务的触发时间"""
+        with self._lock:
+            pending = [entry[0] for entry in self._heap if not entry[2].cancelled]
+            return min(pending) if pending else None
+
+    def get_stats(self):
+        """获取所有任务的统计信息"""
+        with self._lock:
+            return [job.get_stats() for job in self.jobs.values()]
+
+
+# 测试代码
+if __name__ == "__main__":
+    now = datetime.now()
+    for expr in ['@daily', '*/15 9-18 * * 1-5', '0 2 * * 0', '30 9 29 2 *']:
+        cron = CronExpression(expr)
+        print(f"{expr:<22} -> {cron.next_after(now)}")
+
+    scheduler = Scheduler()
+    scheduler.add_job('tick', lambda: print("tick"), interval=1, jitter=0.2)
+    print("下次运行:", scheduler.next_run_time())
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+发件账号池
+每个账号有独立的配额、速率限制、熔断器和 SMTP 连接池；
+按"今日发送最少优先"分配，账号被限流或封禁时自动切换到下一个账号
+"""
+
+import time
+from threading import Lock
+from config import Config
+from rate_limiter import RateLimiter
+from circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN
+from smtp_transport import SMTPSession
+
+
+class SenderAccount:
+    """单个发件账号"""
+
+    def __init__(self, user, auth_code, server, port, daily_limit, hourly_limit):
+        self.user = user
+        self.auth_code = auth_code
+        self.server = server
+        self.port = port
+
+        # 每个账号独立计数；收件人冷却由全局限制器负责，这里不重复检查
+        self.limiter = RateLimiter(
+            max_per_hour=hourly_limit,
+            max_per_day=daily_limit,
+            cooldown_seconds=0
+        )
+        self.breaker = CircuitBreaker(name=user)
+
+        # 空闲 SMTP 会话（连接池）
+        self._idle_sessions = []
+        self._lock = Lock()
+        self.finished_sessions = []
+
+    def acquire_session(self):
+        """取出一个空闲会话，没有则新建（首次发送时才连接）"""
+        with self._lock:
+            if self._idle_sessions:
+                return self._idle_sessions.pop()
+        return SMTPSession(
+            server=self.server,
+            port=self.port,
+            user=self.user,
+            password=self.auth_code
+        )
+
+    def release_session(self, session, broken=False):
+        """归还会话；连接已损坏或池已满时关闭"""
+        with self._lock:
+            if not broken and len(self._idle_sessions) < Config.SMTP_POOL_SIZE:
+                self._idle_sessions.append(session)
+                return
+        self._finish(session)
+
+    def _finish(self, session):
+        session.close()
+        stats = session.get_stats()
+        if stats['messages'] or stats['failed']:
+            stats['account'] = self.user
+            with self._lock:
+                self.finished_sessions.append(stats)
+
+    def close_sessions(self):
+        """关闭所有空闲会话，返回本批次各会话的吞吐量统计"""
+        with self._lock:
+            sessions, self._idle_sessions = self._idle_sessions, []
+        for session in sessions:
+            self._finish(session)
+        with self._lock:
+            finished, self.finished_sessions = self.finished_sessions, []
+        return finished
+
+    def get_stats(self):
+        """获取账号状态"""
+        limiter_stats = self.limiter.get_stats()
+        return {
+            'user': self.user,
+            'server': f"{self.server}:{self.port}",
+            'daily_sent': limiter_stats['daily_sent'],
+            'daily_limit': limiter_stats['daily_limit'],
+            'hourly_sent': limiter_stats['hourly_sent'],
+            'hourly_limit': limiter_stats['hourly_limit'],
+            'idle_sessions': len(self._idle_sessions),
+            'circuit_breaker': self.breaker.get_stats(),
+        }
+
+
+class SenderPool:
+    """发件账号池"""
+
+    def __init__(self, accounts=None):
+        accounts = accounts if accounts is not None else Config.get_mail_accounts()
+        self.accounts = [SenderAccount(**account) for account in accounts]
+        self._lock = Lock()
+
+    def acquire(self, exclude=()):
+        """
+        选择一个可用账号（今日发送最少优先）
+
+        只因最小发送间隔暂不可用时会等待，而不是直接拒绝
+
+        Args:
+            exclude: 本次发送已失败过的账号
+
+        Returns:
+            (account, reason): 无可用账号时 account 为 None，
+            reason 为 'circuit_open'（全部熔断）或 'quota'（全部达到限额）
+        """
+        while True:
+            with self._lock:
+                candidates = [a for a in self.accounts if a not in exclude]
+                if not candidates:
+                    return None, 'exhausted'
+
+                with_quota = [a for a in candidates if a.limiter.quota_available()]
+                if not with_quota:
+                    return None, 'quota'
+
+                ready = [a for a in with_quota if a.limiter.interval_remaining() == 0]
+                for account in sorted(ready, key=lambda a: a.limiter.daily_count):
+                    allowed, _ = account.breaker.allow_request()
+                    if allowed:
+                        return account, None
+
+                healthy = [a for a in with_quota if a.breaker.state == STATE_CLOSED]
+                if not healthy:
+                    return None, 'circuit_open'
+                wait = min(a.limiter.interval_remaining() for a in healthy)
+
+            # 正常账号都在最小间隔内，等待最早可用的那个
+            time.sleep(max(wait, 0.05))
+
+    def all_open(self):
+        """是否所有账号都处于熔断状态"""
+        return all(a.breaker.state == STATE_OPEN for a in self.accounts)
+
+    def close_sessions(self):
+        """关闭所有账号的空闲连接，返回各会话统计"""
+        stats = []
+        for account in self.accounts:
+            stats.extend(account.close_sessions())
+        return stats
+
+    def reset(self):
+        """重置所有账号的计数和熔断器（管理员功能）"""
+        for account in self.accounts:
+            account.limiter.reset()
+            account.breaker.reset()
+
+    def get_stats(self):
+        """获取账号池状态"""
+        accounts = [a.get_stats() for a in self.accounts]
+        return {
+            'accounts': accounts,
+            'daily_capacity': sum(a['daily_limit'] for a in accounts),
+            'daily_sent': sum(a['daily_sent'] for a in accounts),
+        }
+
+
+# 全局单例
+_sender_pool_instance = None
+_sender_pool_lock = Lock()
+
+
+def get_sender_pool():
+    """获取全局发件账号池"""
+    global _sender_pool_instance
+    with _sender_pool_lock:
+        if _sender_pool_instance is None:
+            _sender_pool_instance = SenderPool()
+        return _sender_pool_instance
+
+
+# 测试代码
+if __name__ == "__main__":
+    pool = get_sender_pool()
+    stats = pool.get_stats()
+    print(f"📮 发件账号 {len(stats['accounts'])} 个，每日总容量 {stats['daily_capacity']} 封")
+    for account in stats['accounts']:
+        print(f"   - {account['user']} ({account['server']}): "
+              f"{account['daily_sent']}/{account['daily_limit']}")
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+每年的发送位图
+第 N 位为 1 表示用户 ID 为 N 的用户该年已成功发送；100 万用户约 125KB，按年份存放在 sent_bitmaps 表中。
+
+扫描、补发和重试在发送前用它做 O(1) 的"今年已发送"判断；
+"某年漏发了谁"只需把用户 ID 与位图比对，不必扫描 send_logs。
+
+位图是 send_logs 的派生数据：
+- log_id 为已合并的最大日志 ID，每次取用前合并之后新增的成功日志（走主键区间）
+- 管理员修改 last_sent_year 时直接改写数据库中的位图并递增 version，
+  其他进程发现 version 变化后重新加载；保存时按 version 乐观并发，冲突则放弃本次保存
+"""
+
+import time
+from datetime import date
+from threading import Lock
+
+
+class SentBitmap:
+    """一年的发送位图"""
+
+    def __init__(self, year, bits=b'', log_id=0, version=0):
+        self.year = year
+        self.bits = bytearray(bits)
+        self.log_id = log_id          # 已合并的最大 send_logs.id
+        self.version = version        # 数据库中的版本号
+        self.dirty = False            # 有尚未保存的变更
+        self.loaded_at = time.time()
+
+    def __contains__(self, user_id):
+        byte = user_id >> 3
+        return byte < len(self.bits) and (self.bits[byte] >> (user_id & 7)) & 1 == 1
+
+    def add(self, user_id):
+        byte = user_id >> 3
+        if byte >= len(self.bits):
+            # 按 64KB 对齐扩容，避免逐个用户增长
+            self.bits.extend(bytes((byte // 65536 + 1) * 65536 - len(self.bits)))
+        mask = 1 << (user_id & 7)
+        if not self.bits[byte] & mask:
+            self.bits[byte] |= mask
+            self.dirty = True
+
+    def discard(self, user_id):
+        byte = user_id >> 3
+        mask = 1 << (user_id & 7)
+        if byte < len(self.bits) and self.bits[byte] & mask:
+            self.bits[byte] &= ~mask & 0xFF
+            self.dirty = True
+
+    # 以下向量化操作用到 NumPy 时才导入（只做成员判断的守护进程和命令行不需要它）
+
+    def _unpacked(self):
+        import numpy as np
+        return np.unpackbits(np.frombuffer(bytes(self.bits), dtype=np.uint8), bitorder='little')
+
+    def __len__(self):
+        return int(self._unpacked().sum())
+
+    def user_ids(self):
+        """已发送的用户 ID（升序数组）"""
+        import numpy as np
+        return np.flatnonzero(self._unpacked())
+
+    def contains_many(self, user_ids):
+        """一批用户 ID 的向量化成员判断，返回布尔数组"""
+        import numpy as np
+        ids = np.asarray(user_ids, dtype=np.int64)
+        unpacked = self._unpacked()
+        inside = ids < len(unpacked)
+        result = np.zeros(len(ids), dtype=bool)
+        result[inside] = unpacked[ids[inside]].astype(bool)
+        return result
+
+    def to_bytes(self):
+        """保存用：去掉末尾的空字节"""
+        return bytes(self.bits).rstrip(b'\0')
+
+
+# 本进程内加载过的位图 {年份: SentBitmap}
+_bitmaps = {}
+_bitmaps_lock = Lock()
+
+
+def get_sent_bitmap(db, year=None):
+    """
+    获取某年的发送位图（默认今年）
+
+    首次使用时从数据库加载（没有则由 users.last_sent_year 生成）；
+    之后每次只查一次版本号，并合并新增的成功发送日志
+    """
+    year = year or date.today().year
+    with _bitmaps_lock:
+        bitmap = _bitmaps.get(year)
+        if bitmap is None or db.get_sent_bitmap_version(year) != bitmap.version:
+            bitmap = _bitmaps[year] = db.load_sent_bitmap(year)
+        db.merge_sent_logs(bitmap)
+        return bitmap
+
+
+def save_sent_bitmaps(db):
+    """保存本进程内有变更的位图（任务结束时调用）"""
+    with _bitmaps_lock:
+        for year, bitmap in list(_bitmaps.items()):
+            if bitmap.dirty and not db.save_sent_bitmap(bitmap):
+                # 其他进程已改写，丢弃本地副本，下次重新加载后再合并日志
+                del _bitmaps[year]
+
+
+def notify_sent(user_ids, year):
+    """发送成功后更新本进程内已加载的位图（未加载时忽略，下次取用时从日志合并）"""
+    with _bitmaps_lock:
+        bitmap = _bitmaps.get(year)
+        if bitmap is not None:
+            for user_id in user_ids:
+                bitmap.add(user_id)
+
+
+def forget_sent_bitmaps():
+    """丢弃本进程内的位图（数据库中的位图被改写后）"""
+    with _bitmaps_lock:
+        _bitmaps.clear()
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+SMTP 传输层
+一个认证后的连接连续发送多封邮件；服务器声明 PIPELINING 时
+把 MAIL FROM / RCPT TO / DATA 合并为一次往返（RFC 2920），并统计会话吞吐量
+"""
+
+import re
+import smtplib
+import time
+from config import Config
+
+
+CRLF = "\r\n"
+
+
+def _prepare_data(msg):
+    """统一换行为 CRLF 并做点号转义（RFC 5321 4.5.2），返回 bytes"""
+    if isinstance(msg, bytes):
+        msg = msg.decode('ascii', 'surrogateescape')
+    msg = re.sub(r'(?:\r\n|\n|\r(?!\n))', CRLF, msg)
+    msg = re.sub(r'(?m)^\.', '..', msg)
+    if not msg.endswith(CRLF):
+        msg += CRLF
+    return (msg + "." + CRLF).encode('ascii', 'surrogateescape')
+
+
+class SessionStats:
+    """单个 SMTP 会话的吞吐量统计"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.connect_time = 0.0
+        self.messages = 0
+        self.failed = 0
+        self.bytes_sent = 0
+        self.round_trips = 0
+        # 命令 -> [次数, 等待应答总耗时]
+        self.commands = {}
+
+    def record_command(self, name, latency):
+        entry = self.commands.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += latency
+
+    def to_dict(self):
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        total_cmds = sum(c for c, _ in self.commands.values())
+        total_wait = sum(t for _, t in self.commands.values())
+        return {
+            'messages': self.messages,
+            'failed': self.failed,
+            'bytes_sent': self.bytes_sent,
+            'elapsed': round(elapsed, 3),
+            'connect_time': round(self.connect_time, 3),
+            'round_trips': self.round_trips,
+            'messages_per_sec': round(self.messages / elapsed, 2),
+            'bytes_per_sec': round(self.bytes_sent / elapsed, 1),
+            'avg_command_latency_ms': round(total_wait / total_cmds * 1000, 2) if total_cmds else None,
+            'command_latency_ms': {
+                name: round(t / c * 1000, 2) for name, (c, t) in self.commands.items()
+            },
+        }
+
+
+class SMTPSession:
+    """
+    可复用的 SMTP 会话
+
+    - 首次发送时才建立连接并登录
+    - 连续发送多封邮件，超过 max_messages 后自动重连
+    - 服务器支持 PIPELINING 时每封邮件只需两次往返
+    - 复用的空闲连接在发出正文之前被服务器断开时，重连后重试一次；
+      正文（含结尾的 "."）一旦写出就不再重试，服务器可能已经收下，重发会产生重复邮件
+    """
+
+    def __init__(self, server=None, port=None, user=None, password=None,
+                 use_ssl=None, timeout=None, pipelining=None, max_messages=None):
+        self.server = server or Config.MAIL_SERVER
+        self.port = port or Config.MAIL_PORT
+        self.user = user if user is not None else Config.MAIL_USER
+        self.password = password if password is not None else Config.MAIL_AUTH_CODE
+        self.use_ssl = Config.MAIL_USE_SSL if use_ssl is None else use_ssl
+        self.timeout = timeout or Config.SMTP_TIMEOUT
+        self.allow_pipelining = Config.SMTP_PIPELINING if pipelining is None else pipelining
+        self.max_messages = max_messages or Config.SMTP_MAX_MESSAGES_PER_SESSION
+
+        self.smtp = None
+        self.pipelining = False
+        self.session_messages = 0
+        self.body_sent = False      # 当前事务的正文是否已写出
+        self.stats = SessionStats()
+
+    # ========== 连接管理 ==========
+
+    def open(self):
+        """建立连接并登录"""
+        t0 = time.perf_counter()
+        if self.use_ssl:
+            self.smtp = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            self.smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        self.smtp.ehlo()
+        if not self.use_ssl and self.smtp.has_extn('starttls'):
+            self.smtp.starttls()
+            self.smtp.ehlo()
+        if self.user and self.password:
+            self.smtp.login(self.user, self.password)
+        self.stats.connect_time += time.perf_counter() - t0
+
+        self.pipelining = self.allow_pipelining and self.smtp.has_extn('pipelining')
+        self.session_messages = 0
+        return self
+
+    def close(self):
+        """发送 QUIT 并关闭连接"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        finally:
+            self.smtp = None
+
+    def _ensure_open(self):
+        if self.smtp is not None and self.session_messages >= self.max_messages:
+            # 很多服务商限制单连接可发送的邮件数
+            self.close()
+        if self.smtp is None:
+            self.open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ========== 发送 ==========
+
+    def send_message(self, from_addr, to_addrs, msg):
+        """
+        发送一封邮件
+
+        Args:
+            from_addr: 信封发件人
+            to_addrs: 收件人列表
+            msg: 邮件内容（str 或 bytes）
+
+        Returns:
+            dict: 被拒绝的收件人 {地址: (code, resp)}，与 smtplib.sendmail 一致
+
+        Raises:
+            smtplib.SMTPException: 发送失败
+        """
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        data = _prepare_data(msg)
+
+        for attempt in range(2):
+            self._ensure_open()
+            reused = self.session_messages > 0
+            self.body_sent = False
+            try:
+                if self.pipelining:
+                    refused = self._send_pipelined(from_addr, to_addrs, data)
+                else:
+                    refused = self._send_lockstep(from_addr, to_addrs, data)
+                break
+            except smtplib.SMTPServerDisconnected:
+                if self.smtp is not None:
+                    self.smtp.close()
+                    self.smtp = None
+                # 只有复用的空闲连接在正文写出前被关闭才重连重试
+                if attempt or not reused or self.body_sent:
+                    self.stats.failed += 1
+                    raise
+            except smtplib.SMTPException:
+                self.stats.failed += 1
+                self._reset()
+                raise
+
+        self.session_messages += 1
+        self.stats.messages += 1
+        self.stats.bytes_sent += len(data)
+        return refused
+
+    def send_many(self, messages):
+        """
+        在同一会话中发送多封邮件
+
+        Args:
+            messages: [(from_addr, to_addrs, msg), ...]
+
+        Returns:
+            list: 每封邮件的 (是否成功, 错误信息)
+        """
+        results = []
+        for from_addr, to_addrs, msg in messages:
+            try:
+                self.send_message(from_addr, to_addrs, msg)
+                results.append((True, None))
+            except smtplib.SMTPException as e:
+                results.append((False, str(e)))
+        return results
+
+    def _timed_reply(self, name, sent_at):
+        """读取一条应答，记录从写出命令到收到应答的延迟"""
+        code, resp = self.smtp.getreply()
+        self.stats.record_command(name, time.perf_counter() - sent_at)
+        return code, resp
+
+    def _send_lockstep(self, from_addr, to_addrs, data):
+        """逐条命令等待应答（服务器不支持 PIPELINING 时）"""
+        t0 = time.perf_counter()
+        self.smtp.putcmd("mail", "FROM:%s" % smtplib.quoteaddr(from_addr))
+        code, resp = self._timed_reply('MAIL', t0)
+        self.stats.round_trips += 1
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+
+        refused = {}
+        for addr in to_addrs:
+            t0 = time.perf_counter()
+            self.smtp.putcmd("rcpt", "TO:%s" % smtplib.quoteaddr(addr))
+            code, resp = self._timed_reply('RCPT', t0)
+            self.stats.round_trips += 1
+            if code not in (250, 251):
+                refused[addr] = (code, resp)
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        t0 = time.perf_counter()
+        self.smtp.putcmd("data")
+        code, resp = self._timed_reply('DATA', t0)
+        self.stats.round_trips += 1
+        if code != 354:
+            raise smtplib.SMTPDataError(code, resp)
+
+        return self._send_body(data, refused)
+
+    def _send_pipelined(self, from_addr, to_addrs, data):
+        """MAIL FROM、全部 RCPT TO 和 DATA 一次写出，再按顺序读取应答"""
+        commands = ["MAIL FROM:%s" % smtplib.quoteaddr(from_addr)]
+        commands += ["RCPT TO:%s" % smtplib.quoteaddr(addr) for addr in to_addrs]
+        commands.append("DATA")
+
+        t0 = time.perf_counter()
+        self.smtp.send(CRLF.join(commands) + CRLF)
+        self.stats.round_trips += 1
+
+        # 无论成败都必须读完每条命令的应答，保持会话同步
+        mail_code, mail_resp = self._timed_reply('MAIL', t0)
+        refused = {}
+        for addr in to_addrs:
+            code, resp = self._timed_reply('RCPT', t0)
+            if code not in (250, 251):
+                refused[addr] = (code, resp)
+        data_code, data_resp = self._timed_reply('DATA', t0)
+
+        if data_code == 354 and (mail_code != 250 or len(refused) == len(to_addrs)):
+            # 服务器仍接受 DATA 时需发送空正文结束事务
+            self.smtp.send("." + CRLF)
+            self.smtp.getreply()
+
+        if mail_code != 250:
+            raise smtplib.SMTPSenderRefused(mail_code, mail_resp, from_addr)
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if data_code != 354:
+            raise smtplib.SMTPDataError(data_code, data_resp)
+
+        return self._send_body(data, refused)
+
+    def _send_body(self, data, refused):
+        """发送正文并读取最终应答"""
+        t0 = time.perf_counter()
+        self.body_sent = True
+        self.smtp.send(data)
+        code, resp = self._timed_reply('END', t0)
+        self.stats.round_trips += 1
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
+    def _reset(self):
+        """失败后发送 RSET，连接异常则直接丢弃"""
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.rset()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+            self.smtp = None
+
+    def get_stats(self):
+        """获取会话吞吐量统计"""
+        stats = self.stats.to_dict()
+        stats['pipelining'] = self.pipelining
+        return stats
+
+
+# 测试代码
+if __name__ == "__main__":
+    session = SMTPSession()
+    try:
+        session.open()
+        print(f"✅ 已连接 {session.server}:{session.port}，PIPELINING: {session.pipelining}")
+    except Exception as e:
+        print(f"❌ 连接失败: {e}")
+    finally:
+        session.close()
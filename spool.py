@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+邮件落盘
+把渲染好的邮件批量写入 maildir 或 pickup 目录，由本机 MTA 负责投递和重试；
+每个文件写完即 fdatasync（只刷本文件，不像 os.sync 那样刷整机的脏页），整批改名后只 fsync 一次目录；
+数据落盘后才原子改名，MTA 永远看不到写了一半的文件
+"""
+
+import os
+import socket
+import time
+from itertools import count
+
+
+# 支持的目录格式
+FORMAT_MAILDIR = 'maildir'  # tmp/ 写入后改名到 new/
+FORMAT_PICKUP = 'pickup'    # 同目录下 .tmp 写入后改名为 .eml（IIS / Exchange 风格）
+
+# 写文件的缓冲区大小
+WRITE_BUFFER_SIZE = 256 * 1024
+
+
+class SpoolWriter:
+    """
+    批量写入邮件文件
+
+    一批邮件的流程：逐个写入临时文件并 fdatasync -> 逐个 rename -> fsync 目标目录
+    """
+
+    def __init__(self, path, fmt=FORMAT_MAILDIR, sync=True):
+        if fmt not in (FORMAT_MAILDIR, FORMAT_PICKUP):
+            raise ValueError(f"未知的落盘格式: {fmt}")
+        self.path = os.path.abspath(path)
+        self.fmt = fmt
+        self.sync = sync
+        self._seq = count(1)
+        self._host = socket.gethostname().replace('/', '\\057').replace(':', '\\072')
+
+        if fmt == FORMAT_MAILDIR:
+            self.tmp_dir = os.path.join(self.path, 'tmp')
+            self.final_dir = os.path.join(self.path, 'new')
+            for sub in ('tmp', 'new', 'cur'):
+                os.makedirs(os.path.join(self.path, sub), exist_ok=True)
+        else:
+            self.tmp_dir = self.final_dir = self.path
+            os.makedirs(self.path, exist_ok=True)
+
+        # 统计信息
+        self.messages = 0
+        self.bytes_written = 0
+        self.batches = 0
+        self.sync_time = 0.0
+
+    def _new_id(self):
+        """生成唯一文件名（maildir 约定: 时间.M微秒P进程Q序号.主机）"""
+        now = time.time()
+        return f"{int(now)}.M{int(now % 1 * 1e6)}P{os.getpid()}Q{next(self._seq)}.{self._host}"
+
+    def _final_name(self, spool_id):
+        return spool_id if self.fmt == FORMAT_MAILDIR else spool_id + '.eml'
+
+    def _tmp_name(self, spool_id):
+        return spool_id if self.fmt == FORMAT_MAILDIR else '.' + spool_id + '.tmp'
+
+    def write_batch(self, messages):
+        """
+        写入一批邮件
+
+        Args:
+            messages: 邮件内容列表（bytes 或 str）
+
+        Returns:
+            list: 每封邮件的 spool id（与 messages 顺序一致）
+        """
+        ids = []
+        written = []
+        try:
+            for msg in messages:
+                if isinstance(msg, str):
+                    msg = msg.encode('utf-8')
+                spool_id = self._new_id()
+                tmp_path = os.path.join(self.tmp_dir, self._tmp_name(spool_id))
+                with open(tmp_path, 'xb', buffering=WRITE_BUFFER_SIZE) as f:
+                    written.append((spool_id, tmp_path))
+                    f.write(msg)
+                    # 关闭前让本文件的数据落盘
+                    self._sync_file(f)
+                self.bytes_written += len(msg)
+
+            # 整批数据落盘后再改名
+            for spool_id, tmp_path in written:
+                os.rename(tmp_path, os.path.join(self.final_dir, self._final_name(spool_id)))
+                ids.append(spool_id)
+        except BaseException:
+            # 未改名的临时文件不会被 MTA 取走，直接清理
+            for spool_id, tmp_path in written[len(ids):]:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            raise
+        finally:
+            if ids:
+                t0 = time.perf_counter()
+                self._sync_dir(self.final_dir)
+                self.sync_time += time.perf_counter() - t0
+
+        self.messages += len(ids)
+        self.batches += 1
+        return ids
+
+    def _sync_file(self, f):
+        """让一个文件的数据落盘（有 fdatasync 时不必等待 mtime 等元数据）"""
+        if not self.sync:
+            return
+        t0 = time.perf_counter()
+        f.flush()
+        getattr(os, 'fdatasync', os.fsync)(f.fileno())
+        self.sync_time += time.perf_counter() - t0
+
+    def _sync_dir(self, path):
+        """fsync 目录，保证改名本身落盘（Windows 不支持，跳过）"""
+        if not self.sync or not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def get_stats(self):
+        """获取写入统计"""
+        return {
+            'path': self.path,
+            'format': self.fmt,
+            'messages': self.messages,
+            'batches': self.batches,
+            'bytes_written': self.bytes_written,
+            'sync_time': round(self.sync_time, 3),
+        }
+
+
+# 测试代码
+if __name__ == "__main__":
+    import tempfile
+    writer = SpoolWriter(tempfile.mkdtemp())
+    ids = writer.write_batch([b"Subject: test\r\n\r\nhello\r\n"] * 3)
+    print(f"✅ 已写入 {len(ids)} 封: {writer.get_stats()}")
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+传输层本地自检
+在本机起模拟的 SMTP 服务器（声明 PIPELINING）和 HTTP 批量接口，检查 smtp_transport / transports
+的几条关键路径，不连接任何真实的邮件服务：
+
+- PIPELINING 下全部收件人被拒：以空正文结束事务，会话仍可继续发送
+- 复用的空闲连接在写出正文前被服务器断开：重连后重试一次，服务器只收到一封
+- 正文写出后、应答前连接被断开：直接报错，不重发
+- HTTP 批量接口按条返回结果：每封邮件的成败和消息 ID 与请求顺序一致
+- HTTP 429 带 Retry-After：等待后重试一次；连续 5xx：整批失败
+
+用法: python transport_check.py
+"""
+
+import json
+import smtplib
+import socketserver
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from smtp_transport import SMTPSession
+from transports import HTTPBatchTransport
+
+
+# ========== 模拟 SMTP 服务器 ==========
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    最小的 SMTP 服务端：EHLO 声明 PIPELINING，地址中含 refuse 的收件人返回 550；
+    server.drop 控制断开时机：'mail'（下一条 MAIL FROM 时断开，模拟空闲超时）、
+    'dot'（收到正文结尾的 "." 后不应答直接断开），触发一次后清除
+    """
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode('ascii', 'replace').rstrip("\r\n")
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply("250-stand-in")
+                self.reply("250-PIPELINING")
+                self.reply("250 8BITMIME")
+            elif command == 'MAIL':
+                if server.drop == 'mail':
+                    server.drop = None
+                    return
+                recipients = []
+                self.reply("250 OK")
+            elif command == 'RCPT':
+                if 'refuse' in line:
+                    self.reply("550 no such user")
+                else:
+                    recipients.append(line)
+                    self.reply("250 OK")
+            elif command == 'DATA':
+                # 与部分服务器一样，PIPELINING 下没有有效收件人也先回 354
+                self.reply("354 go ahead")
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                    body.append(data)
+                if not recipients:
+                    self.reply("554 no valid recipients")
+                    continue
+                server.received.append(b"".join(body))
+                if server.drop == 'dot':
+                    server.drop = None
+                    return
+                self.reply("250 queued")
+            elif command in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif command == 'QUIT':
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.received = []
+        self.connections = 0
+        self.drop = None
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def _session(server):
+    return SMTPSession('127.0.0.1', server.port, user='', password='', use_ssl=False,
+                       timeout=5, pipelining=True, max_messages=100)
+
+
+# ========== 模拟 HTTP 批量接口 ==========
+
+class StandInAPIHandler(BaseHTTPRequestHandler):
+    """
+    POST 一批邮件，按顺序返回 results：收件人地址含 reject 的返回 error；
+    server.failures 为接下来要返回的错误状态码列表（429 附带 Retry-After: 1）
+    """
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.requests.append((time.time(), self.headers.get('Authorization'), payload))
+        if server.failures:
+            code = server.failures.pop(0)
+            self.send_response(code)
+            if code == 429:
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        results = []
+        for i, message in enumerate(payload['messages']):
+            address = message['to'][0]['email']
+            if 'reject' in address:
+                results.append({'status': 'error', 'error': f"rejected {address}"})
+            else:
+                results.append({'status': 'ok', 'id': f"msg-{len(server.requests)}-{i}"})
+        body = json.dumps({'results': results}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInAPIHandler)
+        self.requests = []
+        self.failures = []
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/send"
+
+
+def _http_transport(server):
+    return HTTPBatchTransport(url=server.url, api_key='check-key', batch_size=10, concurrency=1, timeout=5)
+
+
+def _http_items(*emails):
+    return [{'email': email, 'name': f"用户{i}", 'wish': "生日快乐"} for i, email in enumerate(emails)]
+
+
+# ========== 检查项 ==========
+
+def check_refused_recipients(server):
+    """全部收件人被拒：抛出 SMTPRecipientsRefused，空正文结束事务后同一连接还能继续发送"""
+    with _session(server) as session:
+        try:
+            session.send_message('from@example.com', ['refuse-a@example.com', 'refuse-b@example.com'], 'x')
+            return "全部收件人被拒时没有报错"
+        except smtplib.SMTPRecipientsRefused:
+            pass
+        if not session.pipelining:
+            return "没有启用 PIPELINING"
+        refused = session.send_message('from@example.com', ['ok@example.com', 'refuse@example.com'], 'hello')
+        if list(refused) != ['refuse@example.com'] or len(server.received) != 1:
+            return f"部分被拒的结果不对: {refused}，服务器收到 {len(server.received)} 封"
+        if server.connections != 1:
+            return f"会话没有保持同步，重连了 {server.connections - 1} 次"
+
+
+def check_idle_disconnect(server):
+    """复用的空闲连接在 MAIL FROM 时被断开：重连后重试一次，服务器只收到一封"""
+    with _session(server) as session:
+        session.send_message('from@example.com', ['ok@example.com'], 'first')
+        server.drop = 'mail'
+        session.send_message('from@example.com', ['ok@example.com'], 'second')
+    if len(server.received) != 2 or server.connections != 2:
+        return f"服务器收到 {len(server.received)} 封、{server.connections} 个连接（应为 2 封、2 个连接）"
+
+
+def check_disconnect_after_body(server):
+    """正文写出后连接被断开：报错且不重发"""
+    with _session(server) as session:
+        session.send_message('from@example.com', ['ok@example.com'], 'first')
+        server.drop = 'dot'
+        try:
+            session.send_message('from@example.com', ['ok@example.com'], 'second')
+            return "断开后报告了发送成功"
+        except smtplib.SMTPServerDisconnected:
+            pass
+    if len(server.received) != 2:
+        return f"服务器收到 {len(server.received)} 封（应为 2 封，第二封不得重发）"
+
+
+def check_http_results(server):
+    """按条结果：成败和消息 ID 与请求顺序一致"""
+    results = _http_transport(server).send_many(_http_items('a@example.com', 'reject@example.com', 'c@example.com'))
+    expected = [(True, None, 'msg-1-0'), (False, 'rejected reject@example.com', None), (True, None, 'msg-1-2')]
+    if results != expected:
+        return f"结果不对: {results}"
+    _, authorization, payload = server.requests[0]
+    if authorization != 'Bearer check-key' or len(payload['messages']) != 3:
+        return f"请求不对: Authorization={authorization}，{len(payload['messages'])} 封"
+
+
+def check_http_retry_after(server):
+    """429 + Retry-After: 1：等待后重试一次并成功"""
+    server.failures = [429]
+    results = _http_transport(server).send_many(_http_items('a@example.com'))
+    if results != [(True, None, 'msg-2-0')] or len(server.requests) != 2:
+        return f"结果 {results}，请求 {len(server.requests)} 次（应为重试后成功、2 次）"
+    if server.requests[1][0] - server.requests[0][0] < 0.9:
+        return "没有按 Retry-After 等待"
+
+
+def check_http_server_error(server):
+    """连续 5xx：只重试一次，整批标记失败"""
+    server.failures = [503, 503]
+    results = _http_transport(server).send_many(_http_items('a@example.com', 'b@example.com'))
+    if len(server.requests) != 2 or any(ok for ok, _, _ in results) or '503' not in (results[0][1] or ''):
+        return f"结果 {results}，请求 {len(server.requests)} 次（应为 2 次后整批失败）"
+
+
+CHECKS = [
+    ('PIPELINING 全部收件人被拒', StandInSMTPServer, check_refused_recipients),
+    ('空闲连接断开后重试', StandInSMTPServer, check_idle_disconnect),
+    ('正文写出后断开不重发', StandInSMTPServer, check_disconnect_after_body),
+    ('HTTP 批量按条结果', StandInAPIServer, check_http_results),
+    ('HTTP 429 按 Retry-After 重试', StandInAPIServer, check_http_retry_after),
+    ('HTTP 连续 5xx 整批失败', StandInAPIServer, check_http_server_error),
+]
+
+
+def main():
+    failed = 0
+    for title, server_class, check in CHECKS:
+        server = server_class()
+        try:
+            error = check(server)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            server.shutdown()
+            server.server_close()
+        if error:
+            failed += 1
+            print(f"❌ {title}: {error}")
+        else:
+            print(f"✅ {title}")
+    print(f"\n{len(CHECKS) - failed}/{len(CHECKS)} 项通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
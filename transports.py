@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+邮件投递传输层
+统一的 send_many() 接口，可选 SMTP、HTTP 批量 API 和本地 maildir/pickup/mbox 投递；
+每种传输声明自己的单批邮件数和并发批次数，由 deliver() 按提示分批发送
+"""
+
+import json
+import mailbox
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from config import Config
+from email_service import (send_birthday_email, build_birthday_message, build_html_email,
+                           build_text_email, close_sender_sessions)
+from spool import SpoolWriter, FORMAT_MAILDIR, FORMAT_PICKUP
+
+
+class BaseTransport:
+    """
+    传输接口
+
+    send_many() 接收邮件列表 [{email, name, wish, ...}, ...]，
+    按相同顺序返回 [(是否成功, 错误信息, 消息ID), ...]
+    """
+
+    name = 'base'
+    # 单次 send_many() 建议的邮件数
+    batch_size = 1
+    # 建议同时进行的批次数
+    concurrency = 1
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stats = {'batches': 0, 'messages': 0, 'failed': 0}
+        self._stats_lock = Lock()
+
+    def send_many(self, messages):
+        raise NotImplementedError
+
+    def _record(self, results):
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            for ok, _, _ in results:
+                self.stats['messages' if ok else 'failed'] += 1
+
+    def close(self):
+        """结束本轮投递，返回吞吐量统计列表"""
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        stats = dict(self.stats, transport=self.name, elapsed=round(elapsed, 3),
+                     messages_per_sec=round(self.stats['messages'] / elapsed, 2))
+        self.started_at = time.time()
+        self.stats = {'batches': 0, 'messages': 0, 'failed': 0}
+        return [stats]
+
+
+class SMTPTransport(BaseTransport):
+    """
+    SMTP 投递（发件账号池 + 连接复用 + PIPELINING）
+
+    速率限制和熔断按账号生效，逐封发送；单批大小与单连接邮件数一致
+    """
+
+    name = 'smtp'
+    concurrency = 1
+
+    def __init__(self):
+        super().__init__()
+        self.batch_size = Config.SMTP_MAX_MESSAGES_PER_SESSION
+
+    def send_many(self, messages):
+        results = []
+        for item in messages:
+            defer_meta = {'user': item['user'], 'year': item.get('year')} if 'user' in item else None
+            is_sent, error_msg = send_birthday_email(
+                item['email'], item['name'], item['wish'], defer_meta=defer_meta
+            )
+            results.append((is_sent, error_msg, None))
+        self._record(results)
+        return results
+
+    def close(self):
+        return close_sender_sessions()
+
+
+class HTTPBatchTransport(BaseTransport):
+    """
+    通用 HTTP 批量 API 投递
+
+    一次 POST 携带整批个性化邮件：
+        {"from": {...}, "messages": [{"to": [{"email", "name"}], "subject", "text", "html"}, ...]}
+    响应中的 results 数组按顺序给出每封邮件的 status / id / error；
+    没有 results 时 2xx 视为整批已接收。429 / 5xx 按 Retry-After 重试一次
+    """
+
+    name = 'http'
+
+    def __init__(self, url=None, api_key=None, batch_size=None, concurrency=None, timeout=None):
+        super().__init__()
+        self.url = url or Config.HTTP_API_URL
+        self.api_key = api_key if api_key is not None else Config.HTTP_API_KEY
+        self.batch_size = batch_size or Config.HTTP_BATCH_SIZE
+        self.concurrency = concurrency or Config.HTTP_CONCURRENCY
+        self.timeout = timeout or Config.HTTP_TIMEOUT
+        self.stats.update(requests=0, bytes_sent=0)
+
+    def _build_payload(self, messages):
+        return {
+            'from': {'email': Config.MAIL_USER, 'name': Config.MAIL_FROM_NAME},
+            'messages': [
+                {
+                    'to': [{'email': item['email'], 'name': item['name']}],
+                    'subject': f"🎂 {item['name']}，生日快乐！",
+                    'text': build_text_email(item['name'], item['wish']),
+                    'html': build_html_email(item['name'], item['wish']),
+                }
+                for item in messages
+            ],
+        }
+
+    def _post(self, body):
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+
+        for attempt in range(2):
+            request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    raw = response.read()
+                    return json.loads(raw) if raw.strip() else {}
+            except urllib.error.HTTPError as e:
+                if attempt or (e.code != 429 and e.code < 500):
+                    raise
+                retry_after = e.headers.get('Retry-After', '1')
+                time.sleep(min(float(retry_after) if retry_after.isdigit() else 1.0, 30.0))
+
+    def send_many(self, messages):
+        body = json.dumps(self._build_payload(messages), ensure_ascii=False).encode('utf-8')
+        try:
+            data = self._post(body)
+        except urllib.error.HTTPError as e:
+            results = [(False, f"HTTP 错误: {e.code} {e.reason}", None)] * len(messages)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            results = [(False, f"HTTP 请求失败: {e}", None)] * len(messages)
+        else:
+            entries = data.get('results') if isinstance(data, dict) else None
+            if isinstance(entries, list) and len(entries) == len(messages):
+                results = [
+                    (entry.get('status', 'ok') != 'error', entry.get('error'), entry.get('id'))
+                    for entry in entries
+                ]
+            else:
+                results = [(True, None, None)] * len(messages)
+
+        with self._stats_lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_sent'] += len(body)
+        self._record(results)
+        for item, (ok, error, _) in zip(messages, results):
+            if ok:
+                print(f"✅ [发送成功] {item['name']} -> {item['email']} (HTTP)")
+            else:
+                print(f"❌ [发送失败] {item['email']} - {error}")
+        return results
+
+
+class SpoolTransport(BaseTransport):
+    """
+    本地落盘投递，由本机 MTA 或其他程序接手发送
+
+    maildir / pickup 整批写入临时文件、fsync 一次后原子改名（见 spool.py）；
+    mbox 每批加锁追加后刷新一次
+    """
+
+    def __init__(self, path=None, fmt=FORMAT_MAILDIR, batch_size=None):
+        super().__init__()
+        self.name = fmt
+        self.path = path or Config.SPOOL_PATH
+        self.batch_size = batch_size or Config.SPOOL_BATCH_SIZE
+        if fmt == 'mbox':
+            self.box = mailbox.mbox(self.path)
+            self.writer = None
+        else:
+            self.box = None
+            self.writer = SpoolWriter(self.path, fmt)
+        self._lock = Lock()
+
+    def send_many(self, messages):
+        rendered = [
+            build_birthday_message(item['email'], item['name'], item['wish']).as_bytes()
+            for item in messages
+        ]
+        with self._lock:
+            try:
+                if self.writer is not None:
+                    ids = self.writer.write_batch(rendered)
+                else:
+                    ids = self._append_mbox(rendered)
+                results = [(True, None, str(spool_id)) for spool_id in ids]
+            except OSError as e:
+                results = [(False, f"写入失败: {e}", None)] * len(messages)
+        self._record(results)
+        print(f"📥 [{self.name}] 已写入 {sum(1 for ok, _, _ in results if ok)} 封 -> {self.path}")
+        return results
+
+    def _append_mbox(self, rendered):
+        self.box.lock()
+        try:
+            ids = [self.box.add(msg) for msg in rendered]
+            self.box.flush()
+        finally:
+            self.box.unlock()
+        return ids
+
+
+TRANSPORTS = {
+    'smtp': SMTPTransport,
+    'http': HTTPBatchTransport,
+    'maildir': lambda: SpoolTransport(fmt=FORMAT_MAILDIR),
+    'pickup': lambda: SpoolTransport(fmt=FORMAT_PICKUP),
+    'mbox': lambda: SpoolTransport(fmt='mbox'),
+}
+
+
+def create_transport(name=None):
+    """按名称创建传输（默认 MAIL_TRANSPORT）"""
+    name = (name or Config.MAIL_TRANSPORT).lower()
+    if name not in TRANSPORTS:
+        raise ValueError(f"未知的邮件传输: {name}（可选: {', '.join(TRANSPORTS)}）")
+    return TRANSPORTS[name]()
+
+
+# 全局单例
+_transport_instance = None
+_transport_lock = Lock()
+
+
+def get_transport():
+    """获取全局邮件传输"""
+    global _transport_instance
+    with _transport_lock:
+        if _transport_instance is None:
+            _transport_instance = create_transport()
+        return _transport_instance
+
+
+def deliver(messages, transport=None):
+    """
+    按传输的 batch_size / concurrency 分批投递
+
+    Args:
+        messages: 邮件列表 [{email, name, wish, ...}, ...]
+        transport: 传输实例（默认全局传输）
+
+    Returns:
+        list: 与 messages 顺序一致的 [(是否成功, 错误信息, 消息ID), ...]
+    """
+    transport = transport or get_transport()
+    size = max(1, transport.batch_size)
+    batches = [messages[i:i + size] for i in range(0, len(messages), size)]
+
+    if transport.concurrency > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=transport.concurrency) as executor:
+            batch_results = list(executor.map(transport.send_many, batches))
+    else:
+        batch_results = [transport.send_many(batch) for batch in batches]
+
+    return [result for results in batch_results for result in results]
+
+
+# 测试代码
+if __name__ == "__main__":
+    transport = get_transport()
+    print(f"📮 当前传输: {transport.name}，单批 {transport.batch_size} 封，并发 {transport.concurrency}")
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Web 批量导入任务
+上传的 CSV 先保存到临时文件，提交到后台任务队列（job_queue.py），由工作线程边读边解码、每 IMPORT_CHUNK_SIZE 行校验后
+用一条多行 INSERT 写入；进度和错误通过 /api/import-jobs/<id> 查询（id 为后台任务 ID）。
+
+任务状态只由后台任务队列记录（background_jobs），导入明细（文件名、错误行等）作为任务结果汇报；
+每批和检查点一起提交到 import_jobs，查询时计数以检查点为准，导入中断后重新上传同一文件会从检查点继续
+"""
+
+import csv
+import os
+import time
+from config import Config
+from db_manager import DBManager
+from job_queue import get_job, submit_job
+from import_users import (REQUIRED_COLUMNS, CountingLines, begin_import_job, detect_encoding,
+                          prepare_rows)
+
+
+# 每个任务最多保留的错误明细条数
+MAX_ERRORS = 100
+
+class ImportJob:
+    """一次后台导入（record 为 import_jobs 中的检查点）"""
+
+    def __init__(self, path, filename, update_existing=False, chunk_size=None):
+        self.path = path
+        self.filename = filename
+        self.update_existing = update_existing
+        self.chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+
+        self.id = None            # import_jobs 中的任务 ID（开始执行后登记）
+        self.record = None
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.chunks = 0
+        self.errors = []
+        self.queue_job = None     # 执行本次导入的后台任务（汇报进度用）
+
+    def _begin(self):
+        """登记导入；同一文件有失败或已中断的导入时接管它的检查点继续"""
+        record = begin_import_job(self.path, self.update_existing, source='web', file_name=self.filename)
+        self.id = str(record['id'])
+        self.record = record
+        self.bytes_read = record['byte_offset']
+        self.rows = record['rows_done']
+        self.inserted = record['inserted']
+        self.duplicates = record['skipped']
+        self.invalid = record['invalid']
+        self.chunks = record['chunks']
+
+    def _add_errors(self, errors):
+        self.invalid += len(errors)
+        for i, message in errors[:max(0, MAX_ERRORS - len(self.errors))]:
+            # 行号：表头占第 1 行
+            self.errors.append(f"第 {self.rows + i + 2} 行: {message}")
+
+    def run(self, queue_job):
+        """后台任务：执行导入，失败时抛出异常，返回导入明细（文件导入完成后删除）"""
+        self.queue_job = queue_job
+        try:
+            # 哈希整份文件、登记检查点也在后台线程中进行，上传请求不必等待
+            self._report()
+            self._begin()
+            self._report()
+            return self._import()
+        finally:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _import(self):
+        db = DBManager()
+        try:
+            encoding = detect_encoding(self.path)
+            with open(self.path, 'rb') as raw:
+                header = [col.strip() for col in next(csv.reader([raw.readline().decode(encoding)]), [])]
+                missing = [col for col in REQUIRED_COLUMNS if col not in header]
+                if missing:
+                    raise ValueError(f"CSV 缺少必要列: {', '.join(missing)}")
+                indexes = [header.index(col) for col in REQUIRED_COLUMNS]
+
+                if self.bytes_read > raw.tell():
+                    raw.seek(self.bytes_read)
+                lines = CountingLines(raw, encoding)
+                reader = csv.reader(lines)
+                while True:
+                    rows = [row for _, row in zip(range(self.chunk_size), reader)]
+                    if not rows:
+                        break
+                    count, users, errors, duplicates = prepare_rows(rows, indexes)
+                    self._add_errors(errors)
+                    self.duplicates += duplicates
+                    self._write_chunk(db, users, count, lines.offset)
+            db.finish_import_job(self.id)
+            self.bytes_read = self.total_bytes
+            print(f"✅ [导入] {self.filename}: 新增 {self.inserted}，更新 {self.updated}，"
+                  f"重复 {self.duplicates}，错误 {self.invalid}")
+            return self.to_dict()
+        except Exception as e:
+            # 未提交的一批连同检查点一起回滚，重新上传同一文件时从上一个检查点继续
+            db.conn.rollback()
+            db.finish_import_job(self.id, 'failed', str(e)[:500])
+            print(f"❌ [导入] {self.filename} 失败: {e}")
+            self._report()
+            raise
+        finally:
+            db.close()
+
+    def _write_chunk(self, db, users, count, offset):
+        """一批：一次查询已存在的邮箱，一条多行 INSERT 写入，和检查点一起提交"""
+        chunk_started = time.time()
+        existing = db.find_existing_emails([user[1] for user in users]) if users else set()
+        if self.update_existing:
+            written = db.upsert_users(users, update_existing=True, commit=False) if users else 0
+            self.updated += len(existing)
+        else:
+            new_users = [user for user in users if user[1] not in existing]
+            written = db.upsert_users(new_users, commit=False) if new_users else 0
+            self.duplicates += len(existing)
+        self.inserted += len(users) - len(existing)
+        self.rows += count
+        self.chunks += 1
+        db.save_import_checkpoint(self.id, self.chunks, offset, self.rows, count, written,
+                                  time.time() - chunk_started, self.inserted, self.duplicates, self.invalid)
+        self.bytes_read = offset
+        self._report()
+
+    def _report(self):
+        self.queue_job.report(self.bytes_read / self.total_bytes * 100 if self.total_bytes else None,
+                              f"已处理 {self.rows} 行", result=self.to_dict())
+
+    def to_dict(self):
+        """导入明细（作为后台任务的结果汇报）"""
+        return {
+            'import_id': self.id,
+            'filename': self.filename,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'chunks': self.chunks,
+            'errors': list(self.errors),
+        }
+
+
+def start_import_job(path, filename, update_existing=False):
+    """提交后台导入，立即返回后台任务"""
+    job = ImportJob(path, filename, update_existing)
+    return submit_job('import', job.run)
+
+
+def get_import_job(job_id):
+    """
+    按后台任务 ID 查找导入任务的进度（dict），不存在返回 None
+
+    状态、进度和耗时取自后台任务（本进程或 background_jobs），导入明细取自任务结果；
+    导入进行中时行数等计数以 import_jobs 检查点为准（每批提交，比任务状态每秒一次的保存更新）
+    """
+    job = get_job(job_id)
+    if job is None or job['kind'] != 'import':
+        return None
+    detail = job['result'] or {}
+    info = {
+        'id': job['id'],
+        'filename': detail.get('filename'),
+        'status': job['status'],      # queued / running / done / failed
+        'progress': 100.0 if job['status'] == 'done' else job['progress'] or 0,
+        'rows': detail.get('rows', 0),
+        'inserted': detail.get('inserted', 0),
+        'updated': detail.get('updated', 0),
+        'duplicates': detail.get('duplicates', 0),
+        'invalid': detail.get('invalid', 0),
+        'chunks': detail.get('chunks', 0),
+        'errors': detail.get('errors', []),
+        'error': job['error'],
+        'elapsed': job['run_seconds'],
+    }
+    if job['status'] == 'running' and detail.get('import_id'):
+        with DBManager() as db:
+            record = db.get_import_job(int(detail['import_id']))
+        if record:
+            size = record['file_size']
+            info.update(progress=round(record['byte_offset'] / size * 100, 1) if size else info['progress'],
+                        rows=record['rows_done'], inserted=record['inserted'], duplicates=record['skipped'],
+                        invalid=record['invalid'], chunks=record['chunks'])
+    return info
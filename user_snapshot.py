@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+用户列式快照
+把 users 表按列保存在 NumPy 数组中（dob 为 datetime64[D]），
+年龄、距下一个生日天数、月日序号一次性向量化计算，排序用 argsort / lexsort；
+用户页面共享同一份快照，按 updated_at 增量刷新。
+导出（export_data.py）不经过快照，直接从数据库按 ID 流式读取：导出要求读到最新数据，且不必把全表留在内存里
+"""
+
+import time
+from datetime import date
+from threading import Lock
+import numpy as np
+from config import Config
+from birthday_calendar import parse_dob, doy_to_month_day, birthday_in_year, days_until_birthday
+
+
+# 闰年日历中每月 1 日之前的天数（下标为月份 - 1）
+_MONTH_OFFSETS = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+
+# 无法解析的生日排在最后
+_INVALID_DOY = 367
+_INVALID_DAYS = 366
+
+
+def _dates_to_column(values):
+    """生日列 -> datetime64[D] 数组；整列都是标准日期时一次向量化转换，否则逐个解析"""
+    try:
+        return np.array(values, dtype='M8[D]')
+    except (ValueError, TypeError):
+        parsed = [parse_dob(v) for v in values]
+        return np.array([d if d is not None else 'NaT' for d in parsed], dtype='M8[D]')
+
+
+def _day_tables(today):
+    """
+    按序号查表：(距下一个生日天数, 今年生日是否还没到)，下标为序号，367 为无效生日
+
+    只对 366 个序号做日期运算，每个用户的结果是一次数组取值
+    """
+    days_until = np.full(_INVALID_DOY + 1, _INVALID_DAYS, dtype=np.int64)
+    not_yet = np.zeros(_INVALID_DOY + 1, dtype=np.int64)
+    for doy in range(1, 367):
+        month, day = doy_to_month_day(doy)
+        not_yet[doy] = birthday_in_year(month, day, today.year) > today
+        days_until[doy] = days_until_birthday(date(2000, month, day), today)
+    return days_until, not_yet
+
+
+class SnapshotColumns:
+    """
+    一份完整的列（按 ID 升序）及派生列，创建后不再修改
+
+    刷新时构造新的一份、一次赋值整体替换，读取方只取一次引用，不会混用新旧两份不同长度的数组
+    """
+
+    __slots__ = ('ids', 'names', 'emails', 'dob', 'dob_raw', 'last_sent_year', 'birth_year', 'doy', 'name_rank')
+
+    def __init__(self, ids, names, emails, dob, dob_raw, last_sent):
+        order = np.argsort(ids, kind='stable')
+        self.ids, self.names, self.emails = ids[order], names[order], emails[order]
+        self.dob, self.dob_raw = dob[order], dob_raw[order]
+        self.last_sent_year = last_sent[order]   # 0 表示从未发送
+
+        # 派生列：出生年份、闰年日历序号、按姓名的名次（排序次关键字）
+        self.name_rank = np.empty(len(ids), dtype=np.int64)
+        self.name_rank[np.argsort(self.names.astype(str), kind='stable')] = np.arange(len(ids))
+
+        valid = ~np.isnat(self.dob)
+        safe_dob = np.where(valid, self.dob, np.datetime64('2000-01-01'))
+        years = safe_dob.astype('M8[Y]')
+        months = safe_dob.astype('M8[M]')
+        month_index = (months - years.astype('M8[M]')).astype(np.int64)
+        day = (safe_dob - months.astype('M8[D]')).astype(np.int64) + 1
+        self.birth_year = years.astype(np.int64) + 1970
+        self.doy = np.where(valid, _MONTH_OFFSETS[month_index] + day, _INVALID_DOY)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=object), np.empty(0, dtype=object),
+                   np.empty(0, dtype='M8[D]'), np.empty(0, dtype=object), np.empty(0, dtype=np.int32))
+
+    def base(self):
+        """基础列（与 UserSnapshot._columns 的返回值同序）"""
+        return self.ids, self.names, self.emails, self.dob, self.dob_raw, self.last_sent_year
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class UserSnapshot:
+    """users 表的列式快照（columns 为当前的一份 SnapshotColumns）"""
+
+    def __init__(self):
+        self.columns = SnapshotColumns.empty()
+        self.synced_at = None      # 数据库时钟，下次增量刷新的起点
+        self.refreshed_at = 0
+        self.dirty = True
+        self.lock = Lock()         # 串行化刷新；读取不加锁
+
+    # ========== 加载与刷新 ==========
+
+    @staticmethod
+    def _fetch(db, where="", params=()):
+        cursor = db.conn.cursor()
+        cursor.execute(f"SELECT id, name, email, dob, last_sent_year FROM users {where}", params)
+        rows = cursor.fetchall()
+        if rows and isinstance(rows[0], dict):
+            rows = [(r['id'], r['name'], r['email'], r['dob'], r['last_sent_year']) for r in rows]
+        return [tuple(r) for r in rows]
+
+    @staticmethod
+    def _db_now(db):
+        cursor = db.conn.cursor()
+        cursor.execute("SELECT CURRENT_TIMESTAMP AS now")
+        row = cursor.fetchone()
+        return row['now'] if isinstance(row, dict) else row[0]
+
+    @staticmethod
+    def _columns(rows):
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        names = np.empty(len(rows), dtype=object)
+        names[:] = [r[1] for r in rows]
+        emails = np.empty(len(rows), dtype=object)
+        emails[:] = [r[2] for r in rows]
+        dob_raw = np.empty(len(rows), dtype=object)
+        dob_raw[:] = [r[3] for r in rows]
+        dob = _dates_to_column([r[3] for r in rows])
+        last_sent = np.fromiter((r[4] or 0 for r in rows), dtype=np.int32, count=len(rows))
+        return ids, names, emails, dob, dob_raw, last_sent
+
+    def load(self, db):
+        """全量加载"""
+        synced_at = self._db_now(db)
+        columns = SnapshotColumns(*self._columns(self._fetch(db)))
+        with self.lock:
+            self.columns = columns
+            self.synced_at = synced_at
+            self.refreshed_at = time.time()
+            self.dirty = False
+
+    def refresh(self, db):
+        """
+        增量刷新：只取 updated_at 不早于上次同步时间或新插入的行；
+        行数对不上（有删除）时按 ID 列剔除已删除的用户
+        """
+        if self.synced_at is None:
+            return self.load(db)
+
+        with self.lock:
+            columns = self.columns
+            synced_at = self._db_now(db)
+            ph = "?" if db.db_type == "sqlite" else "%s"
+            max_id = int(columns.ids[-1]) if len(columns) else 0
+            rows = self._fetch(db, f"WHERE updated_at >= {ph} OR id > {ph}", (self.synced_at, max_id))
+            total = db._execute("SELECT COUNT(*) AS cnt FROM users", fetch=True)[0]['cnt']
+
+            if rows:
+                changed = self._columns(rows)
+                keep = ~np.isin(columns.ids, changed[0])
+                columns = SnapshotColumns(*[np.concatenate([old[keep], new])
+                                            for old, new in zip(columns.base(), changed)])
+
+            if len(columns) != total:
+                # 有用户被删除：只取 ID 列比对，仍对不上再全量加载
+                existing = db._execute("SELECT id FROM users", fetch=True)
+                existing = np.fromiter((row['id'] for row in existing), dtype=np.int64, count=len(existing))
+                keep = np.isin(columns.ids, existing)
+                columns = SnapshotColumns(*[column[keep] for column in columns.base()])
+            if len(columns) == total:
+                self.columns = columns
+                self.synced_at = synced_at
+                self.refreshed_at = time.time()
+                self.dirty = False
+                return
+        self.load(db)
+
+    def __len__(self):
+        return len(self.columns)
+
+    # ========== 向量化计算 ==========
+
+    def compute(self, today=None, columns=None):
+        """
+        一次计算所有用户的年龄、距下一个生日天数和月日序号
+
+        Returns:
+            dict: {'age', 'days_until_birthday', 'birthday_doy', 'valid'}，均为与 columns.ids 对齐的数组；
+                  'columns' 为计算所基于的那一份列，rows() 按它取值
+        """
+        today = today or date.today()
+        columns = self.columns if columns is None else columns
+        days_until, not_yet = _day_tables(today)
+        valid = columns.doy != _INVALID_DOY
+        return {
+            'age': np.where(valid, today.year - columns.birth_year - not_yet[columns.doy], 0),
+            'days_until_birthday': days_until[columns.doy],
+            'birthday_doy': columns.doy,
+            'valid': valid,
+            'columns': columns,
+        }
+
+    def select(self, sort_by='name', ids=None, today=None):
+        """
+        过滤并排序
+
+        Args:
+            sort_by: name / birthday / days
+            ids: 只保留这些用户 ID（如 DBManager.search_users 的结果），None 表示全部
+
+        Returns:
+            (indices, computed): 排好序的行下标和 compute() 的结果（下标对应 computed['columns']）
+        """
+        columns = self.columns
+        computed = self.compute(today, columns)
+        indices = np.arange(len(columns))
+
+        if ids is not None:
+            wanted = np.asarray(ids, dtype=np.int64)
+            positions = np.searchsorted(columns.ids, wanted)
+            positions = positions[positions < len(columns)]
+            # 快照尚未包含的新用户直接跳过
+            indices = positions[np.isin(columns.ids[positions], wanted)]
+
+        if sort_by == 'name':
+            keys = (columns.name_rank[indices],)
+        elif sort_by == 'birthday':
+            keys = (columns.name_rank[indices], computed['birthday_doy'][indices])
+        elif sort_by == 'days':
+            keys = (columns.name_rank[indices], computed['days_until_birthday'][indices])
+        else:
+            keys = None
+
+        if keys is not None:
+            indices = indices[np.lexsort(keys)]
+        return indices, computed
+
+    def rows(self, indices, computed):
+        """把选中的行转换为模板使用的字典（按 select() 时的那一份列取值）"""
+        columns = computed['columns']
+        dob_text = np.datetime_as_string(columns.dob[indices])
+        result = []
+        for i, text in zip(indices.tolist(), dob_text.tolist()):
+            valid = computed['valid'][i]
+            result.append({
+                'id': int(columns.ids[i]),
+                'name': columns.names[i],
+                'email': columns.emails[i],
+                'dob': columns.dob_raw[i],
+                'last_sent_year': int(columns.last_sent_year[i]) or None,
+                'age': int(computed['age'][i]),
+                'days_until_birthday': int(computed['days_until_birthday'][i]),
+                'dob_formatted': f"{text[:4]}年{text[5:7]}月{text[8:10]}日" if valid else columns.dob_raw[i],
+                'dob_short': text[5:10] if valid else columns.dob_raw[i],
+            })
+        return result
+
+
+# 全局单例（Web 进程内共享）
+_snapshot_instance = None
+_snapshot_lock = Lock()
+
+
+def get_user_snapshot(db):
+    """获取用户快照；本进程写入后或超过 SNAPSHOT_REFRESH_SECONDS 时增量刷新"""
+    global _snapshot_instance
+    with _snapshot_lock:
+        if _snapshot_instance is None:
+            _snapshot_instance = UserSnapshot()
+        snapshot = _snapshot_instance
+        if snapshot.dirty or time.time() - snapshot.refreshed_at > Config.SNAPSHOT_REFRESH_SECONDS:
+            snapshot.refresh(db)
+        return snapshot
+
+
+def mark_snapshot_dirty():
+    """用户数据变更后标记快照需要刷新"""
+    if _snapshot_instance is not None:
+        _snapshot_instance.dirty = True